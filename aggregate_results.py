@@ -0,0 +1,131 @@
+## This script aggregates the json outputs of many runs into a single columnar results table.
+## The output folders are scanned in parallel, every results file is scored (see compile_results.py), and all
+## queries are written to one Parquet dataset partitioned by source, prompting strategy and model:
+##     {output}/source=qrdata/prompt=react/model=gpt-4o/part-0.parquet
+## Rows of different runs are identified by the query_id column, so they can be joined on it.
+
+## Example: python aggregate_results.py -if output/qrdata output/real output/synthetic -o results_table
+## Reading the table: pd.read_parquet("results_table", filters=[("prompt", "=", "react")])
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from compile_results import load_scored_file, parse_result_file_name, summarize_scores
+
+PARTITION_COLUMNS = ["source", "prompt", "model"]
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description="Aggregate the results of many runs into one partitioned Parquet table")
+    parser.add_argument("-if", "--input_folders", type=str, nargs="+", required=True,
+                        help="Folders containing the json outputs of the experiments (searched recursively)")
+    parser.add_argument("-o", "--output", type=str, default="results_table",
+                        help="Folder of the Parquet results table")
+    parser.add_argument("-cd", "--cache_dir", type=str, default=None,
+                        help="Folder of the cache of parsed and scored files (default: <output>/.cache)")
+    parser.add_argument("-nw", "--num_workers", type=int, default=os.cpu_count(),
+                        help="Number of results files processed concurrently (default: number of CPUs)")
+    parser.add_argument("-z", "--ci_z", type=float, default=1.96,
+                        help="Width of the reference confidence interval in standard errors (default: 1.96)")
+
+    return parser.parse_args()
+
+
+def find_result_files(folders):
+    """
+    Find the results files, named {source}_{prompt}_{model}.json, in the given folders and their subfolders.
+
+    Returns:
+        (list): The paths of the results files, sorted
+    """
+
+    paths = []
+    for folder in folders:
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if not name.endswith(".json") or name.endswith(".metrics.json"):
+                    continue
+                try:
+                    parse_result_file_name(name)
+                except ValueError as e:
+                    print(f"Skipping {os.path.join(root, name)}: {e}")
+                    continue
+                paths.append(os.path.join(root, name))
+    return sorted(set(paths))
+
+
+def to_table_rows(df_result, path):
+    """Add the partition columns and the results file to the rows of one scored file."""
+    source, prompt, model = parse_result_file_name(os.path.basename(path))
+    df_result = df_result.assign(source=source, prompt=prompt, model=model, file=str(path))
+    ## raw predicted method names can be of any JSON type; store them as text
+    df_result["pred_method_ini"] = df_result["pred_method_ini"].map(
+        lambda value: None if value is None or (isinstance(value, float) and np.isnan(value)) else str(value))
+    return df_result
+
+
+def write_results_table(df, output):
+    """
+    Write the rows to a Parquet dataset partitioned by source, prompt and model. Partitions that
+    are written replace the existing ones; other partitions of the table are kept.
+    """
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_to_dataset(table, root_path=output, partition_cols=PARTITION_COLUMNS,
+                        basename_template="part-{i}.parquet", existing_data_behavior="delete_matching")
+
+
+def main(args):
+
+    paths = find_result_files(args.input_folders)
+    if not paths:
+        print("No results files found")
+        return None
+    cache_dir = args.cache_dir or os.path.join(args.output, ".cache")
+    print(f"Aggregating {len(paths)} results files from {len(args.input_folders)} folders")
+
+    frames = []
+    rescored = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.num_workers or 1)) as executor:
+        futures = {path: executor.submit(load_scored_file, path, cache_dir, args.ci_z) for path in paths}
+        for path in paths:
+            try:
+                df_result, _, changed = futures[path].result()
+            except Exception as e:
+                print(f"Error processing {path}: {e}")
+                continue
+            rescored += changed
+            frames.append(to_table_rows(df_result, path))
+
+    if not frames:
+        print("No results files could be processed")
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    duplicated = df.duplicated(PARTITION_COLUMNS + ["query_id"], keep="last")
+    if duplicated.any():
+        print(f"Warning: {int(duplicated.sum())} queries appear in more than one file of the same source, "
+              f"prompt and model; keeping the result of the last file")
+        df = df[~duplicated]
+
+    write_results_table(df, args.output)
+    print(f"Scored {rescored} new or changed files, {len(frames) - rescored} loaded from the cache")
+    print(f"Wrote {len(df)} rows to {args.output}")
+
+    summary = pd.DataFrame([{"source": source, "prompt": prompt, "model": model, **summarize_scores(group)}
+                            for (source, prompt, model), group in df.groupby(PARTITION_COLUMNS)])
+    print(summary.to_string(index=False))
+    return df
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    Path(args.output).mkdir(parents=True, exist_ok=True)
+    main(args)
@@ -0,0 +1,123 @@
+import time
+import asyncio
+
+from contextlib import nullcontext
+
+from .baseline import Baseline, FINAL_RESULT_PROMPT, find_code, parse_final_result
+from .async_coderunner import AsyncCodeRunner
+from .metrics import QueryMetrics
+from .query_formats import CausalQueryFormat
+
+
+class AsyncBaseline(Baseline):
+    """A conversational chatbot that has access to a dataset, driven from an asyncio event loop.
+
+    The chatbot must be one of the async chatbots (its `ask` is a coroutine) and code is run
+    through an AsyncCodeRunner. The conversation is not printed, since many of them are
+    interleaved in the same process.
+    """
+
+    def __init__(self, chatbot, code_runner: AsyncCodeRunner, max_retries=3) -> None:
+        self.chatbot = chatbot
+        self.code_runner = code_runner
+        self.max_retries = max_retries
+        self.persistent = code_runner.persistent
+        # Metrics of the query being answered (set by answer)
+        self.metrics = None
+
+    async def get_final_result(self):
+        """Get the final result from the chatbot in a structured JSON format."""
+
+        json_reply = await self.ask(FINAL_RESULT_PROMPT, step="final")
+        return parse_final_result(json_reply)
+
+    async def ask(self, query, step):
+        """Ask the chatbot, recording the latency and token usage of the turn."""
+        start = time.time()
+        reply = await self.chatbot.ask(query)
+        if self.metrics is not None:
+            self.metrics.record_turn(step, time.time() - start, getattr(self.chatbot, "last_usage", None),
+                                     getattr(self.chatbot, "last_cached", False))
+        return reply
+
+    async def run_code(self, code):
+        """Run code in the sandbox, recording the execution latency."""
+        start = time.time()
+        code_output = await self.code_runner.run_code(code)
+        if self.metrics is not None:
+            self.metrics.record_execution(time.time() - start, code_output)
+        return code_output
+
+    async def init_session(self, query_format):
+        """Load the dataset into the sandbox under the name the prompt refers to, timed as its own stage."""
+        if query_format.dataframe_name is None or not self.persistent:
+            return
+        with self.metrics.stage("session_init") if self.metrics is not None else nullcontext():
+            await self.code_runner.init_session(query_format.dataset_path, query_format.dataframe_name)
+
+    async def answer(self, query, dataset_path, dataset_description="", qf=CausalQueryFormat, post_steps=False,
+                     metrics=None, sandbox=None, first_reply=None):
+        """Answer a causal query using the dataset path (a df)"""
+
+        self.chatbot.delete_history()
+        self.metrics = metrics or QueryMetrics()
+
+        # Building the prompt reads the dataset, so keep it off the event loop
+        query_format = qf(query, dataset_path, dataset_description)
+        queries = await asyncio.to_thread(query_format.get_query_format)
+
+        # Load the dataframe the prompt refers to, so the first code block can use it right away
+        if sandbox is None:
+            await self.init_session(query_format)
+
+        reply = ""
+
+        # Handle pre-analysis queries
+        if "pre" in queries:
+            for i, q in enumerate(queries["pre"]):
+                if i == 0 and first_reply is not None:
+                    reply = self.add_batched_turn(q, first_reply, step="pre")
+                else:
+                    reply = await self.ask(q, step="pre")
+
+        # In pipelined mode the sandbox was prepared during the first turn; wait for it before running code
+        if sandbox is not None:
+            with self.metrics.stage("sandbox_wait"):
+                await sandbox
+            await self.init_session(query_format)
+
+        codes = []
+        code_outputs = []
+
+        # Run code while the model outputs code
+        for retry_count in range(self.max_retries):
+            code = find_code(reply)
+            if code is None:
+                break
+
+            codes.append(code)
+
+            code_output = await self.run_code(code)
+            code_outputs.append(code_output)
+
+            # Ask the chatbot to analyze the results
+            analysis_query = query_format.get_analysis_format(code_output)
+            reply = await self.ask(analysis_query, step="analysis")
+
+        # Post-analysis queries
+        if post_steps and "post" in queries:
+            for q in queries["post"]:
+                reply = await self.ask(q, step="post")
+
+        final_result = await self.get_final_result()
+        chat_history = self.chatbot.conversation_history
+
+        # Return the results
+        return {
+            "query": query,
+            "codes": codes,
+            "code_outputs": code_outputs,
+            "chat_history": chat_history,
+            "retries": max(0, len(codes) - 1),
+            "final_result": final_result,
+            "metrics": self.metrics.to_dict(),}
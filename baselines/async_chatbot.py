@@ -0,0 +1,112 @@
+import os
+import openai
+import asyncio
+import backoff
+
+from contextlib import nullcontext
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+from together import AsyncTogether
+
+from .chatbot import (RATE_LIMIT_ERRORS, AzureAPIChatbot, OpenAIAPIChatbot, TestChatbot,
+                      TogetherAPIChatbot, VertexAPIChatbot)
+from .metrics import get_usage
+from .rate_limiter import estimate_tokens
+
+
+@backoff.on_exception(backoff.expo, openai.APIConnectionError, max_tries=3)
+async def async_completions_with_backoff(client, **kwargs):
+    return await client.chat.completions.create(**kwargs)
+
+
+class AsyncAPIChatbot:
+    """Mixin that turns an APIChatbot into a chatbot whose `ask` is a coroutine.
+
+    The conversation history, message construction, response cache and usage bookkeeping are
+    shared with the synchronous chatbot; only the client call is awaited. An optional semaphore
+    limits the number of concurrent requests to the provider.
+    """
+
+    semaphore = None
+
+    async def complete(self, messages, completion_kwargs):
+        """Send a chat completion request, respecting the rate limiter and retrying rate limit errors."""
+        estimated_tokens = estimate_tokens(messages)
+        for attempt in range(self.max_rate_limit_retries + 1):
+            await asyncio.sleep(self.wait_for_rate_limit(estimated_tokens))
+            try:
+                async with self.semaphore or nullcontext():
+                    completion = await async_completions_with_backoff(
+                        client=self.client, model=self.model, messages=messages, **completion_kwargs
+                    )
+            except RATE_LIMIT_ERRORS as e:
+                await asyncio.sleep(self.handle_rate_limit(e, attempt))
+                continue
+            self.record_usage(estimated_tokens, get_usage(completion))
+            return completion
+
+    async def ask(self, query):
+        messages = self.build_messages(query)
+        reply = await self.request_reply(messages, self.get_completion_kwargs())
+        self.record_reply(reply)
+
+        return reply
+
+    async def request_reply(self, messages, completion_kwargs):
+        """Get the reply to a request from the response cache or the API (see APIChatbot.request_reply)"""
+        cache_key, reply = self.start_request(messages, completion_kwargs)
+        if reply is None:
+            reply = self.finish_request(cache_key, await self.complete(messages, completion_kwargs))
+        return reply
+
+
+class AsyncVertexAPIChatbot(AsyncAPIChatbot, VertexAPIChatbot):
+    """An asyncio chatbot that uses the Vertex API"""
+
+    def __init__(self, model="google/gemini-2.5-flash", project_id=None, location=None,
+                 persistent_mode=False, semaphore=None):
+        super().__init__(model=model, project_id=project_id, location=location,
+                         persistent_mode=persistent_mode)
+        self.client = AsyncOpenAI(base_url=self.client.base_url, api_key=self.client.api_key)
+        self.semaphore = semaphore
+
+
+class AsyncTogetherAPIChatbot(AsyncAPIChatbot, TogetherAPIChatbot):
+    """An asyncio chatbot that uses the Together API"""
+
+    def __init__(self, model, persistent_mode=False, semaphore=None):
+        super().__init__(model, persistent_mode=persistent_mode)
+        self.client = AsyncTogether(api_key=self.client.api_key)
+        self.semaphore = semaphore
+
+
+class AsyncAzureAPIChatbot(AsyncAPIChatbot, AzureAPIChatbot):
+    """An asyncio chatbot that uses the Azure API"""
+
+    def __init__(self, model, persistent_mode=False, semaphore=None):
+        super().__init__(model, persistent_mode=persistent_mode)
+        self.client = AsyncAzureOpenAI(
+            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+            api_version=os.getenv("OPENAI_API_VERSION"),
+        )
+        self.semaphore = semaphore
+
+
+class AsyncOpenAIAPIChatbot(AsyncAPIChatbot, OpenAIAPIChatbot):
+    """An asyncio chatbot that uses the OpenAI API"""
+
+    def __init__(self, model, persistent_mode=False, base_url=None, semaphore=None):
+        super().__init__(model, persistent_mode=persistent_mode, base_url=base_url)
+        self.client = AsyncOpenAI(base_url=self.client.base_url, api_key=self.client.api_key)
+        self.semaphore = semaphore
+
+
+class AsyncTestChatbot(TestChatbot):
+    """An asyncio chatbot for testing"""
+
+    def __init__(self, semaphore=None):
+        super().__init__()
+        self.semaphore = semaphore
+
+    async def ask(self, query):
+        async with self.semaphore or nullcontext():
+            return TestChatbot.ask(self, query)
@@ -0,0 +1,157 @@
+import os
+import asyncio
+import httpx
+
+from .coderunner import CHUNK_SIZE, CodeRunner, file_sha256, format_execution_result, format_upload_result
+
+
+class AsyncCodeRunner:
+    """An asyncio client for the persistent container of a CodeRunner.
+
+    Container management goes through the blocking Docker SDK of the wrapped CodeRunner in a
+    worker thread, while code execution and file transfer use a shared non-blocking HTTP client,
+    so many sessions can be driven from one event loop.
+    """
+
+    def __init__(self, code_runner: CodeRunner, http_client: httpx.AsyncClient):
+        self.code_runner = code_runner
+        self.http_client = http_client
+
+    @property
+    def persistent(self):
+        return self.code_runner.persistent
+
+    async def start_persistent_container(self):
+        """Start the persistent container without blocking the event loop."""
+        return await asyncio.to_thread(self.code_runner.start_persistent_container)
+
+    async def stop_persistent_container(self):
+        """Stop the persistent container without blocking the event loop."""
+        return await asyncio.to_thread(self.code_runner.stop_persistent_container)
+
+    async def _post(self, endpoint, payload, timeout):
+        """Send a request to the HTTP server of the container and return the decoded response."""
+        response = await self.http_client.post(
+            f"{self.code_runner.http_url}{endpoint}", json=payload, timeout=timeout
+        )
+        if response.status_code != 200:
+            return {"status": "error", "error": f"HTTP status {response.status_code}"}
+        return response.json()
+
+    async def run_code(self, code):
+        """Run code in the persistent container, or in a one-off container in a worker thread."""
+        if not self.persistent:
+            return await asyncio.to_thread(self.code_runner.run_code_oneoff, code)
+
+        # Check if container is running, start if not
+        running = await asyncio.to_thread(self.code_runner.is_container_running)
+        if not running:
+            if not await self.start_persistent_container():
+                return "Error: Failed to start persistent container"
+
+        # Check for session timeout
+        if self.code_runner.check_session_timeout():
+            print("Session timed out, restarting container...")
+            await self.stop_persistent_container()
+            if not await self.start_persistent_container():
+                return "Error: Session timed out and failed to restart"
+
+        # Execute code
+        try:
+            payload, http_timeout = self.code_runner.execute_payload(code)
+            result = await self._post("/execute", payload, timeout=http_timeout)
+            return format_execution_result(result)
+        except Exception as e:
+            return f"Error executing code: {str(e)}"
+
+    async def reset_session(self):
+        """Reset the interpreter state of the persistent container without restarting it."""
+        try:
+            result = await self._post("/reset", self.code_runner.session_payload({}), timeout=10)
+            return result["status"] == "success"
+        except Exception as e:
+            print(f"Error resetting session: {str(e)}")
+            return False
+
+    async def init_session(self, dataset_path, name='df', encoding=None):
+        """Load the (already staged) dataset into the session namespace under `name` before the first turn."""
+        if not self.persistent:
+            return "Error: Not in persistent mode"
+        try:
+            result = await self._post(
+                "/init",
+                self.code_runner.session_payload({"dataset_path": dataset_path, "name": name, "encoding": encoding}),
+                timeout=130
+            )
+            if result["status"] == "success":
+                return f"Dataset loaded as `{name}` ({result['rows']} rows, {result['seconds']:.2f}s)"
+            else:
+                return f"Error: {result.get('error', 'Unknown error')}"
+
+        except Exception as e:
+            return f"Error initializing session: {str(e)}"
+
+    async def upload_file(self, local_path, container_path=None):
+        """Upload a file from the local machine to the container, streamed in chunks (see CodeRunner.upload_file)."""
+        try:
+            # If container_path is not specified, use the same path as local_path
+            if container_path is None:
+                container_path = os.path.basename(local_path)
+
+            sha256 = await asyncio.to_thread(file_sha256, local_path)
+
+            async def iter_file():
+                with open(local_path, 'rb') as f:
+                    while True:
+                        chunk = await asyncio.to_thread(f.read, CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+
+            response = await self.http_client.put(
+                f"{self.code_runner.http_url}/files",
+                params={"path": container_path},
+                content=iter_file(),
+                headers={
+                    "Content-Type": "application/octet-stream",
+                    "Content-Length": str(os.path.getsize(local_path)),
+                    "X-Content-SHA256": sha256,
+                },
+                timeout=30
+            )
+            # Containers built before streaming uploads only support the JSON endpoint
+            if response.status_code == 501:
+                return await asyncio.to_thread(self.code_runner._upload_file_json, local_path, container_path)
+            return format_upload_result(response, container_path, sha256)
+
+        except Exception as e:
+            return f"Error uploading file: {str(e)}"
+
+    async def register_columnar_copy(self, csv_path, columnar_path, encoding='utf-8'):
+        """Make pd.read_csv(csv_path) in the container load the (already uploaded) columnar copy."""
+        try:
+            result = await self._post(
+                "/register_columnar",
+                {"csv_path": csv_path, "columnar_path": columnar_path, "encoding": encoding},
+                timeout=10
+            )
+            if result["status"] == "success":
+                return f"Columnar copy {columnar_path} registered for {csv_path}"
+            else:
+                return f"Error: {result.get('error', 'Unknown error')}"
+
+        except Exception as e:
+            return f"Error registering columnar copy: {str(e)}"
+
+    async def preload_dataset(self, csv_path, encoding='utf-8'):
+        """Parse an (already staged) dataset once in the container, so pd.read_csv(csv_path) returns a copy of it."""
+        try:
+            result = await self._post("/preload", {"csv_path": csv_path, "encoding": encoding}, timeout=130)
+            if result["status"] == "success":
+                self.code_runner.preloaded_datasets.add(csv_path)
+                return f"Dataset {csv_path} preloaded ({result['rows']} rows, {result['seconds']:.2f}s)"
+            else:
+                return f"Error: {result.get('error', 'Unknown error')}"
+
+        except Exception as e:
+            return f"Error preloading dataset: {str(e)}"
@@ -1,12 +1,16 @@
 import pandas as pd
 import re
 import json
+import time
 
+from contextlib import nullcontext
 from .chatbot import Chatbot
 from .query_formats import QueryFormat, CausalQueryFormat
 from .coderunner import CodeRunner
+from .metrics import QueryMetrics
 
 from typing import Optional
+from concurrent.futures import Future
 
 
 def print_color(text, color):
@@ -30,22 +34,7 @@ def find_code(reply, language="python"):
     return code
 
 
-class Baseline:
-    """A conversational chatbot that has access to a dataset"""
-
-    def __init__(self, chatbot: Chatbot, safe_exec=True, persistent=False, 
-                 session_timeout=3600, max_retries=3, worker_id=None) -> None:
-        self.chatbot = chatbot
-        self.code_runner = CodeRunner(safe_exec=safe_exec, persistent=persistent, 
-                                      session_timeout=session_timeout, worker_id=worker_id)
-        self.max_retries = max_retries
-        self.persistent = persistent
-
-    def get_final_result(self):
-
-        """Get the final result from the chatbot in a structured JSON format."""
-
-        prompt = """
+FINAL_RESULT_PROMPT = """
 Please provide a final summary of the analysis in a single, well-formed JSON object. The JSON object should have the following keys. If a field is not applicable, use `null`.
 
 - `method`: The name of the primary causal inference method used (e.g., "Propensity Score Weighting", "Difference-in-Differences", "Frontdoor Estimation").
@@ -65,42 +54,103 @@ Please provide a final summary of the analysis in a single, well-formed JSON obj
 
 Output the JSON object only, without any additional text or explanation. Ensure the JSON is properly formatted and valid.
 """
-        json_reply = self.chatbot.ask(prompt)
-
-        try:
-            # Remove any markdown code blocks if present
-            if "```json" in json_reply:
-                json_start = json_reply.find("```json") + 7
-                json_end = json_reply.find("```", json_start)
-                if json_end != -1:
-                    json_reply = json_reply[json_start:json_end].strip()
-            elif "```" in json_reply:
-                json_start = json_reply.find("```") + 3
-                json_end = json_reply.find("```", json_start)
-                if json_end != -1:
-                    json_reply = json_reply[json_start:json_end].strip()
-            
-            # Remove any comments (// style)
-            lines = json_reply.split('\n')
-            cleaned_lines = []
-            for line in lines:
-                if '//' in line:
-                    line = line[:line.index('//')]
-                cleaned_lines.append(line)
-            json_reply = '\n'.join(cleaned_lines)
-            
-            # Find the start and end of the JSON object
-            json_start = json_reply.find('{')
-            json_end = json_reply.rfind('}') + 1
-            if json_start != -1 and json_end != 0:
-                json_str = json_reply[json_start:json_end]
-                return json.loads(json_str)
-            else:
-                return {"error": "Could not find a valid JSON object in the response.", 
-                        "raw_response": json_reply}
-        except json.JSONDecodeError as e:
-            return {"error": f"Failed to decode JSON: {str(e)}", 
+
+
+def parse_final_result(json_reply):
+    """Parse the structured JSON summary returned by the chatbot"""
+
+    try:
+        # Remove any markdown code blocks if present
+        if "```json" in json_reply:
+            json_start = json_reply.find("```json") + 7
+            json_end = json_reply.find("```", json_start)
+            if json_end != -1:
+                json_reply = json_reply[json_start:json_end].strip()
+        elif "```" in json_reply:
+            json_start = json_reply.find("```") + 3
+            json_end = json_reply.find("```", json_start)
+            if json_end != -1:
+                json_reply = json_reply[json_start:json_end].strip()
+        
+        # Remove any comments (// style)
+        lines = json_reply.split('\n')
+        cleaned_lines = []
+        for line in lines:
+            if '//' in line:
+                line = line[:line.index('//')]
+            cleaned_lines.append(line)
+        json_reply = '\n'.join(cleaned_lines)
+        
+        # Find the start and end of the JSON object
+        json_start = json_reply.find('{')
+        json_end = json_reply.rfind('}') + 1
+        if json_start != -1 and json_end != 0:
+            json_str = json_reply[json_start:json_end]
+            return json.loads(json_str)
+        else:
+            return {"error": "Could not find a valid JSON object in the response.", 
                     "raw_response": json_reply}
+    except json.JSONDecodeError as e:
+        return {"error": f"Failed to decode JSON: {str(e)}", 
+                "raw_response": json_reply}
+
+
+class Baseline:
+    """A conversational chatbot that has access to a dataset"""
+
+    def __init__(self, chatbot: Chatbot, safe_exec=True, persistent=False, 
+                 session_timeout=3600, max_retries=3, worker_id=None,
+                 code_runner: Optional[CodeRunner] = None, runner_kwargs=None) -> None:
+        self.chatbot = chatbot
+        if code_runner is None:
+            code_runner = CodeRunner(safe_exec=safe_exec, persistent=persistent, 
+                                     session_timeout=session_timeout, worker_id=worker_id,
+                                     **(runner_kwargs or {}))
+        self.code_runner = code_runner
+        self.max_retries = max_retries
+        self.persistent = persistent
+        # Metrics of the query being answered (set by answer)
+        self.metrics = None
+
+    def get_final_result(self):
+
+        """Get the final result from the chatbot in a structured JSON format."""
+
+        json_reply = self.ask(FINAL_RESULT_PROMPT, step="final")
+        return parse_final_result(json_reply)
+
+    def ask(self, query, step):
+        """Ask the chatbot, recording the latency and token usage of the turn."""
+        start = time.time()
+        reply = self.chatbot.ask(query)
+        if self.metrics is not None:
+            self.metrics.record_turn(step, time.time() - start, getattr(self.chatbot, "last_usage", None),
+                                     getattr(self.chatbot, "last_cached", False))
+        return reply
+
+    def add_batched_turn(self, query, batched_reply, step):
+        """Add a turn whose reply was obtained from a batch job to the conversation, recording its token usage."""
+        self.chatbot.add_turn(query, batched_reply["content"])
+        if self.metrics is not None:
+            self.metrics.record_turn(step, 0.0, batched_reply.get("usage"), batched=True)
+        return batched_reply["content"]
+
+    def run_code(self, code):
+        """Run code in the sandbox, recording the execution latency."""
+        start = time.time()
+        code_output = self.code_runner.run_code(code)
+        if self.metrics is not None:
+            self.metrics.record_execution(time.time() - start, code_output)
+        return code_output
+
+    def init_session(self, query_format):
+        """Load the dataset into the sandbox under the name the prompt refers to, timed as its own stage."""
+
+        if query_format.dataframe_name is None or not self.is_session_active():
+            return
+        with self.metrics.stage("session_init") if self.metrics is not None else nullcontext():
+            init_result = self.code_runner.init_session(query_format.dataset_path, query_format.dataframe_name)
+        print(init_result)
 
     def get_variable_value(self, variable_name):
         """Get the value of a variable in the persistent environment."""
@@ -166,13 +216,25 @@ Output the JSON object only, without any additional text or explanation. Ensure
         
         return self.code_runner.list_files(directory)
 
-    def answer(self, query, dataset_path, dataset_description="", qf=CausalQueryFormat, post_steps=False):
-        """Answer a causal query using the dataset path (a df)"""
+    def answer(self, query, dataset_path, dataset_description="", qf=CausalQueryFormat, post_steps=False,
+               metrics: Optional[QueryMetrics] = None, sandbox: Optional[Future] = None,
+               first_reply: Optional[dict] = None):
+        """Answer a causal query using the dataset path (a df)
+
+        In pipelined mode, `sandbox` is a future that completes when the persistent environment is
+        ready; the first prompt is built and sent in the meantime. `first_reply` is the reply to the
+        first prompt (its `content` and `usage`) if it was already obtained from a batch job.
+        """
         
         self.chatbot.delete_history()
+        self.metrics = metrics or QueryMetrics()
         
         # Initialize the query format
         query_format = qf(query, dataset_path, dataset_description)
+
+        # Load the dataframe the prompt refers to, so the first code block can use it right away
+        if sandbox is None:
+            self.init_session(query_format)
         
         # Get the query format
         queries = query_format.get_query_format()
@@ -181,11 +243,20 @@ Output the JSON object only, without any additional text or explanation. Ensure
         
         # Handle pre-analysis queries
         if "pre" in queries:
-            for q in queries["pre"]:
+            for i, q in enumerate(queries["pre"]):
                 # Pre-analysis queries
                 print_color(q, 32)
-                reply = self.chatbot.ask(q)
+                if i == 0 and first_reply is not None:
+                    reply = self.add_batched_turn(q, first_reply, step="pre")
+                else:
+                    reply = self.ask(q, step="pre")
                 print_color(reply, 33)
+
+        # In pipelined mode the sandbox was prepared during the first turn; wait for it before running code
+        if sandbox is not None:
+            with self.metrics.stage("sandbox_wait"):
+                sandbox.result()
+            self.init_session(query_format)
         
         codes = []
         code_outputs = []
@@ -198,20 +269,20 @@ Output the JSON object only, without any additional text or explanation. Ensure
 
             codes.append(code)
 
-            code_output = self.code_runner.run_code(code)
+            code_output = self.run_code(code)
             code_outputs.append(code_output)
 
             # Ask the chatbot to analyze the results
             analysis_query = query_format.get_analysis_format(code_output)
             print_color(analysis_query, 32)
-            reply = self.chatbot.ask(analysis_query)
+            reply = self.ask(analysis_query, step="analysis")
             print_color(reply, 33)
 
         # Post-analysis queries
         if post_steps and "post" in queries:
             for q in queries["post"]:
                 print_color(q, 32)
-                reply = self.chatbot.ask(q)
+                reply = self.ask(q, step="post")
                 print_color(reply, 33)
 
         final_result = self.get_final_result()
@@ -224,4 +295,5 @@ Output the JSON object only, without any additional text or explanation. Ensure
             "code_outputs": code_outputs,
             "chat_history": chat_history,
             "retries": max(0, len(codes) - 1),  
-            "final_result": final_result,}
\ No newline at end of file
+            "final_result": final_result,
+            "metrics": self.metrics.to_dict(),}
\ No newline at end of file
@@ -0,0 +1,190 @@
+import io
+import os
+import json
+import time
+import uuid
+
+# Endpoint of the requests in a batch job
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Largest number of requests the OpenAI Batch API accepts in one batch
+MAX_BATCH_REQUESTS = 50000
+
+# Batch states after which nothing changes anymore
+TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+
+def make_batch_line(custom_id, model, messages, completion_kwargs=None):
+    """Build one line of a batch input file (OpenAI Batch API format)."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {"model": model, "messages": messages, **(completion_kwargs or {})},
+    }
+
+
+def parse_batch_output(lines):
+    """
+    Parse the lines of a batch output file (OpenAI Batch API format).
+
+    Returns:
+        (dict): The `content` and `usage` of every successful reply, keyed by custom_id
+    """
+
+    replies = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get("response") or {}
+        if entry.get("error") or response.get("status_code") != 200:
+            continue
+        body = response["body"]
+        usage = body.get("usage")
+        replies[entry["custom_id"]] = {
+            "content": body["choices"][0]["message"]["content"],
+            "usage": {field: usage.get(field) for field in ("prompt_tokens", "completion_tokens", "total_tokens")}
+                     if usage else None,
+        }
+    return replies
+
+
+class BatchAdapter:
+    """Submits chat completion requests as one batch job of a provider and collects the replies.
+
+    Requests are lines of the OpenAI batch input format (see make_batch_line). Adapters
+    implement `submit`, `status` and `results`; `run` submits the requests and polls until
+    the batch is done.
+    """
+
+    def submit(self, lines) -> str:
+        """Submit the requests and return the id of the batch."""
+        raise NotImplementedError
+
+    def status(self, batch_id) -> str:
+        """Get the state of a batch (one of TERMINAL_STATES once it is done)."""
+        raise NotImplementedError
+
+    def results(self, batch_id) -> dict:
+        """Get the replies of a finished batch, keyed by custom_id (failed requests are left out)."""
+        raise NotImplementedError
+
+    def run(self, lines, poll_interval=30, timeout=None):
+        """
+        Submit requests in batches of at most MAX_BATCH_REQUESTS and wait for their replies.
+
+        Returns:
+            (dict): The replies, keyed by custom_id. Requests of batches that failed or did not
+                    finish within timeout seconds are left out.
+        """
+
+        batch_ids = [self.submit(lines[i:i + MAX_BATCH_REQUESTS])
+                     for i in range(0, len(lines), MAX_BATCH_REQUESTS)]
+        start = time.time()
+        replies = {}
+        pending = list(batch_ids)
+        while pending:
+            for batch_id in list(pending):
+                state = self.status(batch_id)
+                if state in TERMINAL_STATES:
+                    pending.remove(batch_id)
+                    # Expired batches still return the requests that were completed in time
+                    replies.update(self.results(batch_id))
+                    print(f"Batch {batch_id}: {state}")
+            if not pending:
+                break
+            if timeout is not None and time.time() - start > timeout:
+                print(f"Batches {', '.join(pending)} did not finish within {timeout} seconds")
+                break
+            time.sleep(poll_interval)
+        return replies
+
+
+class OpenAIBatchAdapter(BatchAdapter):
+    """Batch jobs of the OpenAI Batch API (also served by Azure OpenAI), run within 24 hours at a discount."""
+
+    def __init__(self, client, completion_window="24h"):
+        self.client = client
+        self.completion_window = completion_window
+
+    def submit(self, lines):
+        content = "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+        input_file = self.client.files.create(file=("batch_input.jsonl", io.BytesIO(content)), purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        print(f"Submitted batch {batch.id} with {len(lines)} requests")
+        return batch.id
+
+    def status(self, batch_id):
+        return self.client.batches.retrieve(batch_id).status
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        if not batch.output_file_id:
+            return {}
+        return parse_batch_output(self.client.files.content(batch.output_file_id).text.splitlines())
+
+
+class LocalBatchAdapter(BatchAdapter):
+    """A file-based stand-in for a batch API, for testing.
+
+    Input and output files are written to `batch_dir` in the OpenAI batch format. The batch
+    is processed on the first status poll by a fresh chatbot from `chatbot_factory`. API
+    chatbots send the messages and completion arguments of each request as they are; other
+    chatbots are asked its last message.
+    """
+
+    def __init__(self, batch_dir, chatbot_factory):
+        self.batch_dir = batch_dir
+        self.chatbot_factory = chatbot_factory
+        os.makedirs(batch_dir, exist_ok=True)
+
+    def _path(self, batch_id, kind):
+        return os.path.join(self.batch_dir, f"{batch_id}.{kind}.jsonl")
+
+    def submit(self, lines):
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        with open(self._path(batch_id, "input"), "w") as f:
+            for line in lines:
+                f.write(json.dumps(line) + "\n")
+        print(f"Submitted local batch {batch_id} with {len(lines)} requests")
+        return batch_id
+
+    def status(self, batch_id):
+        if not os.path.exists(self._path(batch_id, "output")):
+            self._process(batch_id)
+        return "completed"
+
+    def _process(self, batch_id):
+        chatbot = self.chatbot_factory()
+        output_path = self._path(batch_id, "output")
+        with open(self._path(batch_id, "input"), "r") as f_in, open(output_path + ".tmp", "w") as f_out:
+            for line in f_in:
+                request = json.loads(line)
+                chatbot.delete_history()
+                entry = {"custom_id": request["custom_id"], "response": None, "error": None}
+                try:
+                    body = dict(request["body"])
+                    body.pop("model", None)
+                    messages = body.pop("messages")
+                    if hasattr(chatbot, "request_reply"):
+                        reply = chatbot.request_reply(messages, body)
+                    else:
+                        reply = chatbot.ask(messages[-1]["content"])
+                    entry["response"] = {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"role": "assistant", "content": reply}}],
+                                 "usage": getattr(chatbot, "last_usage", None)},
+                    }
+                except Exception as e:
+                    entry["error"] = {"message": str(e)}
+                f_out.write(json.dumps(entry) + "\n")
+        os.replace(output_path + ".tmp", output_path)
+
+    def results(self, batch_id):
+        with open(self._path(batch_id, "output"), "r") as f:
+            return parse_batch_output(f)
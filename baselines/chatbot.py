@@ -1,4 +1,5 @@
 import os
+import time
 import vertexai
 import openai
 import backoff
@@ -12,9 +13,17 @@ from dotenv import load_dotenv, find_dotenv
 from openai import AzureOpenAI, OpenAI
 
 from together import Together
+from together.error import RateLimitError as TogetherRateLimitError
 
+from .response_cache import make_request_key
+from .metrics import get_usage
+from .rate_limiter import estimate_tokens, rate_limit_delay
 
-@backoff.on_exception(backoff.expo, (openai.RateLimitError, requests.exceptions.ConnectionError, openai.APIConnectionError), max_tries=3)
+# Rate limit errors are retried by APIChatbot, which coordinates with the shared rate limiter
+RATE_LIMIT_ERRORS = (openai.RateLimitError, TogetherRateLimitError)
+
+
+@backoff.on_exception(backoff.expo, (requests.exceptions.ConnectionError, openai.APIConnectionError), max_tries=3)
 def completions_with_backoff(client, **kwargs):
     return client.chat.completions.create(**kwargs)
 
@@ -35,6 +44,166 @@ class Chatbot:
     def delete_history(self) -> None:
         self.conversation_history = []
 
+    def add_turn(self, query: str, reply: str) -> None:
+        """Add a query and a reply that was obtained outside of `ask` (e.g. from a batch job) to the history"""
+        self.conversation_history.append({"role": "user", "content": query})
+        self.conversation_history.append({"role": "assistant", "content": reply})
+
+
+SYSTEM_MESSAGE = "You are a helpful assistant."
+PERSISTENT_SYSTEM_MESSAGE = " You have access to a persistent Python environment where variables and loaded libraries remain available between code executions. You can write and execute code incrementally, inspect intermediate results, and build upon previous computations."
+
+
+def truncate_middle(content, max_chars):
+    """Shorten a message to about max_chars characters, keeping its beginning and end."""
+    if len(content) <= max_chars:
+        return content
+    head = max_chars // 2
+    tail = max_chars - head
+    removed = len(content) - head - tail
+    return f"{content[:head]}\n[... {removed} characters truncated ...]\n{content[-tail:]}"
+
+
+class APIChatbot(Chatbot):
+    """A conversational chatbot that uses an OpenAI-compatible chat completions API"""
+
+    # Name of the API provider, used to apply per-provider limits
+    provider = None
+
+    # Optional ResponseCache shared by the chatbots of a process
+    response_cache = None
+
+    # If set, older user turns (code output observations) longer than this many characters
+    # are truncated in the requests; the conversation history itself is kept complete
+    compact_history_chars = None
+
+    # Token usage of the last reply (None if it came from the cache or was not reported)
+    last_usage = None
+    last_cached = False
+
+    # Optional RateLimiter (or a proxy of a limiter shared between processes)
+    rate_limiter = None
+
+    # Rate limit errors are retried this many times before they are raised
+    max_rate_limit_retries = 5
+
+    def get_system_content(self):
+        # Create the system message with persistent mode info if enabled
+        system_content = SYSTEM_MESSAGE
+        if self.persistent_mode:
+            system_content += PERSISTENT_SYSTEM_MESSAGE
+        return system_content
+
+    def get_completion_kwargs(self):
+        """Extra arguments passed to the chat completions API"""
+        return {}
+
+    def build_messages(self, query):
+        """Add the query to the conversation history and create the messages for the API"""
+        self.conversation_history.append({"role": "user", "content": query})
+
+        history = self.conversation_history
+        if self.compact_history_chars is not None:
+            history = self.compact_history(history)
+        return [{"role": "system", "content": self.get_system_content()}] + history
+
+    def compact_history(self, history):
+        """
+        Truncate the user turns between the first one (the task and dataset summary) and the
+        last two (the latest observation and the current query), so the cost of a turn stays
+        bounded when code outputs pile up.
+        """
+        user_turns = [i for i, message in enumerate(history) if message["role"] == "user"]
+        keep = set(user_turns[:1] + user_turns[-2:])
+        compacted = []
+        for i, message in enumerate(history):
+            if message["role"] == "user" and i not in keep:
+                message = {**message, "content": truncate_middle(message["content"], self.compact_history_chars)}
+            compacted.append(message)
+        return compacted
+
+    def record_reply(self, reply):
+        """Add the reply to a query (already added by build_messages) to the conversation history"""
+        self.conversation_history.append(
+            {"role": "assistant", "content": reply}
+        )
+
+    def get_cached_reply(self, messages, completion_kwargs):
+        """Look up the reply to a request in the response cache. Returns the cache key and the reply (or None)."""
+        if self.response_cache is None:
+            return None, None
+        key = make_request_key(self.provider, self.model, messages, completion_kwargs)
+        return key, self.response_cache.get(key)
+
+    def start_request(self, messages, completion_kwargs):
+        """Reset the usage of the last reply and look up the request in the response cache (see get_cached_reply)."""
+        cache_key, reply = self.get_cached_reply(messages, completion_kwargs)
+        self.last_usage = None
+        self.last_cached = reply is not None
+        return cache_key, reply
+
+    def finish_request(self, cache_key, completion):
+        """Get the reply of a completion, recording its usage and caching it under cache_key."""
+        reply = completion.choices[0].message.content
+        self.last_usage = get_usage(completion)
+        if cache_key is not None:
+            self.response_cache.put(cache_key, reply, model=self.model)
+        return reply
+
+    def wait_for_rate_limit(self, estimated_tokens):
+        """Get how long to wait before sending a request, according to the rate limiter."""
+        if self.rate_limiter is None:
+            return 0.0
+        return self.rate_limiter.reserve(self.provider, self.model, estimated_tokens)
+
+    def handle_rate_limit(self, error, attempt):
+        """
+        Handle a rate limit error: raise it if out of retries, otherwise get how long to wait before retrying.
+        With a rate limiter, all requests to the provider and model are paused instead.
+        """
+        if attempt >= self.max_rate_limit_retries:
+            raise error
+        delay = rate_limit_delay(error, attempt)
+        print(f"Rate limited by {self.provider} ({self.model}), retrying in {delay:.1f} seconds...")
+        if self.rate_limiter is None:
+            return delay
+        self.rate_limiter.penalize(self.provider, self.model, delay)
+        return 0.0
+
+    def record_usage(self, estimated_tokens, usage):
+        """Correct the rate limiter's token estimate of a request with its actual usage."""
+        if self.rate_limiter is not None and usage and usage["total_tokens"] is not None:
+            self.rate_limiter.settle(self.provider, self.model, estimated_tokens, usage["total_tokens"])
+
+    def complete(self, messages, completion_kwargs):
+        """Send a chat completion request, respecting the rate limiter and retrying rate limit errors."""
+        estimated_tokens = estimate_tokens(messages)
+        for attempt in range(self.max_rate_limit_retries + 1):
+            time.sleep(self.wait_for_rate_limit(estimated_tokens))
+            try:
+                completion = completions_with_backoff(
+                    client=self.client, model=self.model, messages=messages, **completion_kwargs
+                )
+            except RATE_LIMIT_ERRORS as e:
+                time.sleep(self.handle_rate_limit(e, attempt))
+                continue
+            self.record_usage(estimated_tokens, get_usage(completion))
+            return completion
+
+    def ask(self, query):
+        messages = self.build_messages(query)
+        reply = self.request_reply(messages, self.get_completion_kwargs())
+        self.record_reply(reply)
+
+        return reply
+
+    def request_reply(self, messages, completion_kwargs):
+        """Get the reply to a request from the response cache or the API, without touching the conversation history"""
+        cache_key, reply = self.start_request(messages, completion_kwargs)
+        if reply is None:
+            reply = self.finish_request(cache_key, self.complete(messages, completion_kwargs))
+        return reply
+
 
 class LocalChatbot(Chatbot):
     """A conversational chatbot that has access to a dataset"""
@@ -115,9 +284,11 @@ class LocalChatbot(Chatbot):
             print(f"Error running code: {e}")
 
 
-class VertexAPIChatbot(Chatbot):
+class VertexAPIChatbot(APIChatbot):
     """A conversational chatbot that uses the Vertex API"""
 
+    provider = "vertex"
+
     def __init__(
         self, model="google/gemini-2.5-flash", project_id=None, location=None, persistent_mode=False
     ):
@@ -151,38 +322,12 @@ class VertexAPIChatbot(Chatbot):
         self.project_id = project_id
         self.location = location
 
-    def ask(self, query):
-        # Add the query to the conversation history
-        self.conversation_history.append({"role": "user", "content": query})
-
-        # Create the system message with persistent mode info if enabled
-        system_content = "You are a helpful assistant."
-        if self.persistent_mode:
-            system_content += " You have access to a persistent Python environment where variables and loaded libraries remain available between code executions. You can write and execute code incrementally, inspect intermediate results, and build upon previous computations."
-
-        # Create the messages for the API
-        if not self.conversation_history[:-1]:  # If this is the first message
-            messages = [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": query},
-            ]
-        else:
-            messages = [{"role": "system", "content": system_content}] + self.conversation_history
-
-        completion = completions_with_backoff(
-            client=self.client, model=self.model, messages=messages
-        )
-        self.conversation_history.append({"role": "user", "content": query})
-        self.conversation_history.append(
-            {"role": "assistant", "content": completion.choices[0].message.content}
-        )
-
-        return completion.choices[0].message.content
 
-
-class TogetherAPIChatbot(Chatbot):
+class TogetherAPIChatbot(APIChatbot):
     """A conversational chatbot that uses the Together API"""
 
+    provider = "together"
+
     def __init__(self, model, persistent_mode=False):
         self.model = model
         self.conversation_history = []
@@ -193,38 +338,12 @@ class TogetherAPIChatbot(Chatbot):
 
         self.client = Together(api_key=os.getenv("TOGETHER_API_KEY"))
 
-    def ask(self, query):
-        # Add the query to the conversation history
-        self.conversation_history.append({"role": "user", "content": query})
-
-        # Create the system message with persistent mode info if enabled
-        system_content = "You are a helpful assistant."
-        if self.persistent_mode:
-            system_content += " You have access to a persistent Python environment where variables and loaded libraries remain available between code executions. You can write and execute code incrementally, inspect intermediate results, and build upon previous computations."
-
-        # Create the messages for the API
-        if not self.conversation_history[:-1]:  # If this is the first message
-            messages = [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": query},
-            ]
-        else:
-            messages = [{"role": "system", "content": system_content}] + self.conversation_history
-
-        completion = completions_with_backoff(
-            client=self.client, model=self.model, messages=messages
-        )
-        self.conversation_history.append({"role": "user", "content": query})
-        self.conversation_history.append(
-            {"role": "assistant", "content": completion.choices[0].message.content}
-        )
-
-        return completion.choices[0].message.content
 
-
-class AzureAPIChatbot(Chatbot):
+class AzureAPIChatbot(APIChatbot):
     """A conversational chatbot that uses the Azure API"""
 
+    provider = "azure"
+
     def __init__(self, model, persistent_mode=False):
         self.model = model
         self.conversation_history = []
@@ -238,39 +357,13 @@ class AzureAPIChatbot(Chatbot):
             api_version=os.getenv("OPENAI_API_VERSION"),
         )
 
-    def ask(self, query):
-        # Add the query to the conversation history
-        self.conversation_history.append({"role": "user", "content": query})
-
-        # Create the system message with persistent mode info if enabled
-        system_content = "You are a helpful assistant."
-        if self.persistent_mode:
-            system_content += " You have access to a persistent Python environment where variables and loaded libraries remain available between code executions. You can write and execute code incrementally, inspect intermediate results, and build upon previous computations."
-
-        # Create the messages for the API
-        if not self.conversation_history[:-1]:  # If this is the first message
-            messages = [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": query},
-            ]
-        else:
-            messages = [{"role": "system", "content": system_content}] + self.conversation_history
 
-        completion = completions_with_backoff(
-            client=self.client, model=self.model, messages=messages
-        )
-        self.conversation_history.append({"role": "user", "content": query})
-        self.conversation_history.append(
-            {"role": "assistant", "content": completion.choices[0].message.content}
-        )
-
-        return completion.choices[0].message.content
-
-
-class OpenAIAPIChatbot(Chatbot):
+class OpenAIAPIChatbot(APIChatbot):
     """A conversational chatbot that uses the OpenAI API"""
 
-    def __init__(self, model, persistent_mode=False):
+    provider = "openai"
+
+    def __init__(self, model, persistent_mode=False, base_url=None):
         self.model = model
         self.conversation_history = []
         self.persistent_mode = persistent_mode
@@ -278,40 +371,18 @@ class OpenAIAPIChatbot(Chatbot):
         # Load environment variables
         load_dotenv(find_dotenv())
 
+        # A base_url points the client at another OpenAI-compatible server (e.g. baselines.mock_llm_server),
+        # which may not need a key
+        api_key = os.getenv("OPENAI_API_KEY")
+        if base_url and not api_key:
+            api_key = "unused"
         self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-        )
-
-    def ask(self, query):
-        # Add the query to the conversation history
-        self.conversation_history.append({"role": "user", "content": query})
-
-        # Create the system message with persistent mode info if enabled
-        system_content = "You are a helpful assistant."
-        if self.persistent_mode:
-            system_content += " You have access to a persistent Python environment where variables and loaded libraries remain available between code executions. You can write and execute code incrementally, inspect intermediate results, and build upon previous computations."
-
-        # Create the messages for the API
-        if not self.conversation_history[:-1]:  # If this is the first message
-            messages = [
-                {"role": "system", "content": system_content},
-                {"role": "user", "content": query},
-            ]
-        else:
-            messages = [{"role": "system", "content": system_content}] + self.conversation_history
-
-        completion = completions_with_backoff(
-            client=self.client,
-            model=self.model,
-            messages=messages,
-            seed=0,  # temperature=0
-        )
-        self.conversation_history.append({"role": "user", "content": query})
-        self.conversation_history.append(
-            {"role": "assistant", "content": completion.choices[0].message.content}
+            api_key=api_key,
+            base_url=base_url,
         )
 
-        return completion.choices[0].message.content
+    def get_completion_kwargs(self):
+        return {"seed": 0}  # temperature=0
 
 
 class RPCChatbot(Chatbot):
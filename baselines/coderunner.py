@@ -3,12 +3,54 @@ import time
 import docker
 import requests
 import base64
+import hashlib
+import tempfile
 from jupyter_client import BlockingKernelClient
 from queue import Empty
 
 
+# Size of the chunks used to stream files to and from the container
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """Compute the SHA-256 checksum of a file without loading it into memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def format_upload_result(response, container_path, sha256):
+    """Turn the response of a streamed upload (PUT /files) into a message, checking the checksum the container reports."""
+    if response.status_code != 200:
+        return f"Error: HTTP status {response.status_code}"
+    result = response.json()
+    if result["status"] != "success":
+        return f"Error: {result.get('error', 'Unknown error')}"
+    if result.get("sha256") and result["sha256"] != sha256:
+        return f"Error: Checksum mismatch after uploading {container_path}"
+    return f"File uploaded successfully to {container_path}"
+
+
+def format_execution_result(result):
+    """Turn the JSON response of the /execute endpoint into the text shown to the model."""
+    if result["status"] == "success":
+        output = result["output"]
+        error = result["error"]
+        if error:
+            return f"{output}\n{error}"
+        else:
+            return output
+    else:
+        return f"Error: {result.get('error', 'Unknown error')}"
+
+
 class CodeRunner:
-    def __init__(self, safe_exec=True, persistent=False, session_timeout=3600, worker_id=None):
+    def __init__(self, safe_exec=True, persistent=False, session_timeout=3600, worker_id=None,
+                 container_name=None, http_port=None, labels=None, data_mount=None, session=None,
+                 exec_timeout=30):
         self.client = docker.from_env()
         self.safe_exec = safe_exec
         self.persistent = persistent
@@ -21,6 +63,8 @@ class CodeRunner:
         else:
             self.name = "python-baseline"
             self.http_name = "python-baseline-http"
+        if container_name is not None:
+            self.http_name = container_name
 
         # Fixed image names (no worker ID in image names)
         self.base_image = "python-baseline"
@@ -29,7 +73,19 @@ class CodeRunner:
         self.kernel_client = None
         self.session_start_time = None
         self.connection_file_host = "/tmp/baseline/kernel-connection.json"
-        self.http_port = 8888 + (worker_id if worker_id is not None else 0)  # Use different ports for workers
+        # Use different ports for workers; a port of 0 lets Docker pick a free host port
+        if http_port is None:
+            http_port = 8888 + (worker_id if worker_id is not None else 0)
+        self.http_port = http_port
+        self.labels = labels or {}
+        # Host folder bind-mounted read-only at the same path in the persistent container
+        self.data_mount = os.path.abspath(data_mount) if data_mount else None
+        # Named session of the container server used for code execution (None for the default session)
+        self.session = session
+        # Time limit of an execution, enforced by the container server (None: no limit)
+        self.exec_timeout = exec_timeout
+        # Datasets parsed ahead of time in the sessions of the persistent container
+        self.preloaded_datasets = set()
         self.http_container = None
         self.http_url = None
         
@@ -57,11 +113,17 @@ class CodeRunner:
         try:
             print(f"Creating container '{self.http_name}' with image: {self.http_image}")
             
+            volumes = {}
+            if self.data_mount:
+                volumes[self.data_mount] = {"bind": self.data_mount, "mode": "ro"}
+            
             container = self.client.containers.run(
                 self.http_image,  # Use the fixed image name
                 detach=True,
                 name=self.http_name,  # Use worker-specific container name
-                ports={'8888/tcp': self.http_port},  # Use worker-specific port
+                ports={'8888/tcp': self.http_port or None},  # Use worker-specific port
+                labels=self.labels,
+                volumes=volumes,
                 remove=False
             )
             
@@ -71,7 +133,7 @@ class CodeRunner:
             # Wait for the HTTP server to start
             max_wait = 30  # seconds
             start_time = time.time()
-            self.http_url = f"http://localhost:{self.http_port}"
+            self.http_url = f"http://localhost:{self.get_host_port()}"
             
             print(f"Waiting for HTTP server to start at {self.http_url}...")
             
@@ -103,12 +165,29 @@ class CodeRunner:
             self.delete_container(self.http_name)
             return False
             
+    def get_host_port(self):
+        """Get the host port mapped to the HTTP server of the persistent container."""
+        if self.http_port:
+            return self.http_port
+        
+        # Docker assigned the port, so look it up on the running container
+        self.http_container.reload()
+        return int(self.http_container.ports['8888/tcp'][0]['HostPort'])
+            
+    def is_mounted(self, path):
+        """Check if a host file is available at the same path in the container through the data mount."""
+        if not self.data_mount:
+            return False
+        path = os.path.abspath(path)
+        return os.path.commonpath([path, self.data_mount]) == self.data_mount
+            
     def stop_persistent_container(self):
         """Stop the persistent container."""
         self.delete_container(self.http_name)
         self.http_container = None
         self.http_url = None
         self.session_start_time = None
+        self.preloaded_datasets = set()
                 
     def is_container_running(self):
         """Check if the persistent container is running."""
@@ -128,6 +207,78 @@ class CodeRunner:
             
         return (time.time() - self.session_start_time) > self.session_timeout
         
+    def session_payload(self, payload):
+        """Add the name of the session to the payload of a request, if a named session is used."""
+        if self.session is not None:
+            payload["session"] = self.session
+        return payload
+
+    def execute_payload(self, code):
+        """Build the payload of an /execute request and the HTTP timeout that goes with it."""
+        payload = self.session_payload({"code": code, "timeout": self.exec_timeout})
+        # Leave the server time to cancel the execution and report the timeout
+        http_timeout = None if self.exec_timeout is None else self.exec_timeout + 10
+        return payload, http_timeout
+
+    def create_session(self, name):
+        """
+        Create a named session (a separate interpreter namespace) in the persistent container.
+
+        Returns:
+            (bool): True if the session was created
+        """
+        try:
+            response = requests.post(f"{self.http_url}/sessions/create", json={"session": name}, timeout=10)
+            if response.status_code == 200:
+                result = response.json()
+                if result["status"] == "success":
+                    return True
+                print(f"Error creating session: {result.get('error', 'Unknown error')}")
+            return False
+        except Exception as e:
+            print(f"Error creating session: {str(e)}")
+            return False
+
+    def delete_session(self, name):
+        """Delete a named session in the persistent container. Returns True if it was deleted."""
+        try:
+            response = requests.post(f"{self.http_url}/sessions/delete", json={"session": name}, timeout=10)
+            return response.status_code == 200 and response.json()["status"] == "success"
+        except Exception as e:
+            print(f"Error deleting session: {str(e)}")
+            return False
+
+    def list_sessions(self):
+        """Get the names of the sessions of the persistent container."""
+        try:
+            response = requests.get(f"{self.http_url}/sessions", timeout=10)
+            if response.status_code == 200:
+                return response.json()["sessions"]
+            return []
+        except Exception as e:
+            print(f"Error listing sessions: {str(e)}")
+            return []
+
+    def reset_session(self):
+        """Reset the interpreter state of the persistent container without restarting it."""
+        if not self.is_container_running():
+            return False
+            
+        try:
+            response = requests.post(
+                f"{self.http_url}/reset",
+                json=self.session_payload({}),
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                return response.json()["status"] == "success"
+            return False
+                
+        except Exception as e:
+            print(f"Error resetting session: {str(e)}")
+            return False
+        
     def run_code(self, code, help=False, persistent=None):
         """Runs code in a docker container, outputs the result.
         For safe execution, use a container.
@@ -160,23 +311,15 @@ class CodeRunner:
                 
         # Execute code
         try:
+            payload, http_timeout = self.execute_payload(code)
             response = requests.post(
                 f"{self.http_url}/execute",
-                json={"code": code},
-                timeout=30
+                json=payload,
+                timeout=http_timeout
             )
             
             if response.status_code == 200:
-                result = response.json()
-                if result["status"] == "success":
-                    output = result["output"]
-                    error = result["error"]
-                    if error:
-                        return f"{output}\n{error}"
-                    else:
-                        return output
-                else:
-                    return f"Error: {result.get('error', 'Unknown error')}"
+                return format_execution_result(response.json())
             else:
                 return f"Error: HTTP status {response.status_code}"
                 
@@ -189,12 +332,12 @@ class CodeRunner:
             # create dir if it doesn't exist
             if not os.path.exists("/tmp/baseline"):
                 os.makedirs("/tmp/baseline")
-            # create a tmp file with the code
-            exec_file_path = "/tmp/baseline/tmp_{}.py".format(
-                time.strftime("%Y%m%d%H%M%S")
-            )
-            with open(exec_file_path, "w") as f:
+            # create a tmp file with the code; the name is unique, since concurrent queries (async mode)
+            # run one-off containers at the same time
+            with tempfile.NamedTemporaryFile("w", dir="/tmp/baseline", prefix="tmp_{}_".format(
+                    time.strftime("%Y%m%d%H%M%S")), suffix=".py", delete=False) as f:
                 f.write(code)
+                exec_file_path = f.name
 
             command = f"timeout 180s python {exec_file_path}"
 
@@ -236,6 +379,30 @@ class CodeRunner:
                 return str(e)
             return res
             
+    def init_session(self, dataset_path, name='df', encoding=None):
+        """Load the (already staged) dataset into the session namespace under `name` before the first turn."""
+        if not self.is_container_running():
+            return "Error: No active persistent session"
+            
+        try:
+            response = requests.post(
+                f"{self.http_url}/init",
+                json=self.session_payload({"dataset_path": dataset_path, "name": name, "encoding": encoding}),
+                timeout=130
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                if result["status"] == "success":
+                    return f"Dataset loaded as `{name}` ({result['rows']} rows, {result['seconds']:.2f}s)"
+                else:
+                    return f"Error: {result.get('error', 'Unknown error')}"
+            else:
+                return f"Error: HTTP status {response.status_code}"
+                
+        except Exception as e:
+            return f"Error initializing session: {str(e)}"
+            
     def get_variable_value(self, variable_name):
         """Get the value of a variable in the persistent environment."""
         if not self.is_container_running():
@@ -244,7 +411,7 @@ class CodeRunner:
         try:
             response = requests.post(
                 f"{self.http_url}/variable",
-                json={"name": variable_name},
+                json=self.session_payload({"name": variable_name}),
                 timeout=10
             )
             
@@ -268,7 +435,7 @@ class CodeRunner:
         try:
             response = requests.post(
                 f"{self.http_url}/variables",
-                json={},
+                json=self.session_payload({}),
                 timeout=10
             )
             
@@ -324,6 +491,32 @@ class CodeRunner:
             if container_path is None:
                 container_path = os.path.basename(local_path)
                 
+            # Stream the raw file to the container, which verifies the checksum
+            sha256 = file_sha256(local_path)
+            with open(local_path, 'rb') as f:
+                response = requests.put(
+                    f"{self.http_url}/files",
+                    params={"path": container_path},
+                    data=f,
+                    headers={
+                        "Content-Type": "application/octet-stream",
+                        "X-Content-SHA256": sha256
+                    },
+                    timeout=30
+                )
+            
+            # Containers built before streaming uploads only support the JSON endpoint
+            if response.status_code == 501:
+                return self._upload_file_json(local_path, container_path)
+            
+            return format_upload_result(response, container_path, sha256)
+                
+        except Exception as e:
+            return f"Error uploading file: {str(e)}"
+            
+    def _upload_file_json(self, local_path, container_path):
+        """Upload a file as base64 inside a JSON body (legacy endpoint)."""
+        try:
             # Read the file content
             with open(local_path, 'rb') as f:
                 file_content = f.read()
@@ -353,6 +546,59 @@ class CodeRunner:
         except Exception as e:
             return f"Error uploading file: {str(e)}"
             
+    def register_columnar_copy(self, csv_path, columnar_path, encoding='utf-8'):
+        """Make pd.read_csv(csv_path) in the container load the (already uploaded) columnar copy."""
+        if not self.is_container_running():
+            return "Error: No active persistent session"
+            
+        try:
+            response = requests.post(
+                f"{self.http_url}/register_columnar",
+                json={
+                    "csv_path": csv_path,
+                    "columnar_path": columnar_path,
+                    "encoding": encoding
+                },
+                timeout=10
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                if result["status"] == "success":
+                    return f"Columnar copy {columnar_path} registered for {csv_path}"
+                else:
+                    return f"Error: {result.get('error', 'Unknown error')}"
+            else:
+                return f"Error: HTTP status {response.status_code}"
+                
+        except Exception as e:
+            return f"Error registering columnar copy: {str(e)}"
+            
+    def preload_dataset(self, csv_path, encoding='utf-8'):
+        """Parse an (already staged) dataset once in the container, so pd.read_csv(csv_path) returns a copy of it."""
+        if not self.is_container_running():
+            return "Error: No active persistent session"
+            
+        try:
+            response = requests.post(
+                f"{self.http_url}/preload",
+                json={"csv_path": csv_path, "encoding": encoding},
+                timeout=130
+            )
+            
+            if response.status_code == 200:
+                result = response.json()
+                if result["status"] == "success":
+                    self.preloaded_datasets.add(csv_path)
+                    return f"Dataset {csv_path} preloaded ({result['rows']} rows, {result['seconds']:.2f}s)"
+                else:
+                    return f"Error: {result.get('error', 'Unknown error')}"
+            else:
+                return f"Error: HTTP status {response.status_code}"
+                
+        except Exception as e:
+            return f"Error preloading dataset: {str(e)}"
+            
     def download_file(self, container_path, local_path=None):
         """Download a file from the container to the local machine."""
         if not self.is_container_running():
@@ -363,6 +609,49 @@ class CodeRunner:
             if local_path is None:
                 local_path = os.path.basename(container_path)
                 
+            # Stream the raw file from the container
+            with requests.get(
+                f"{self.http_url}/files",
+                params={"path": container_path},
+                stream=True,
+                timeout=30
+            ) as response:
+                expected = response.headers.get("X-Content-SHA256")
+                
+                # Containers built before streaming downloads do not send a checksum
+                if response.status_code == 200 and expected is None:
+                    return self._download_file_json(container_path, local_path)
+                
+                if response.status_code != 200:
+                    try:
+                        return f"Error: {response.json().get('error', 'Unknown error')}"
+                    except ValueError:
+                        return f"Error: HTTP status {response.status_code}"
+                
+                # Create directories if they don't exist
+                os.makedirs(os.path.dirname(os.path.abspath(local_path)), exist_ok=True)
+                
+                # Write to a temporary file and only keep it if the checksum matches
+                tmp_path = f"{local_path}.part"
+                digest = hashlib.sha256()
+                with open(tmp_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                
+            if digest.hexdigest() != expected.lower():
+                os.remove(tmp_path)
+                return f"Error: Checksum mismatch for {container_path}"
+            os.replace(tmp_path, local_path)
+                        
+            return f"File downloaded successfully to {local_path}"
+                
+        except Exception as e:
+            return f"Error downloading file: {str(e)}"
+            
+    def _download_file_json(self, container_path, local_path):
+        """Download a file as base64 inside a JSON body (legacy endpoint)."""
+        try:
             # Request the file from the container
             response = requests.post(
                 f"{self.http_url}/download_file",
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_ROOT = os.path.join(PROJECT_ROOT, "data")
+DATA_FOLDERS = ("real_data", "qrdata", "synthetic_data")
+MANIFEST_NAME = "manifest.json"
+
+# Manifests loaded by this process, keyed by columnar root
+_manifests = {}
+
+
+def read_csv(path, **kwargs):
+    """
+    Reads a CSV file and returns a pandas DataFrame.
+    Args:
+        path (str): The path to the CSV file.
+        **kwargs: Extra arguments of pd.read_csv.
+    Returns:
+        pd.DataFrame: The DataFrame containing the CSV data.
+    """
+
+    try:
+        df = pd.read_csv(path, encoding='utf-8', **kwargs)
+    except UnicodeDecodeError:
+        df = pd.read_csv(path, encoding='latin1', **kwargs)
+    return df
+
+
+def read_csv_with_encoding(path):
+    """Same as read_csv, but also returns the encoding that was used."""
+    try:
+        return pd.read_csv(path, encoding='utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        return pd.read_csv(path, encoding='latin1'), 'latin1'
+
+
+def restore_missing_values(df):
+    """Arrow returns missing strings as None, while read_csv returns NaN. Use NaN like read_csv."""
+    for column in df.columns[df.dtypes == object]:
+        mask = df[column].isna()
+        if mask.any():
+            df.loc[mask, column] = np.nan
+    return df
+
+
+def get_columnar_root(data_root=None):
+    """Get the folder of the columnar mirror (CAUSCIBENCH_COLUMNAR_ROOT overrides the default)."""
+    if data_root is None and "CAUSCIBENCH_COLUMNAR_ROOT" in os.environ:
+        return os.environ["CAUSCIBENCH_COLUMNAR_ROOT"]
+    return os.path.join(data_root or DEFAULT_DATA_ROOT, "columnar")
+
+
+def load_manifest(columnar_root=None):
+    """Load the manifest of a columnar mirror, or an empty one if the mirror was not built."""
+    columnar_root = columnar_root or get_columnar_root()
+    manifest_path = os.path.join(columnar_root, MANIFEST_NAME)
+    if columnar_root not in _manifests:
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as f:
+                _manifests[columnar_root] = json.load(f)
+        else:
+            _manifests[columnar_root] = {"files": {}}
+    return _manifests[columnar_root]
+
+
+def convert_file(csv_path, columnar_path, compression="zstd"):
+    """
+    Convert one CSV file to a compressed Parquet file.
+
+    The conversion is only kept if reading the Parquet file back gives exactly the DataFrame
+    that read_csv returns, so the columnar copy can always be used in place of the CSV.
+
+    Args:
+        csv_path (str): The path to the CSV file
+        columnar_path (str): The path of the Parquet file to write
+        compression (str): The Parquet compression codec
+
+    Returns:
+        (dict): The manifest entry of the file
+    """
+
+    stat = os.stat(csv_path)
+    entry = {"csv_size": stat.st_size, "csv_mtime_ns": stat.st_mtime_ns}
+    start = time.time()
+    try:
+        df, encoding = read_csv_with_encoding(csv_path)
+        os.makedirs(os.path.dirname(columnar_path), exist_ok=True)
+        df.to_parquet(columnar_path, index=False, compression=compression)
+        restored = read_columnar(columnar_path)
+        if not restored.equals(df) or not restored.dtypes.equals(df.dtypes):
+            os.remove(columnar_path)
+            entry["error"] = "Columnar copy does not round-trip to the same DataFrame"
+            return entry
+    except Exception as e:
+        if os.path.exists(columnar_path):
+            os.remove(columnar_path)
+        entry["error"] = f"{type(e).__name__}: {e}"
+        return entry
+
+    entry.update({
+        "encoding": encoding,
+        "rows": len(df),
+        "columns": len(df.columns),
+        "columnar_size": os.path.getsize(columnar_path),
+        "convert_seconds": time.time() - start,
+    })
+    return entry
+
+
+def build_columnar_mirror(data_root=None, folders=DATA_FOLDERS, num_workers=1, force=False):
+    """
+    Convert every benchmark dataset to Parquet and write the manifest of the mirror.
+    Files that did not change since the last build are skipped.
+
+    Args:
+        data_root (str, optional): The benchmark data folder. Defaults to the data folder of the repository.
+        folders (tuple): The dataset folders to convert, relative to data_root
+        num_workers (int): Number of processes used for the conversion
+        force (bool): Convert all files, even if they did not change
+
+    Returns:
+        (dict): The manifest
+    """
+
+    data_root = data_root or DEFAULT_DATA_ROOT
+    columnar_root = get_columnar_root(data_root)
+    manifest_path = os.path.join(columnar_root, MANIFEST_NAME)
+    manifest = {"files": {}}
+    if os.path.exists(manifest_path) and not force:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+
+    jobs = {}
+    for folder in folders:
+        folder_path = os.path.join(data_root, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for name in sorted(os.listdir(folder_path)):
+            if not name.endswith(".csv"):
+                continue
+            relative_path = f"{folder}/{name}"
+            csv_path = os.path.join(data_root, relative_path)
+            stat = os.stat(csv_path)
+            entry = manifest["files"].get(relative_path)
+            if entry and entry["csv_size"] == stat.st_size and entry["csv_mtime_ns"] == stat.st_mtime_ns:
+                continue
+            columnar_path = os.path.join(columnar_root, folder, name[:-len(".csv")] + ".parquet")
+            jobs[relative_path] = (csv_path, columnar_path)
+
+    print(f"Converting {len(jobs)} datasets to Parquet in {columnar_root}...")
+    with ProcessPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        futures = {key: executor.submit(convert_file, *paths) for key, paths in jobs.items()}
+        for relative_path, future in futures.items():
+            entry = future.result()
+            if "error" in entry:
+                print(f"  {relative_path}: kept as CSV ({entry['error']})")
+            else:
+                entry["columnar_path"] = os.path.relpath(jobs[relative_path][1], columnar_root)
+            manifest["files"][relative_path] = entry
+
+    os.makedirs(columnar_root, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    _manifests.pop(columnar_root, None)
+    return manifest
+
+
+def find_columnar_copy(csv_path, columnar_root=None):
+    """
+    Find the up-to-date columnar copy of a dataset.
+
+    Args:
+        csv_path (str): The path to the CSV file, inside one of the benchmark data folders
+        columnar_root (str, optional): The folder of the columnar mirror
+
+    Returns:
+        (dict): The absolute `path` of the Parquet file and the `encoding` of the CSV file,
+                or None if there is no copy or the CSV file changed since the mirror was built
+    """
+
+    columnar_root = columnar_root or get_columnar_root()
+    manifest = load_manifest(columnar_root)
+    relative_path = f"{os.path.basename(os.path.dirname(csv_path))}/{os.path.basename(csv_path)}"
+    entry = manifest["files"].get(relative_path)
+    if not entry or "columnar_path" not in entry:
+        return None
+    try:
+        stat = os.stat(csv_path)
+    except OSError:
+        return None
+    if entry["csv_size"] != stat.st_size or entry["csv_mtime_ns"] != stat.st_mtime_ns:
+        return None
+    path = os.path.abspath(os.path.join(columnar_root, entry["columnar_path"]))
+    if not os.path.exists(path):
+        return None
+    return {"path": path, "encoding": entry["encoding"]}
+
+
+def load_dataset(path, **kwargs):
+    """
+    Load a dataset from its columnar copy if available, otherwise from the CSV file.
+
+    Args:
+        path (str): The path to the CSV file
+        **kwargs: Extra arguments of pd.read_csv, used when the dataset is read from the CSV file
+
+    Returns:
+        pd.DataFrame: The same DataFrame that read_csv returns
+    """
+
+    return load_copy_or_csv(path, find_columnar_copy(path), **kwargs)
+
+
+def read_columnar(columnar_path):
+    """Read a columnar copy, with NaN for missing strings like read_csv."""
+    return restore_missing_values(pd.read_parquet(columnar_path))
+
+
+def load_copy_or_csv(csv_path, copy, read_csv=read_csv, warn=True, **kwargs):
+    """
+    Load a dataset from a known columnar copy, falling back to the CSV file if there is none or it cannot be read.
+    Also used by the sandbox server (kernel_http.py), which ships with a copy of this module.
+
+    Args:
+        csv_path (str): The path to the CSV file
+        copy (dict): The columnar copy, as returned by find_columnar_copy, or None
+        read_csv (callable): The function that reads the CSV file
+        warn (bool): Print a warning when the columnar copy cannot be read
+        **kwargs: Extra arguments of read_csv
+
+    Returns:
+        pd.DataFrame: The same DataFrame that read_csv returns
+    """
+
+    if copy is not None:
+        try:
+            return read_columnar(copy["path"])
+        except Exception as e:
+            if warn:
+                print(f"Warning: Could not read columnar copy of {csv_path}, falling back to CSV: {e}")
+    return read_csv(csv_path, **kwargs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the columnar (Parquet) mirror of the benchmark datasets")
+    parser.add_argument("--data-root", type=str, default=DEFAULT_DATA_ROOT,
+                        help="Path to the benchmark data folder (default: data)")
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count(),
+                        help="Number of processes used for the conversion")
+    parser.add_argument("--force", action=argparse.BooleanOptionalAction,
+                        help="Convert all files, even if they did not change since the last build")
+    args = parser.parse_args()
+
+    manifest = build_columnar_mirror(args.data_root, num_workers=args.num_workers, force=args.force)
+    converted = [entry for entry in manifest["files"].values() if "columnar_path" in entry]
+    csv_size = sum(entry["csv_size"] for entry in converted)
+    columnar_size = sum(entry["columnar_size"] for entry in converted)
+    print(f"{len(converted)}/{len(manifest['files'])} datasets mirrored "
+          f"({csv_size / 1e6:.1f} MB of CSV -> {columnar_size / 1e6:.1f} MB of Parquet)")
@@ -0,0 +1,177 @@
+import os
+import time
+import docker
+import threading
+
+from .coderunner import CodeRunner
+
+
+# Label attached to every pooled container so leftovers can be found and removed
+POOL_LABEL = "causcibench.pool"
+
+
+class ContainerPool:
+    """A pool of warm persistent containers that are reused across queries.
+
+    Containers are started ahead of time and handed out with `checkout`. When a query
+    is done, `checkin` resets the interpreter state of the container (fresh globals)
+    instead of deleting it, so container startup is removed from the per-query path.
+    Datasets preloaded in a container survive the reset, so `checkout` prefers a container
+    that already holds the dataset of the query. The pool can be shared between threads.
+    """
+
+    def __init__(self, size=1, session_timeout=3600, pool_id=None, runner_kwargs=None):
+        self.size = max(1, size)
+        self.session_timeout = session_timeout
+        self.pool_id = pool_id or str(os.getpid())
+        self.runner_kwargs = runner_kwargs or {}
+        self.idle = []
+        self.busy = []
+        self.num_created = 0
+        self.lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "resets": 0,
+            "reset_failures": 0,
+            "recycled": 0,
+            "affinity_hits": 0,
+            "reset_seconds_total": 0.0,
+            "reset_seconds_max": 0.0,
+            "startup_seconds_total": 0.0,
+        }
+
+    def _new_runner(self):
+        """Create and start a new pooled container. Returns None if it could not be started."""
+        with self.lock:
+            slot = self.num_created
+            self.num_created += 1
+        runner = CodeRunner(
+            persistent=True,
+            session_timeout=self.session_timeout,
+            container_name=f"python-baseline-http-pool-{os.getpid()}-{slot}",
+            http_port=0,
+            labels={POOL_LABEL: self.pool_id},
+            **self.runner_kwargs,
+        )
+        start = time.time()
+        started = runner.start_persistent_container()
+        with self.lock:
+            self.counters["startup_seconds_total"] += time.time() - start
+        if not started:
+            return None
+        return runner
+
+    def warm_up(self):
+        """Start containers until `size` warm containers are available."""
+        while len(self.idle) + len(self.busy) < self.size:
+            runner = self._new_runner()
+            if runner is None:
+                print(f"Pool {self.pool_id}: Failed to start a warm container.")
+                break
+            with self.lock:
+                self.idle.append(runner)
+        return len(self.idle)
+
+    def _pop_idle(self, dataset_path=None):
+        """Take an idle container, preferably one that has the dataset preloaded. Call with the lock held."""
+        for i in reversed(range(len(self.idle))):
+            if dataset_path is not None and dataset_path in self.idle[i].preloaded_datasets:
+                self.counters["affinity_hits"] += 1
+                return self.idle.pop(i)
+        return self.idle.pop()
+
+    def checkout(self, dataset_path=None):
+        """
+        Hand out a warm container, starting a new one if none is available.
+
+        Args:
+            dataset_path (str, optional): Dataset of the query, to prefer a container that has it preloaded
+
+        Returns:
+            (CodeRunner, dict): The container (None if it could not be started) and the checkout
+                                information (pool hit and time spent waiting for the container)
+        """
+        start = time.time()
+        runner = None
+        while runner is None:
+            with self.lock:
+                if not self.idle:
+                    break
+                candidate = self._pop_idle(dataset_path)
+            if candidate.is_container_running() and not candidate.check_session_timeout():
+                runner = candidate
+            else:
+                # Dead or expired containers are replaced instead of handed out
+                candidate.stop_persistent_container()
+                with self.lock:
+                    self.counters["recycled"] += 1
+
+        hit = runner is not None
+        with self.lock:
+            self.counters["hits" if hit else "misses"] += 1
+        if not hit:
+            runner = self._new_runner()
+
+        if runner is not None:
+            with self.lock:
+                self.busy.append(runner)
+        return runner, {"hit": hit, "checkout_seconds": time.time() - start}
+
+    def checkin(self, runner):
+        """Reset a container and return it to the pool. Returns the reset latency in seconds."""
+        with self.lock:
+            if runner in self.busy:
+                self.busy.remove(runner)
+
+        start = time.time()
+        reset_ok = runner.reset_session()
+        reset_seconds = time.time() - start
+
+        with self.lock:
+            if reset_ok:
+                self.counters["resets"] += 1
+                self.counters["reset_seconds_total"] += reset_seconds
+                self.counters["reset_seconds_max"] = max(self.counters["reset_seconds_max"], reset_seconds)
+            else:
+                self.counters["reset_failures"] += 1
+
+            keep = reset_ok and len(self.idle) + len(self.busy) < self.size
+            if keep:
+                self.idle.append(runner)
+        if not keep:
+            runner.stop_persistent_container()
+        return reset_seconds
+
+    def stats(self):
+        """Get the pool hit/miss and reset latency statistics."""
+        with self.lock:
+            stats = dict(self.counters)
+        checkouts = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / checkouts if checkouts else 0.0
+        stats["reset_seconds_mean"] = (stats["reset_seconds_total"] / stats["resets"]
+                                       if stats["resets"] else 0.0)
+        stats["idle"] = len(self.idle)
+        stats["busy"] = len(self.busy)
+        return stats
+
+    def shutdown(self):
+        """Stop all containers owned by the pool."""
+        with self.lock:
+            runners = self.idle + self.busy
+            self.idle = []
+            self.busy = []
+        for runner in runners:
+            runner.stop_persistent_container()
+
+
+def remove_pool_containers(pool_id):
+    """Remove every container started by the pools of a run (e.g. after the workers exited)."""
+    client = docker.from_env()
+    containers = client.containers.list(all=True, filters={"label": f"{POOL_LABEL}={pool_id}"})
+    for container in containers:
+        try:
+            container.remove(force=True)
+        except Exception as e:
+            print(f"Warning: Could not remove container {container.name}: {e}")
+    return len(containers)
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+
+from .columnar import load_dataset
+
+# Bump when the content of a profile changes, so stale cache entries are ignored
+PROFILE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 ".cache", "dataset_profiles")
+
+# Profiles computed or loaded by this process, keyed like the on-disk cache
+_memory_cache = {}
+
+
+def get_cache_dir():
+    """Get the directory of the on-disk profile cache (CAUSCIBENCH_PROFILE_CACHE overrides the default)."""
+    return os.environ.get("CAUSCIBENCH_PROFILE_CACHE", DEFAULT_CACHE_DIR)
+
+
+def get_profile_key(path):
+    """
+    Build the cache key of a dataset profile from the file path, modification time and size.
+
+    Args:
+        path (str): The path to the dataset
+
+    Returns:
+        (str): A hex digest that changes whenever the file is modified
+    """
+
+    stat = os.stat(path)
+    content = f"{os.path.abspath(path)}|{stat.st_mtime_ns}|{stat.st_size}|{PROFILE_VERSION}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def compute_profile(df):
+    """
+    Precompute the summary blocks of a dataset that are embedded in the prompts.
+
+    Args:
+        df (pd.DataFrame): The dataset
+
+    Returns:
+        (dict): The rendered summary blocks
+    """
+
+    return {
+        "describe": str(df.describe()),
+        "dtypes": str(df.dtypes),
+        "head": str(df.head()),
+        "head10": str(df.head(10)),
+        "cov": str(df.cov(numeric_only=True) if len(df.columns) < 10 else "Too many columns to compute covariance"),
+        "nulls": str(df.isnull().sum(axis=0)),
+        "num_rows": len(df),
+        "num_columns": len(df.columns),
+    }
+
+
+def get_dataset_profile(path):
+    """
+    Get the profile of a dataset, computing it only if the file changed since it was cached.
+
+    Args:
+        path (str): The path to the dataset
+
+    Returns:
+        (dict): The rendered summary blocks (see compute_profile)
+    """
+
+    key = get_profile_key(path)
+    if key in _memory_cache:
+        return _memory_cache[key]
+
+    cache_file = os.path.join(get_cache_dir(), key[:2], f"{key}.json")
+    profile = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, "r") as f:
+                profile = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            profile = None
+
+    if profile is None:
+        profile = compute_profile(load_dataset(path))
+
+        # Write to a temporary file first so concurrent workers never read a partial profile
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(profile, f)
+        os.replace(tmp_file, cache_file)
+
+    _memory_cache[key] = profile
+    return profile
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the dataset profiles used in the prompts")
+    parser.add_argument("paths", nargs="+", help="Dataset files or folders containing CSV files")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".csv"))
+        else:
+            files = [path]
+        for file in files:
+            try:
+                get_dataset_profile(file)
+                print(f"Profiled {file}")
+            except Exception as e:
+                print(f"Error profiling {file}: {e}", file=sys.stderr)
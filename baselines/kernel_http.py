@@ -13,11 +13,23 @@ import signal
 import socket
 import traceback
 import base64
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import gc
+import hashlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 from io import StringIO
-from contextlib import redirect_stdout, redirect_stderr
+from collections import OrderedDict
+from contextlib import contextmanager, redirect_stdout, redirect_stderr
 import argparse
+import atexit
 import threading
+import multiprocessing
+
+# Shared with the benchmark, which copies columnar.py next to this script in the image
+try:
+    from .columnar import load_copy_or_csv
+except ImportError:
+    from columnar import load_copy_or_csv
 
 # Optional IPython kernel support
 try:
@@ -26,16 +38,164 @@ try:
 except ImportError:
     KERNEL_AVAILABLE = False
 
+# Size of the chunks used to stream files to and from disk
+CHUNK_SIZE = 1024 * 1024
+
+# Session used by requests that do not name one
+DEFAULT_SESSION = "default"
+
+# Endpoints that run in the namespace of a session
+SESSION_ENDPOINTS = ('/execute', '/reset', '/variables', '/variable', '/init')
+
+# Time limit of an execution in seconds if the request does not set one (None: no limit)
+default_exec_timeout = None
+
+# Time limit of the other session commands (reset, variables)
+COMMAND_TIMEOUT = 10
+
 # Global state dictionary to store variables
 global_state = {}
 kernel_app = None
 kernel_thread = None
 
+# Columnar (Parquet) copies of datasets, keyed by the absolute path of the CSV file
+columnar_copies = {}
+original_read_csv = None
+
+# Datasets parsed ahead of time, keyed by the absolute path of the CSV file (least recently used first)
+preloaded_frames = OrderedDict()
+MAX_PRELOADED_FRAMES = 4
+
+# Time limit of preloading or loading a dataset in a session
+PRELOAD_TIMEOUT = 120
+
+
+def read_csv_columnar(filepath_or_buffer, *args, **kwargs):
+    """Drop-in replacement of pandas.read_csv that serves registered datasets without parsing the CSV file.
+
+    Only plain calls (a path and optionally the encoding the CSV file was read with) are served:
+    preloaded datasets with a copy of the parsed frame, so changes made by one query never reach
+    the next, and other registered datasets from their columnar copy. Any other option is passed
+    on to the original read_csv.
+    """
+    if not args and set(kwargs) <= {'encoding'} and isinstance(filepath_or_buffer, (str, os.PathLike)):
+        path = os.path.abspath(os.fspath(filepath_or_buffer))
+        encoding = kwargs.get('encoding', 'utf-8')
+        frame = preloaded_frames.get(path)
+        if frame is not None and encoding in (frame['encoding'], None):
+            return frame['df'].copy()
+        copy = columnar_copies.get(path)
+        if copy is not None and encoding in (copy['encoding'], None):
+            return load_copy_or_csv(filepath_or_buffer, copy, original_read_csv, warn=False, **kwargs)
+    return original_read_csv(filepath_or_buffer, *args, **kwargs)
+
+
+def patch_read_csv():
+    """Replace pandas.read_csv with read_csv_columnar (once)."""
+    global original_read_csv
+    import pandas as pd
+
+    if original_read_csv is None:
+        original_read_csv = pd.read_csv
+        pd.read_csv = read_csv_columnar
+
+
+def register_columnar_copy(csv_path, columnar_path, encoding):
+    """Serve read_csv calls on csv_path from columnar_path, patching pandas on first use."""
+    patch_read_csv()
+    columnar_copies[os.path.abspath(csv_path)] = {'path': columnar_path, 'encoding': encoding}
+
+
+def preload_dataset(csv_path, encoding='utf-8'):
+    """
+    Parse a dataset once and serve plain read_csv calls on it from the parsed frame.
+
+    The frame survives session resets, so queries on the same dataset only parse it once per
+    session. Only the MAX_PRELOADED_FRAMES most recently preloaded datasets are kept.
+
+    Returns:
+        (dict): The number of rows and the seconds spent loading (0 if it was already preloaded)
+    """
+    patch_read_csv()
+    path = os.path.abspath(csv_path)
+    start = time.time()
+    if path not in preloaded_frames:
+        df = load_copy_or_csv(path, columnar_copies.get(path), original_read_csv, warn=False, encoding=encoding)
+        preloaded_frames[path] = {'df': df, 'encoding': encoding}
+    preloaded_frames.move_to_end(path)
+    while len(preloaded_frames) > MAX_PRELOADED_FRAMES:
+        preloaded_frames.popitem(last=False)
+    return {"rows": len(preloaded_frames[path]['df']), "seconds": time.time() - start}
+
+class ThreadLocalStream:
+    """A stream that writes to the capture buffer of the current thread, if any, or to the wrapped stream.
+
+    redirect_stdout swaps sys.stdout for the whole process, so output of code running
+    concurrently in different sessions would get mixed up.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def _target(self):
+        buffer = getattr(self.local, 'buffer', None)
+        return self.stream if buffer is None else buffer
+
+    def write(self, text):
+        return self._target().write(text)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    @contextmanager
+    def capture(self, buffer):
+        self.local.buffer = buffer
+        try:
+            yield
+        finally:
+            self.local.buffer = None
+
+
+def install_thread_local_streams():
+    """Replace sys.stdout and sys.stderr so that every request thread can capture its own output."""
+    if not isinstance(sys.stdout, ThreadLocalStream):
+        sys.stdout = ThreadLocalStream(sys.stdout)
+    if not isinstance(sys.stderr, ThreadLocalStream):
+        sys.stderr = ThreadLocalStream(sys.stderr)
+
+
+@contextmanager
+def capture_output(stdout, stderr):
+    """Capture the output of the current thread, or of the whole process if the streams were not installed."""
+    if isinstance(sys.stdout, ThreadLocalStream) and isinstance(sys.stderr, ThreadLocalStream):
+        with sys.stdout.capture(stdout), sys.stderr.capture(stderr):
+            yield
+    else:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            yield
+
 class CodeExecutor:
     """Class to execute Python code and capture output."""
     
     def __init__(self):
         self.globals = {'__builtins__': __builtins__}
+        self.initial_cwd = os.getcwd()
+        # Code of one session runs one request at a time
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """Discard all user-defined state and start from a fresh namespace."""
+        with self.lock:
+            self.globals = {'__builtins__': __builtins__}
+            try:
+                os.chdir(self.initial_cwd)
+            except OSError:
+                pass
+        gc.collect()
         
     def execute(self, code):
         """Execute Python code and return the output."""
@@ -43,7 +203,7 @@ class CodeExecutor:
         stderr = StringIO()
         
         try:
-            with redirect_stdout(stdout), redirect_stderr(stderr):
+            with self.lock, capture_output(stdout, stderr):
                 exec(code, self.globals)
             output = stdout.getvalue()
             error = stderr.getvalue()
@@ -60,6 +220,20 @@ class CodeExecutor:
                 "error": error
             }
     
+    def load_dataframe(self, csv_path, name='df', encoding=None):
+        """Load a dataset into the namespace under the given name, e.g. the `df` that prompts refer to."""
+        import pandas as pd
+
+        start = time.time()
+        with self.lock:
+            # Goes through the patched read_csv, so preloaded and columnar copies are used when available
+            try:
+                df = pd.read_csv(csv_path, encoding=encoding or 'utf-8')
+            except UnicodeDecodeError:
+                df = pd.read_csv(csv_path, encoding='latin1')
+            self.globals[name] = df
+        return {"name": name, "rows": len(df), "seconds": time.time() - start}
+
     def get_variables(self):
         """Get a list of defined variables."""
         import inspect
@@ -122,8 +296,229 @@ class CodeExecutor:
         else:
             return f"Variable '{name}' not found or not accessible"
 
-# Create a code executor
-executor = CodeExecutor()
+class SessionTimeout(Exception):
+    """The session process did not answer within the time limit and was restarted."""
+
+
+class SessionCrashed(Exception):
+    """The session process exited while handling a command and was restarted."""
+
+
+def session_worker(conn, columnar, preloads):
+    """Serve the commands of one session in a child process until the parent closes the pipe.
+
+    The child starts from the forkserver, not from the server process, so it first restores the
+    columnar copies and preloaded datasets it is given and then reports that it is ready.
+    """
+    for csv_path, copy in columnar.items():
+        register_columnar_copy(csv_path, copy['path'], copy['encoding'])
+    restored = []
+    for csv_path, encoding in preloads.items():
+        try:
+            preload_dataset(csv_path, encoding)
+            restored.append(csv_path)
+        except Exception as e:
+            print(f"Could not restore preloaded dataset {csv_path}: {e}", file=sys.stderr)
+    conn.send(restored)
+
+    executor = CodeExecutor()
+    while True:
+        try:
+            command, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        try:
+            if command == 'execute':
+                result = executor.execute(*args)
+            elif command == 'reset':
+                executor.reset()
+                result = None
+            elif command == 'variables':
+                result = executor.get_variables()
+            elif command == 'variable':
+                result = executor.get_variable(*args)
+            elif command == 'register_columnar':
+                register_columnar_copy(*args)
+                result = None
+            elif command == 'preload':
+                result = preload_dataset(*args)
+            elif command == 'load_dataframe':
+                result = executor.load_dataframe(*args)
+            else:
+                result = {"status": "error", "error": f"Unknown command: {command}"}
+        except Exception as e:
+            result = {"status": "error", "error": f"{type(e).__name__}: {str(e)}"}
+        try:
+            conn.send(result)
+        except Exception:
+            conn.send(str(result))
+
+
+class SessionProcess:
+    """A session whose CodeExecutor runs in a child process.
+
+    Running code can then be cancelled for real: if it exceeds its time limit, the child
+    process is killed and replaced by a fresh one, instead of leaving the code running in
+    the server after the client gave up. The namespace of the session is lost in that case,
+    but the columnar copies and preloaded datasets are restored.
+
+    Child processes are started from a forkserver rather than forked from the server, which
+    runs request handler threads (forking a threaded process can deadlock on locks held by
+    other threads at the time of the fork).
+    """
+
+    def __init__(self):
+        # Commands of one session are handled one at a time
+        self.lock = threading.Lock()
+        self.restarts = 0
+        self.stopped = False
+        # Datasets preloaded in this session, restored after a restart (least recently used first)
+        self.preloads = OrderedDict()
+        self._start()
+
+    def _start(self, restore=True):
+        context = multiprocessing.get_context('forkserver')
+        self.conn, child_conn = context.Pipe()
+        preloads = dict(self.preloads) if restore else {}
+        # Not a daemon process, so that the code of the session can start processes itself
+        self.process = context.Process(target=session_worker, args=(child_conn, dict(columnar_copies), preloads))
+        self.process.start()
+        child_conn.close()
+        try:
+            if self.conn.poll(PRELOAD_TIMEOUT):
+                self.conn.recv()
+                return
+        except (EOFError, OSError):
+            pass
+        if restore:
+            # Start without the preloaded datasets rather than without a session
+            self._kill()
+            self._start(restore=False)
+
+    def _kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def _restart(self):
+        self._kill()
+        self.restarts += 1
+        self._start()
+
+    def stop(self):
+        """Kill the session process for good (also cancels a running command)."""
+        self.stopped = True
+        self._kill()
+
+    def call(self, command, *args, timeout=COMMAND_TIMEOUT):
+        """Run a command in the session process and return its result."""
+        with self.lock:
+            if self.stopped:
+                raise SessionCrashed("The session was deleted")
+            if not self.process.is_alive():
+                self._restart()
+            self.conn.send((command, args))
+            try:
+                if self.conn.poll(timeout):
+                    return self.conn.recv()
+            except (EOFError, OSError):
+                if self.stopped:
+                    raise SessionCrashed("The session was deleted")
+                self.process.join(1)
+                exitcode = self.process.exitcode
+                self._restart()
+                raise SessionCrashed(f"Session process exited unexpectedly (exit code {exitcode})")
+            self._restart()
+            raise SessionTimeout(f"No answer within {timeout} seconds")
+
+    def execute(self, code, timeout=None):
+        """Execute Python code in the session, killing it if it runs longer than timeout seconds."""
+        start = time.time()
+        try:
+            result = self.call('execute', code, timeout=timeout)
+        except SessionTimeout:
+            return {
+                "status": "timeout",
+                "output": "",
+                "error": f"Execution timed out after {timeout} seconds. The execution was cancelled "
+                         f"and the session was restarted, so all variables were lost.",
+                "timeout_seconds": timeout,
+                "elapsed_seconds": time.time() - start
+            }
+        except SessionCrashed as e:
+            return {
+                "status": "error",
+                "output": "",
+                "error": f"{str(e)}. The session was restarted, so all variables were lost."
+            }
+        return result
+
+    def reset(self):
+        """Discard all user-defined state of the session."""
+        try:
+            self.call('reset')
+        except (SessionTimeout, SessionCrashed):
+            # The restarted process starts from a fresh namespace anyway
+            pass
+
+    def get_variables(self):
+        return self.call('variables')
+
+    def get_variable(self, name):
+        return self.call('variable', name)
+
+    def preload(self, csv_path, encoding='utf-8'):
+        """Preload a dataset in the session and remember it, so a restarted session preloads it again."""
+        result = self.call('preload', csv_path, encoding, timeout=PRELOAD_TIMEOUT)
+        if result.get('status') != 'error':
+            self.preloads[os.path.abspath(csv_path)] = encoding
+            self.preloads.move_to_end(os.path.abspath(csv_path))
+            while len(self.preloads) > MAX_PRELOADED_FRAMES:
+                self.preloads.popitem(last=False)
+        return result
+
+    def load_dataframe(self, csv_path, name='df', encoding=None):
+        return self.call('load_dataframe', csv_path, name, encoding, timeout=PRELOAD_TIMEOUT)
+
+
+# Named sessions, each with its own interpreter namespace in its own process
+sessions = {}
+sessions_lock = threading.Lock()
+
+
+def get_session(name=None):
+    """Get the executor of a session, or None if the session does not exist."""
+    with sessions_lock:
+        return sessions.get(name or DEFAULT_SESSION)
+
+
+def create_session(name):
+    """Create a new session. Returns False if a session with this name already exists."""
+    with sessions_lock:
+        if name in sessions:
+            return False
+        sessions[name] = SessionProcess()
+        return True
+
+
+def delete_session(name):
+    """Delete a session and stop its process. Returns False if the session does not exist."""
+    with sessions_lock:
+        executor = sessions.pop(name, None)
+    if executor is None:
+        return False
+    executor.stop()
+    return True
+
+
+def stop_all_sessions():
+    """Stop the processes of all sessions."""
+    with sessions_lock:
+        running = list(sessions.values())
+        sessions.clear()
+    for session in running:
+        session.stop()
 
 class CodeHandler(BaseHTTPRequestHandler):
     """HTTP request handler for code execution."""
@@ -132,6 +527,100 @@ class CodeHandler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Content-type', content_type)
         self.end_headers()
+
+    def _send_json(self, result, status=200):
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _iter_body(self):
+        """Iterate over the request body in chunks, for both Content-Length and chunked transfer encoding."""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    # Skip the trailer section
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    return
+                remaining = size
+                while remaining > 0:
+                    chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ConnectionError("Connection closed during upload")
+                    remaining -= len(chunk)
+                    yield chunk
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining > 0:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ConnectionError("Connection closed during upload")
+                remaining -= len(chunk)
+                yield chunk
+
+    def _get_file_path(self):
+        """Get the file path of a /files?path=... request, or None for other endpoints."""
+        parsed = urlparse(self.path)
+        if parsed.path != '/files':
+            return None
+        return parse_qs(parsed.query).get('path', [''])[0]
+
+    def do_PUT(self):
+        """Handle raw binary uploads (PUT /files?path=...), streamed to disk and verified against X-Content-SHA256."""
+        file_path = self._get_file_path()
+        if not file_path:
+            self._send_json({"status": "error", "error": f"Unknown endpoint: {self.path}"}, status=404)
+            return
+
+        tmp_path = f"{file_path}.part"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+            digest = hashlib.sha256()
+            size = 0
+            with open(tmp_path, 'wb') as f:
+                for chunk in self._iter_body():
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+            expected = self.headers.get('X-Content-SHA256')
+            if expected and expected.lower() != digest.hexdigest():
+                os.remove(tmp_path)
+                result = {"status": "error", "error": f"Checksum mismatch for {file_path}"}
+            else:
+                os.replace(tmp_path, file_path)
+                result = {"status": "success", "message": f"File uploaded to {file_path}",
+                          "size": size, "sha256": digest.hexdigest()}
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            result = {"status": "error", "error": f"Error uploading file: {str(e)}"}
+        self._send_json(result)
+
+    def _send_file(self, file_path):
+        """Stream a file to the client, with its checksum in the X-Content-SHA256 header."""
+        if not os.path.isfile(file_path):
+            self._send_json({"status": "error", "error": f"File not found: {file_path}"}, status=404)
+            return
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+        self.send_response(200)
+        self.send_header('Content-type', 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(file_path)))
+        self.send_header('X-Content-SHA256', digest.hexdigest())
+        self.end_headers()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                self.wfile.write(chunk)
     
     def do_POST(self):
         """Handle POST requests."""
@@ -140,16 +629,96 @@ class CodeHandler(BaseHTTPRequestHandler):
         
         try:
             data = json.loads(post_data)
+            session_name = data.get('session') or DEFAULT_SESSION
+            executor = get_session(session_name)
+            
+            if self.path in SESSION_ENDPOINTS and executor is None:
+                result = {"status": "error", "error": f"Unknown session: {session_name}"}
             
-            if self.path == '/execute':
+            elif self.path == '/execute':
                 if 'code' in data:
-                    result = executor.execute(data['code'])
+                    result = executor.execute(data['code'], timeout=data.get('timeout', default_exec_timeout))
                 else:
                     result = {"status": "error", "error": "No code provided"}
             
+            elif self.path == '/reset':
+                start = time.time()
+                executor.reset()
+                result = {"status": "success", "reset_seconds": time.time() - start}
+            
+            elif self.path == '/sessions/create':
+                if 'session' in data:
+                    if create_session(data['session']):
+                        result = {"status": "success", "session": data['session']}
+                    else:
+                        result = {"status": "error", "error": f"Session already exists: {data['session']}"}
+                else:
+                    result = {"status": "error", "error": "Session name not provided"}
+            
+            elif self.path == '/sessions/delete':
+                if session_name == DEFAULT_SESSION:
+                    result = {"status": "error", "error": "The default session cannot be deleted"}
+                elif delete_session(session_name):
+                    result = {"status": "success", "session": session_name}
+                else:
+                    result = {"status": "error", "error": f"Unknown session: {session_name}"}
+            
+            elif self.path == '/register_columnar':
+                if 'csv_path' in data and 'columnar_path' in data:
+                    try:
+                        args = (data['csv_path'], data['columnar_path'], data.get('encoding', 'utf-8'))
+                        # Register in the server, so sessions created or restarted later get the copy, and in every session
+                        register_columnar_copy(*args)
+                        with sessions_lock:
+                            running = list(sessions.values())
+                        for session in running:
+                            session.call('register_columnar', *args)
+                        result = {"status": "success"}
+                    except Exception as e:
+                        result = {"status": "error", "error": f"Error registering columnar copy: {str(e)}"}
+                else:
+                    result = {"status": "error", "error": "CSV path or columnar path not provided"}
+            
+            elif self.path == '/preload':
+                if 'csv_path' in data:
+                    try:
+                        # Every session parses the dataset once and keeps it across resets
+                        with sessions_lock:
+                            running = list(sessions.values())
+                        loaded = [session.preload(data['csv_path'], data.get('encoding', 'utf-8'))
+                                  for session in running]
+                        errors = [r['error'] for r in loaded if r.get('status') == 'error']
+                        if errors:
+                            result = {"status": "error", "error": f"Error preloading dataset: {errors[0]}"}
+                        else:
+                            result = {
+                                "status": "success",
+                                "rows": loaded[0]['rows'] if loaded else 0,
+                                "seconds": max([r['seconds'] for r in loaded], default=0.0)
+                            }
+                    except Exception as e:
+                        result = {"status": "error", "error": f"Error preloading dataset: {str(e)}"}
+                else:
+                    result = {"status": "error", "error": "CSV path not provided"}
+            
             elif self.path == '/variables':
                 result = {"status": "success", "variables": executor.get_variables()}
             
+            elif self.path == '/init':
+                # Session-init payload: load the dataset into the namespace before the first execution
+                if 'dataset_path' in data:
+                    try:
+                        loaded = executor.load_dataframe(data['dataset_path'], data.get('name', 'df'),
+                                                         data.get('encoding'))
+                        if loaded.get('status') == 'error':
+                            result = {"status": "error", "error": f"Error loading dataset: {loaded['error']}"}
+                        else:
+                            result = {"status": "success", **loaded}
+                    except Exception as e:
+                        result = {"status": "error", "error": f"Error loading dataset: {str(e)}"}
+                else:
+                    result = {"status": "error", "error": "Dataset path not provided"}
+            
             elif self.path == '/variable':
                 if 'name' in data:
                     result = {
@@ -236,13 +805,22 @@ class CodeHandler(BaseHTTPRequestHandler):
     
     def do_GET(self):
         """Handle GET requests."""
-        if self.path == '/health':
+        file_path = self._get_file_path()
+        if file_path:
+            self._send_file(file_path)
+        elif self.path == '/health':
             self._set_headers()
             self.wfile.write(json.dumps({
                 "status": "success",
                 "message": "Server is running",
-                "kernel_running": kernel_app is not None
+                "kernel_running": kernel_app is not None,
+                "sessions": len(sessions)
             }).encode('utf-8'))
+        elif self.path == '/sessions':
+            with sessions_lock:
+                names = sorted(sessions)
+            self._set_headers()
+            self.wfile.write(json.dumps({"status": "success", "sessions": names}).encode('utf-8'))
         else:
             self._set_headers()
             self.wfile.write(json.dumps({
@@ -305,8 +883,11 @@ def is_running_in_docker():
     """Check if the script is running inside a Docker container."""
     return os.path.exists('/.dockerenv')
 
-def run_server(port=8888, start_ipython_kernel=False):
+def run_server(port=8888, start_ipython_kernel=False, exec_timeout=None):
     """Run the HTTP server."""
+    global default_exec_timeout
+    default_exec_timeout = exec_timeout
+
     # Create a data directory if running in Docker
     if is_running_in_docker():
         try:
@@ -319,19 +900,30 @@ def run_server(port=8888, start_ipython_kernel=False):
         os.makedirs('data', exist_ok=True)
         print("Created local data directory for testing")
     
+    # The forkserver imports the data stack once, so that session processes start with it loaded
+    multiprocessing.set_forkserver_preload(['__main__', 'numpy', 'pandas'])
+
+    # Starts the forkserver before any other thread is started
+    create_session(DEFAULT_SESSION)
+    atexit.register(stop_all_sessions)
+    
     # Start IPython kernel if requested
     if start_ipython_kernel:
         start_kernel_thread()
     
-    # Start HTTP server
+    # Start HTTP server; every request is handled in its own thread, so health checks
+    # and other sessions stay responsive while code runs
+    install_thread_local_streams()
     server_address = ('', port)
-    httpd = HTTPServer(server_address, CodeHandler)
+    httpd = ThreadingHTTPServer(server_address, CodeHandler)
+    httpd.daemon_threads = True
     print(f"Starting HTTP server on port {port}...")
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("Shutting down server...")
         httpd.server_close()
+        stop_all_sessions()
         
         # Shutdown kernel if it was started
         if kernel_app:
@@ -343,6 +935,8 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Run a Python code execution server')
     parser.add_argument('--port', type=int, default=8888, help='Port to run the server on')
     parser.add_argument('--kernel', action='store_true', help='Start an IPython kernel')
+    parser.add_argument('--exec-timeout', type=float, default=None,
+                        help='Default time limit of an execution in seconds (requests can set their own)')
     args = parser.parse_args()
     
     # Set up signal handling for graceful shutdown
@@ -356,4 +950,4 @@ if __name__ == '__main__':
     get_ip()
     
     # Run the server
-    run_server(port=args.port, start_ipython_kernel=args.kernel) 
\ No newline at end of file
+    run_server(port=args.port, start_ipython_kernel=args.kernel, exec_timeout=args.exec_timeout) 
\ No newline at end of file
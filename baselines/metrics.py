@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import pandas as pd
+from contextlib import contextmanager
+
+# Per-query totals that are aggregated in the run report
+SUMMED_FIELDS = ["prompt_tokens", "completion_tokens", "total_tokens", "llm_seconds", "sandbox_seconds",
+                 "total_seconds"]
+AVERAGED_FIELDS = ["num_turns", "num_executions", "retries", "container_startup_seconds", "staging_seconds",
+                   "preload_seconds", "session_init_seconds", "sandbox_wait_seconds"]
+
+
+def get_usage(completion):
+    """Get the token usage of a chat completion, or None if the API did not report it."""
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+
+
+class QueryMetrics:
+    """Cost and latency measurements of answering one query.
+
+    Turns record the LLM latency and token usage of every `ask`, executions the latency of
+    every code run in the sandbox, and stages the time spent around the conversation
+    (container startup, dataset staging, loading the dataset into the session, teardown).
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.turns = []
+        self.executions = []
+        self.stages = {}
+
+    def record_turn(self, step, seconds, usage=None, cached=False, batched=False):
+        turn = {"step": step, "llm_seconds": seconds, "cached": cached}
+        if batched:
+            turn["batched"] = True
+        turn.update(usage or {})
+        self.turns.append(turn)
+
+    def record_execution(self, seconds, output):
+        self.executions.append({
+            "sandbox_seconds": seconds,
+            "output_chars": len(output or ""),
+            "error": str(output).startswith("Error"),
+        })
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of the query; repeated stages are added up."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.stages[f"{name}_seconds"] = self.stages.get(f"{name}_seconds", 0.0) + time.time() - start
+
+    def to_dict(self):
+        """Get the metrics record of the query, with totals and the per-turn details."""
+        metrics = {"num_turns": len(self.turns), "cached_turns": sum(turn["cached"] for turn in self.turns)}
+        for field in ["prompt_tokens", "completion_tokens", "total_tokens"]:
+            values = [turn[field] for turn in self.turns if turn.get(field) is not None]
+            metrics[field] = sum(values) if values else None
+        metrics["llm_seconds"] = sum(turn["llm_seconds"] for turn in self.turns)
+        metrics["num_executions"] = len(self.executions)
+        metrics["sandbox_seconds"] = sum(execution["sandbox_seconds"] for execution in self.executions)
+        metrics["retries"] = max(0, len(self.executions) - 1)
+        metrics.update(self.stages)
+        metrics["total_seconds"] = time.time() - self.start_time
+        metrics["turns"] = self.turns
+        metrics["executions"] = self.executions
+        return metrics
+
+
+def metrics_table(records):
+    """
+    Build a table with one row of metrics per query.
+
+    Args:
+        records (iterable): Result records with a `metrics` entry (records without one are skipped)
+
+    Returns:
+        pd.DataFrame: The query metrics, with the prompting strategy, model and dataset of each query
+    """
+
+    rows = []
+    for record in records:
+        metrics = record.get("metrics")
+        if not metrics:
+            continue
+        row = {key: value for key, value in metrics.items() if not isinstance(value, (list, dict))}
+        row["dataset"] = os.path.basename(record.get("dataset_path", ""))
+        row["status"] = record.get("status")
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def aggregate_metrics(table):
+    """
+    Aggregate query metrics by prompting strategy and model, and by dataset.
+
+    Args:
+        table (pd.DataFrame): The output of metrics_table
+
+    Returns:
+        (dict): The `overall` totals and the `by_prompt` and `by_dataset` tables (as lists of rows),
+                with datasets sorted by total tokens and time
+    """
+
+    if table.empty:
+        return {"overall": {}, "by_prompt": [], "by_dataset": []}
+
+    summed = [field for field in SUMMED_FIELDS if field in table]
+    averaged = [field for field in AVERAGED_FIELDS if field in table]
+
+    def aggregate(groups):
+        summary = groups[summed].sum(min_count=1)
+        summary = summary.join(groups[summed + averaged].mean().add_prefix("mean_"))
+        summary.insert(0, "queries", groups.size())
+        return summary.reset_index()
+
+    group_columns = [column for column in ["prompt", "model"] if column in table]
+    by_prompt = aggregate(table.groupby(group_columns, dropna=False)) if group_columns else pd.DataFrame()
+    by_dataset = aggregate(table.groupby("dataset")).sort_values(
+        [field for field in ["total_tokens", "total_seconds"] if field in summed], ascending=False)
+
+    overall = {"queries": len(table), "failed": int((table["status"] != "success").sum())}
+    overall.update({field: table[field].sum(min_count=1) for field in summed})
+    overall = {key: (None if pd.isna(value) else float(value) if key not in ("queries", "failed") else value)
+               for key, value in overall.items()}
+
+    return {
+        "overall": overall,
+        "by_prompt": json.loads(by_prompt.to_json(orient="records")),
+        "by_dataset": json.loads(by_dataset.to_json(orient="records")),
+    }
+
+
+def print_metrics_report(summary, top_datasets=10):
+    """Print the aggregated metrics of a run."""
+    if not summary["overall"]:
+        return
+    overall = summary["overall"]
+    print(f"\nMetrics of {overall['queries']} queries:")
+    for field in SUMMED_FIELDS:
+        if overall.get(field) is not None:
+            print(f"  {field}: {overall[field]:,.2f}")
+
+    columns = ["queries", "total_tokens", "llm_seconds", "sandbox_seconds", "mean_total_seconds", "mean_retries"]
+    if summary["by_prompt"]:
+        by_prompt = pd.DataFrame(summary["by_prompt"])
+        print("\nBy prompting strategy:")
+        print(by_prompt[[c for c in ["prompt", "model"] + columns if c in by_prompt]].to_string(index=False))
+    if summary["by_dataset"]:
+        by_dataset = pd.DataFrame(summary["by_dataset"]).head(top_datasets)
+        print(f"\nTop {len(by_dataset)} datasets by cost:")
+        print(by_dataset[[c for c in ["dataset"] + columns if c in by_dataset]].to_string(index=False))
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+A local OpenAI-compatible chat completions server for offline load and throughput tests.
+
+Replies follow a script of turns (by default: a code block that fails, a corrected code
+block, an analysis, and the final JSON summary), with configurable latency and injected
+server errors and rate limit errors. Randomness is derived from the seed and the request
+content, so a run with the same queries sees the same replies, delays and errors.
+
+Example:
+    python -m baselines.mock_llm_server --port 8000 --latency lognormal:0.0,0.5 --rate-limit-rate 0.05
+    python -m baselines.run_baselines --api openai --base-url http://localhost:8000/v1 --model mock ...
+"""
+
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Marker of the final summary prompt (see baselines.baseline.FINAL_RESULT_PROMPT)
+FINAL_MARKER = "final summary of the analysis"
+
+# Replies of the assistant turns, in order; the last one is repeated for longer conversations
+DEFAULT_TURNS = [
+    """Thought: I will start by estimating the effect with a regression.
+Action: python_repl_ast
+Action Input:
+```python
+import numpy as np
+print(undefined_effect_estimate)
+```""",
+    """The variable was not defined. Here is the corrected code:
+```python
+import numpy as np
+effect = np.round(0.05, 3)
+print("Causal effect:", effect)
+print("Standard error:", 0.01)
+```""",
+    """The estimated causal effect is 0.05 with a standard error of 0.01.
+Final Answer: The treatment increases the outcome by about 0.05.""",
+]
+
+DEFAULT_FINAL = json.dumps({
+    "method": "Linear regression with control variables",
+    "causal_effect": 0.05,
+    "standard_deviation": 0.01,
+    "treatment_variable": "treatment",
+    "rct": False,
+    "outcome_variable": "outcome",
+    "mediators": None,
+    "covariates": [],
+    "instrument_variable": None,
+    "running_variable": None,
+    "temporal_variable": None,
+    "statistical_test_results": "p < 0.05",
+    "explanation_for_model_choice": "Mock reply",
+    "regression_equation": "outcome ~ treatment",
+}, indent=2)
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution in seconds.
+
+    Args:
+        spec (str): fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, lognormal:MU,SIGMA or exponential:MEAN
+
+    Returns:
+        (callable): A function that draws a latency from a random.Random
+    """
+
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",")] if params else []
+    distributions = {
+        "fixed": (1, lambda rng, s: s),
+        "uniform": (2, lambda rng, low, high: rng.uniform(low, high)),
+        "normal": (2, lambda rng, mean, sd: max(0.0, rng.gauss(mean, sd))),
+        "lognormal": (2, lambda rng, mu, sigma: rng.lognormvariate(mu, sigma)),
+        "exponential": (1, lambda rng, mean: rng.expovariate(1 / mean) if mean > 0 else 0.0),
+    }
+    if kind not in distributions or len(values) != distributions[kind][0]:
+        raise ValueError(f"Invalid latency '{spec}', expected e.g. fixed:0.5, uniform:0.2,1.0 or lognormal:0.0,0.5")
+    draw = distributions[kind][1]
+    return lambda rng: draw(rng, *values)
+
+
+def estimate_tokens(text):
+    """Rough number of tokens of a text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+class MockLLM:
+    """The reply script and fault injection settings of the server.
+
+    Every request is identified by a hash of its model and messages; repeated requests (retries)
+    get a new attempt number, so a request that was rate limited can succeed when retried.
+    """
+
+    def __init__(self, turns=None, final=None, latency="fixed:0", seconds_per_token=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1.0, seed=0):
+        self.turns = turns or DEFAULT_TURNS
+        self.final = final or DEFAULT_FINAL
+        self.latency = parse_latency(latency)
+        self.seconds_per_token = seconds_per_token
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.attempts = {}
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "completions": 0, "errors": 0, "rate_limited": 0}
+
+    def get_rng(self, request):
+        """Get the random generator of a request, from the seed, its content and how often it was sent."""
+        digest = hashlib.sha256(json.dumps([request.get("model"), request.get("messages")],
+                                           sort_keys=True).encode("utf-8")).hexdigest()
+        with self.lock:
+            attempt = self.attempts.get(digest, 0)
+            self.attempts[digest] = attempt + 1
+        return random.Random(f"{self.seed}:{digest}:{attempt}")
+
+    def get_reply(self, messages):
+        """Get the scripted reply to the conversation so far."""
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        if FINAL_MARKER in last_user:
+            return self.final
+        turn = sum(1 for m in messages if m.get("role") == "assistant")
+        return self.turns[min(turn, len(self.turns) - 1)]
+
+    def complete(self, request):
+        """
+        Answer a chat completions request.
+
+        Returns:
+            (int, dict, dict): The HTTP status, the response body and extra response headers
+        """
+
+        rng = self.get_rng(request)
+        with self.lock:
+            self.counters["requests"] += 1
+
+        messages = request.get("messages") or []
+        if not messages:
+            return 400, {"error": {"message": "messages is required", "type": "invalid_request_error"}}, {}
+
+        # Faults are decided before the latency, like a provider that rejects requests early
+        draw = rng.random()
+        if draw < self.rate_limit_rate:
+            with self.lock:
+                self.counters["rate_limited"] += 1
+            return 429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error",
+                                   "code": "rate_limit_exceeded"}}, {"retry-after": str(self.retry_after)}
+        if draw < self.rate_limit_rate + self.error_rate:
+            with self.lock:
+                self.counters["errors"] += 1
+            return 500, {"error": {"message": "Internal server error (mock)", "type": "server_error"}}, {}
+
+        reply = self.get_reply(messages)
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        completion_tokens = estimate_tokens(reply)
+        time.sleep(self.latency(rng) + completion_tokens * self.seconds_per_token)
+
+        with self.lock:
+            self.counters["completions"] += 1
+        return 200, {
+            "id": f"chatcmpl-mock-{rng.getrandbits(48):012x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }, {}
+
+
+# Settings of the running server, set by run_server
+mock_llm = None
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """HTTP request handler of the OpenAI chat completions endpoint."""
+
+    def _send_json(self, result, status=200, headers=None):
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(content_length).decode('utf-8') or "{}")
+        except ValueError:
+            self._send_json({"error": {"message": "Invalid JSON", "type": "invalid_request_error"}}, 400)
+            return
+
+        if self.path.rstrip('/') in ('/v1/chat/completions', '/chat/completions'):
+            if request.get("stream"):
+                self._send_json({"error": {"message": "Streaming is not supported by the mock server",
+                                           "type": "invalid_request_error"}}, 400)
+                return
+            status, result, headers = mock_llm.complete(request)
+            self._send_json(result, status, headers)
+        else:
+            self._send_json({"error": {"message": f"Unknown endpoint: {self.path}", "type": "not_found"}}, 404)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/v1/models', '/models'):
+            self._send_json({"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif self.path == '/health':
+            with mock_llm.lock:
+                self._send_json({"status": "ok", **mock_llm.counters})
+        else:
+            self._send_json({"error": {"message": f"Unknown endpoint: {self.path}", "type": "not_found"}}, 404)
+
+    def log_message(self, format, *args):
+        # Access logs would dominate the output of load tests
+        pass
+
+
+def load_script(path):
+    """Load a reply script: a JSON object with the `turns` (list of replies) and optionally the `final` reply."""
+    with open(path, "r") as f:
+        script = json.load(f)
+    if not script.get("turns"):
+        raise ValueError(f"The script {path} has no turns")
+    final = script.get("final")
+    if final is not None and not isinstance(final, str):
+        final = json.dumps(final, indent=2)
+    return script["turns"], final
+
+
+def run_server(port=8000, llm=None):
+    """Run the mock server until interrupted."""
+    global mock_llm
+    mock_llm = llm or MockLLM()
+    httpd = ThreadingHTTPServer(('', port), MockLLMHandler)
+    httpd.daemon_threads = True
+    print(f"Mock LLM server listening on http://localhost:{port}/v1")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down server...")
+        httpd.server_close()
+        print(f"Served {mock_llm.counters}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a local OpenAI-compatible mock LLM server')
+    parser.add_argument('--port', type=int, default=8000, help='Port to run the server on')
+    parser.add_argument('--latency', type=str, default='fixed:0',
+                        help='Latency distribution of a reply in seconds: fixed:S, uniform:LOW,HIGH, normal:MEAN,SD, '
+                             'lognormal:MU,SIGMA or exponential:MEAN (default: fixed:0)')
+    parser.add_argument('--seconds-per-token', type=float, default=0.0,
+                        help='Extra latency per completion token, to model generation speed')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 500 server error')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with a 429 rate limit error')
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                        help='Retry-After header of rate limit errors in seconds')
+    parser.add_argument('--script', type=str, default=None,
+                        help='JSON file with the replies of the assistant turns ("turns") and the final summary '
+                             '("final"); by default the first code block fails and the second one succeeds')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the latency and fault draws')
+    args = parser.parse_args()
+
+    turns, final = load_script(args.script) if args.script else (None, None)
+    run_server(args.port, MockLLM(turns=turns, final=final, latency=args.latency,
+                                  seconds_per_token=args.seconds_per_token, error_rate=args.error_rate,
+                                  rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                                  seed=args.seed))
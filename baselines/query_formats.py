@@ -1,23 +1,14 @@
 import pandas as pd
 
-def read_csv(path):
-    """
-    Reads a CSV file and returns a pandas DataFrame.
-    Args:
-        path (str): The path to the CSV file.
-    Returns:
-        pd.DataFrame: The DataFrame containing the CSV data.
-    """
-
-    try:
-        df = pd.read_csv(path, encoding='utf-8')
-    except UnicodeDecodeError:
-        df = pd.read_csv(path, encoding='latin1')
-    return df
+from .columnar import read_csv
+from .dataset_profile import get_dataset_profile
 
 class QueryFormat:
     """A format of a query"""
 
+    # Name under which the prompt expects the dataset to be loaded in the sandbox (None: the code loads it)
+    dataframe_name = None
+
     def __init__(self, query, dataset_path, dataset_description):
         self.query = query
         self.dataset_path = dataset_path
@@ -33,10 +24,10 @@ class QueryFormat:
 class CausalQueryFormat(QueryFormat):
     def get_query_format(self, include_method_explanation=False):
         # Create a causal query based on the data and textual query
-        df = read_csv(self.dataset_path)
-        df_info = df.describe()
-        columns_and_types = df.dtypes
-        nan_per_column = df.isnull().sum(axis=0)
+        profile = get_dataset_profile(self.dataset_path)
+        df_info = profile["describe"]
+        columns_and_types = profile["dtypes"]
+        nan_per_column = profile["nulls"]
         if include_method_explanation:
             # Load prompt file relative to this module's directory
             from pathlib import Path
@@ -67,12 +58,12 @@ Here are the columns and their types:
 
 Here are the first 5 rows of the dataset:
 ```
-{df.head()}
+{profile["head"]}
 ```
 
 If there are fewer than 10 columns, here is the result of df.cov():
 ```
-{(df.cov(numeric_only=True) if len(df.columns) < 10 else "Too many columns to compute covariance")}
+{profile["cov"]}
 ```
 
 Finally, here is the output of df.isnull().sum(axis=0):
@@ -151,9 +142,9 @@ Use a single code block. If the code succeeds, do not add any new code, just pro
 class CausalCoTFormat(CausalQueryFormat):
     def get_query_format(self, include_method_explanation=False):
 
-        df = read_csv(self.dataset_path)
-        columns_and_types = df.dtypes
-        nan_per_column = df.isnull().sum(axis=0)
+        profile = get_dataset_profile(self.dataset_path)
+        columns_and_types = profile["dtypes"]
+        nan_per_column = profile["nulls"]
         if include_method_explanation:
             # Load prompt file relative to this module's directory
             from pathlib import Path
@@ -176,15 +167,15 @@ To help you understand it, here are the columns and their types:
 ```
 Here is the statistical summary of the dataset:
 ```
-{df.describe()}
+{profile["describe"]}
 ```
 Here are the first 5 rows of the dataset:
 ```
-{df.head()}
+{profile["head"]}
 ```
 If there are fewer than 10 columns, here is the result of df.cov():
 ```
-{(df.cov(numeric_only=True) if len(df.columns) < 10 else "Too many columns to compute covariance")}
+{profile["cov"]}
 ```
 Here is the output of df.isnull().sum(axis=0):
 ```
@@ -270,12 +261,11 @@ If the code succeeds, do not output any code or code blocks. Instead, provide a
 
 
 class ReActFormat(QueryFormat):
+    dataframe_name = "df"
+
     def get_query_format(self):
         # Create a ReAct query based on the data and textual query
-        df = pd.read_csv(self.dataset_path)
-        df_info = df.describe()
-        columns_and_types = df.dtypes
-        nan_per_column = df.isnull().sum(axis=0)
+        profile = get_dataset_profile(self.dataset_path)
         format = f"""
 Data Description:
 {self.dataset_description}. The dataset is located at {self.dataset_path}.
@@ -359,12 +349,13 @@ Available causal inference methods:
 
     
 class ProgramOfThoughtsFormat(QueryFormat):
+    dataframe_name = "df"
+
     def get_query_format(self):
         # Create a program of thoughts query based on the data and textual query
-        df = pd.read_csv(self.dataset_path)
-        df_info = df.describe()
-        columns_and_types = df.dtypes
-        nan_per_column = df.isnull().sum(axis=0)
+        profile = get_dataset_profile(self.dataset_path)
+        columns_and_types = profile["dtypes"]
+        nan_per_column = profile["nulls"]
         format = f"""
 You are a causal inference expert. Your goal is to generate a causality-driven answer to the user query: "{self.query}" using the provided data. 
 The description and the query can be found below. Please analyze the input information and write Python code that performs causal effect estimation. 
@@ -406,7 +397,7 @@ Here is information about the data.
 Data Description: {self.dataset_description}
 Dataset Location: {self.dataset_path}
 Columns and types: {columns_and_types}
-First 10 rows: {df.head(10)}
+First 10 rows: {profile["head10"]}
 Missing values: {nan_per_column}
 Likewise, the query is: {self.query}
 """
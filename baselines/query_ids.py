@@ -0,0 +1,57 @@
+import os
+import json
+import math
+import hashlib
+
+# Number of hex digits of a query id
+QUERY_ID_LENGTH = 16
+
+
+def _clean(value):
+    """Missing annotations are NaN in the query files; hash them as None."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return str(value).strip()
+
+
+def make_query_id(query, dataset_path, treatment_var=None, outcome_var=None):
+    """
+    Build the stable id of a benchmark query from its content.
+
+    Args:
+        query (str): The natural language query
+        dataset_path (str): The path to the dataset. Only the file name is used, so that the id
+                            does not depend on where the data folder is located.
+        treatment_var (str, optional): The annotated treatment variable
+        outcome_var (str, optional): The annotated outcome variable. Some queries of one dataset
+                                     share their text and only differ in the variables.
+
+    Returns:
+        (str): A hex digest identifying the query
+    """
+
+    content = json.dumps([query, os.path.basename(str(dataset_path)), _clean(treatment_var), _clean(outcome_var)])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:QUERY_ID_LENGTH]
+
+
+def get_query_id(query_data):
+    """Get the id of a query (or result), computing it for files written before ids were added."""
+    return query_data.get("query_id") or make_query_id(query_data["query"], query_data["dataset_path"],
+                                                       query_data.get("treatment_var"), query_data.get("outcome_var"))
+
+
+def add_query_ids(queries):
+    """
+    Set the `query_id` of every query that does not have one.
+
+    Returns:
+        (list): The queries
+    """
+
+    seen = set()
+    for query_data in queries:
+        query_data["query_id"] = get_query_id(query_data)
+        if query_data["query_id"] in seen:
+            print(f"Warning: Duplicate query {query_data['query_id']}: {query_data['query']}")
+        seen.add(query_data["query_id"])
+    return queries
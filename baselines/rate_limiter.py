@@ -0,0 +1,148 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from multiprocessing.managers import BaseManager
+
+# Rough number of characters per token, used to estimate the size of a request before sending it
+CHARS_PER_TOKEN = 4
+
+
+def parse_rate_limits(specs):
+    """
+    Parse rate limits of the form provider[/model]=RPM[:TPM].
+
+    Args:
+        specs (list): The limits, e.g. ["openai=500:200000", "together/meta-llama/Llama-3-70b=60"]
+
+    Returns:
+        (dict): Requests and tokens per minute (None if not limited), keyed by provider or provider/model
+    """
+
+    limits = {}
+    for spec in specs or []:
+        key, _, values = spec.partition("=")
+        requests_per_minute, _, tokens_per_minute = values.partition(":")
+        if not key or not requests_per_minute:
+            raise ValueError(f"Invalid rate limit '{spec}', expected provider[/model]=RPM[:TPM]")
+        limits[key] = (float(requests_per_minute), float(tokens_per_minute) if tokens_per_minute else None)
+    return limits
+
+
+def estimate_tokens(messages):
+    """Estimate the number of prompt tokens of a list of chat messages."""
+    return sum(len(message.get("content") or "") for message in messages) // CHARS_PER_TOKEN + 1
+
+
+def retry_after_seconds(exception):
+    """Get the delay requested by the Retry-After(-ms) header of a rate limit error, if any."""
+    response = getattr(exception, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def rate_limit_delay(exception, attempt, base=1.0, cap=60.0):
+    """Get how long to wait after a rate limit error: the Retry-After delay if given, else full-jitter exponential backoff."""
+    retry_after = retry_after_seconds(exception)
+    if retry_after is not None:
+        # A little jitter keeps workers that were limited together from retrying in lockstep
+        return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RateLimiter:
+    """Token buckets for requests and tokens per minute, per provider and model.
+
+    `reserve` takes a request (and its estimated tokens) from the buckets right away and
+    returns how long the caller has to wait before sending it, so concurrent callers queue
+    up instead of polling. Buckets may go negative; the wait is the time they need to refill.
+    A rate limit error reported with `penalize` pauses all requests to that provider and model.
+    The limiter can be shared between processes through `start_shared_rate_limiter`.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.buckets = {}
+        self.blocked_until = {}
+        self.lock = threading.Lock()
+
+    def _limit_key(self, provider, model):
+        for key in (f"{provider}/{model}", provider):
+            if key in self.limits:
+                return key
+        return None
+
+    def _take(self, key, name, amount, per_minute, now):
+        """Take an amount from a bucket and return the seconds until the bucket is no longer negative."""
+        rate = per_minute / 60
+        level, last = self.buckets.get((key, name), (per_minute, now))
+        level = min(per_minute, level + (now - last) * rate) - amount
+        self.buckets[(key, name)] = (level, now)
+        return max(0.0, -level / rate)
+
+    def reserve(self, provider, model, tokens=0):
+        """
+        Reserve one request and an estimate of its tokens.
+
+        Returns:
+            (float): The number of seconds to wait before sending the request
+        """
+
+        now = time.time()
+        with self.lock:
+            wait = max(0.0, self.blocked_until.get((provider, model), 0.0) - now)
+            key = self._limit_key(provider, model)
+            if key is not None:
+                requests_per_minute, tokens_per_minute = self.limits[key]
+                wait = max(wait, self._take(key, "requests", 1, requests_per_minute, now))
+                if tokens_per_minute and tokens:
+                    wait = max(wait, self._take(key, "tokens", tokens, tokens_per_minute, now))
+        return wait
+
+    def settle(self, provider, model, estimated_tokens, actual_tokens):
+        """Correct the token bucket once the actual token usage of a request is known."""
+        with self.lock:
+            key = self._limit_key(provider, model)
+            if key is None or self.limits[key][1] is None or (key, "tokens") not in self.buckets:
+                return
+            level, last = self.buckets[(key, "tokens")]
+            self.buckets[(key, "tokens")] = (level + estimated_tokens - actual_tokens, last)
+
+    def penalize(self, provider, model, seconds):
+        """Pause all requests to a provider and model after a rate limit error."""
+        with self.lock:
+            until = time.time() + seconds
+            self.blocked_until[(provider, model)] = max(self.blocked_until.get((provider, model), 0.0), until)
+
+
+class RateLimiterManager(BaseManager):
+    """Serves a RateLimiter from a separate process, so that worker processes share its state."""
+
+
+RateLimiterManager.register("RateLimiter", RateLimiter)
+
+
+def start_shared_rate_limiter(limits):
+    """
+    Start a RateLimiter that can be passed to worker processes.
+
+    Returns:
+        (RateLimiterManager, RateLimiter): The manager (call `shutdown` when done) and a proxy of the limiter
+    """
+
+    manager = RateLimiterManager()
+    manager.start()
+    return manager, manager.RateLimiter(limits)
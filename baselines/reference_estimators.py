@@ -0,0 +1,636 @@
+"""
+Reference estimators to recompute the annotated effects of the benchmark queries.
+
+Every query is estimated from its annotated variables (`treatment_var`, `outcome_var`,
+`control_variables`, `instrument_var`, `running_var`, `temporal_var`, `state_var`,
+`mediator_var`) with a plain numpy implementation of its method: OLS, IV/2SLS, DiD (canonical
+or two-way fixed effects), RDD (local linear, sharp or fuzzy), IPW, propensity score matching,
+GLM and the linear frontdoor adjustment. Queries whose specification is not annotated (e.g. a
+frontdoor query without a mediator) are reported as unsupported instead of being guessed. Queries are grouped by dataset, so each file is loaded once, and
+the datasets are processed in parallel.
+
+The estimators follow the textbook specification of each method. Papers often use a more
+specific one (clustered errors, bandwidth choices, sample restrictions), so deviations flag
+queries to review rather than wrong annotations.
+
+Example: python -m baselines.reference_estimators --queries data/json/*.json --output reference.csv
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from .columnar import load_dataset
+from .query_ids import get_query_id
+
+# Annotated method names (lower case) of every estimator
+METHOD_ALIASES = {
+    "ols": "ols", "rct": "ols", "observational": "ols", "regression": "ols",
+    "iv": "iv", "iv-2sls": "iv", "2sls": "iv", "iv_encouragement": "iv",
+    "did": "did", "diff-in-diff": "did", "did_canonical": "did", "did_twfe": "did",
+    "rdd": "rdd",
+    "ipw": "ipw", "inverse probability weighting": "ipw",
+    "matching": "matching", "propensity score matching": "matching",
+    "glm": "glm",
+    "frontdoor": "frontdoor",
+}
+
+# Bounds of the propensity scores used for weighting and matching
+PROPENSITY_CLIP = (0.01, 0.99)
+
+# Non-numeric controls are used as numbers if this share of their values are numbers, and
+# otherwise encoded as indicators of their levels if they have at most this many levels
+NUMERIC_SHARE = 0.95
+MAX_CONTROL_LEVELS = 50
+
+
+class UnsupportedQuery(ValueError):
+    """A query whose specification is not covered by the reference estimators."""
+
+
+def normalize_method(method):
+    """Get the estimator of an annotated method name, or None if there is none."""
+    return METHOD_ALIASES.get(str(method).strip().lower())
+
+
+def get_variable(query, field):
+    """Get an annotated variable name, or None if it is missing (NaN in the JSON files)."""
+    value = query.get(field)
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def get_controls(query):
+    """Get the annotated control variables as a list."""
+    controls = get_variable(query, "control_variables")
+    return [name.strip() for name in controls.split(",") if name.strip()] if controls else []
+
+
+def to_matrix(df, columns):
+    """Encode columns as a float matrix, with indicators for the levels of non-numeric columns."""
+    if not columns:
+        return np.empty((len(df), 0))
+    frame = pd.get_dummies(df[columns], drop_first=True, dtype=float)
+    return frame.to_numpy(dtype=float)
+
+
+def add_intercept(X):
+    return np.column_stack([np.ones(len(X)), X])
+
+
+def drop_collinear(X, keep=1, tol=1e-10):
+    """Drop columns that are linear combinations of earlier ones (the first `keep` columns are always kept)."""
+    if X.shape[1] <= keep:
+        return X
+    _, r = np.linalg.qr(X)
+    diagonal = np.abs(np.diag(r))
+    independent = diagonal > tol * max(diagonal.max(), 1.0)
+    independent[:keep] = True
+    return X[:, independent]
+
+
+def sandwich(bread, scores, n, k):
+    """Heteroskedasticity-robust (HC1) covariance from the inverse Hessian and the score matrix."""
+    meat = scores.T @ scores
+    return bread @ meat @ bread * n / max(n - k, 1)
+
+
+def fit_ols(y, X):
+    """
+    Least squares with HC1 standard errors.
+
+    Returns:
+        (np.ndarray, np.ndarray): The coefficients and their standard errors
+    """
+
+    beta, *_ = np.linalg.lstsq(X, y, rcond=None)
+    residuals = y - X @ beta
+    bread = np.linalg.pinv(X.T @ X)
+    covariance = sandwich(bread, X * residuals[:, None], *X.shape)
+    return beta, np.sqrt(np.diag(covariance))
+
+
+def fit_2sls(y, X, Z):
+    """Two-stage least squares of y on X with instruments Z (exogenous columns included in both)."""
+    first_stage, *_ = np.linalg.lstsq(Z, X, rcond=None)
+    X_hat = Z @ first_stage
+    beta, *_ = np.linalg.lstsq(X_hat, y, rcond=None)
+    # The residuals use the actual regressors, not the first stage fit
+    residuals = y - X @ beta
+    bread = np.linalg.pinv(X_hat.T @ X_hat)
+    covariance = sandwich(bread, X_hat * residuals[:, None], *X.shape)
+    return beta, np.sqrt(np.diag(covariance))
+
+
+def fit_glm(y, X, family="binomial", max_iter=100, tol=1e-10):
+    """
+    Logistic or Poisson regression by iteratively reweighted least squares.
+
+    Returns:
+        (np.ndarray, np.ndarray): The coefficients (on the link scale) and their standard errors
+    """
+
+    beta = np.zeros(X.shape[1])
+    for _ in range(max_iter):
+        eta = np.clip(X @ beta, -30, 30)
+        if family == "binomial":
+            mu = 1 / (1 + np.exp(-eta))
+            weights = mu * (1 - mu)
+        else:
+            mu = np.exp(eta)
+            weights = mu
+        hessian = (X * weights[:, None]).T @ X
+        step = np.linalg.lstsq(hessian, X.T @ (y - mu), rcond=None)[0]
+        beta += step
+        if np.max(np.abs(step)) < tol:
+            break
+    return beta, np.sqrt(np.diag(np.linalg.pinv(hessian)))
+
+
+def fit_propensity(T, W):
+    """Propensity scores of a binary treatment from a logistic regression on the controls."""
+    X = drop_collinear(add_intercept(W))
+    beta, _ = fit_glm(T, X, "binomial")
+    return np.clip(1 / (1 + np.exp(-np.clip(X @ beta, -30, 30))), *PROPENSITY_CLIP)
+
+
+def demean(values, groups, max_iter=1000, tol=1e-10):
+    """
+    Remove the fixed effects of one or more groupings from the columns of a matrix.
+
+    Several groupings (e.g. units and periods) are removed by alternating projections, each
+    one a vectorized subtraction of group means.
+    """
+
+    values = values.astype(float).copy()
+    counts = [np.bincount(codes) for codes in groups]
+    for _ in range(max_iter):
+        largest_change = 0.0
+        for codes, count in zip(groups, counts):
+            means = np.stack([np.bincount(codes, weights=column) / count for column in values.T], axis=1)
+            values -= means[codes]
+            largest_change = max(largest_change, np.abs(means).max(initial=0.0))
+        if len(groups) == 1 or largest_change < tol:
+            break
+    return values
+
+
+def is_binary(values):
+    return set(np.unique(values)) <= {0.0, 1.0}
+
+
+def estimate_ols(df, query):
+    """Coefficient of the treatment in a regression of the outcome on the treatment and the controls."""
+    y, T, W = df[query["outcome"]].to_numpy(float), df[query["treatment"]].to_numpy(float), to_matrix(df, query["controls"])
+    X = drop_collinear(add_intercept(np.column_stack([T, W])), keep=2)
+    beta, se = fit_ols(y, X)
+    return {"effect": beta[1], "std_error": se[1], "specification": "OLS"}
+
+
+def estimate_iv(df, query):
+    """2SLS coefficient of the treatment, instrumented by the instrument(s), with the controls as exogenous regressors."""
+    instruments = query["instrument"]
+    y, T = df[query["outcome"]].to_numpy(float), df[query["treatment"]].to_numpy(float)
+    W, Z = to_matrix(df, query["controls"]), df[instruments].to_numpy(float)
+    exogenous = drop_collinear(add_intercept(W))
+    beta, se = fit_2sls(y, np.column_stack([exogenous, T]), np.column_stack([exogenous, Z]))
+    return {"effect": beta[-1], "std_error": se[-1], "specification": "2SLS"}
+
+
+def estimate_did(df, query):
+    """
+    Difference-in-differences. With a binary period variable, the coefficient of treatment x post in
+    the canonical regression; otherwise the treatment coefficient of a two-way fixed effects
+    regression on units (state_var) and periods (temporal_var).
+    """
+
+    y, T = df[query["outcome"]].to_numpy(float), df[query["treatment"]].to_numpy(float)
+    period, W = df[query["temporal"]], to_matrix(df, query["controls"])
+    if period.nunique() == 2 and is_binary(period.to_numpy(float)):
+        post = period.to_numpy(float)
+        X = drop_collinear(add_intercept(np.column_stack([T * post, T, post, W])), keep=2)
+        beta, se = fit_ols(y, X)
+        return {"effect": beta[1], "std_error": se[1], "specification": "canonical DiD"}
+
+    groups = [pd.factorize(period)[0]]
+    specification = "period fixed effects DiD"
+    if query["unit"]:
+        unit = pd.factorize(df[query["unit"]])[0]
+        if np.allclose(demean(T[:, None], [unit]), 0):
+            raise ValueError("The treatment does not vary within units, so it is absorbed by the unit fixed effects")
+        groups.insert(0, unit)
+        specification = "two-way fixed effects DiD"
+    within = demean(np.column_stack([y, T, W]), groups)
+    X = drop_collinear(within[:, 1:])
+    beta, se = fit_ols(within[:, 0], X)
+    # Degrees of freedom used by the fixed effects
+    absorbed = sum(len(np.unique(codes)) for codes in groups) - len(groups) + 1
+    n, k = X.shape
+    se = se * np.sqrt((n - k) / max(n - k - absorbed, 1))
+    return {"effect": beta[0], "std_error": se[0], "specification": specification}
+
+
+def find_cutoff(R, T):
+    """
+    Find the threshold of the running variable that best separates treated from untreated units.
+
+    Returns:
+        (float, int, float): The cutoff, the side of the treated units (1: above, -1: below) and
+                             the share of units on the wrong side (0 for a sharp design)
+    """
+
+    order = np.argsort(R)
+    R, T = R[order], T[order]
+    n = len(R)
+    # Errors of the cutoff before position i: treated units below it plus untreated units above it
+    treated_below = np.concatenate([[0], np.cumsum(T)])
+    treated_above = T.sum() - treated_below
+    below = np.arange(n + 1)
+    errors_above = treated_below + (n - below - treated_above)
+    errors_below = (below - treated_below) + treated_above
+    best_above, best_below = errors_above.argmin(), errors_below.argmin()
+    if errors_above[best_above] <= errors_below[best_below]:
+        position, side, errors = best_above, 1, errors_above[best_above]
+    else:
+        position, side, errors = best_below, -1, errors_below[best_below]
+    position = min(max(position, 1), n - 1)
+    return (R[position - 1] + R[position]) / 2, side, errors / n
+
+
+def estimate_rdd(df, query, bandwidth=None):
+    """
+    Local linear regression discontinuity with a triangular kernel.
+
+    The cutoff is the threshold of the running variable that best separates treated from untreated
+    units (0 without an annotated treatment). A sharp design gives the jump of the outcome; otherwise
+    the jump is instrumented by the side of the cutoff (fuzzy RDD).
+    """
+
+    y, R = df[query["outcome"]].to_numpy(float), df[query["running"]].to_numpy(float)
+    T = df[query["treatment"]].to_numpy(float) if query["treatment"] else None
+    if T is not None and is_binary(T) and 0 < T.mean() < 1:
+        cutoff, side, misclassified = find_cutoff(R, T)
+    else:
+        cutoff, side, misclassified = 0.0, 1, 0.0
+        T = None
+
+    distance = R - cutoff
+    if bandwidth is None:
+        # Rule-of-thumb bandwidth for a triangular kernel
+        bandwidth = 2.702 * np.std(distance) * len(distance) ** (-1 / 5)
+    weights = np.clip(1 - np.abs(distance) / bandwidth, 0, None)
+    window = weights > 0
+    above = (side * distance >= 0).astype(float)
+    if above[window].sum() < 5 or (1 - above[window]).sum() < 5:
+        raise ValueError(f"Too few observations on one side of the cutoff {cutoff:.4g} within bandwidth {bandwidth:.4g}")
+
+    sqrt_w = np.sqrt(weights[window])[:, None]
+    d, a = distance[window], above[window]
+    exogenous = np.column_stack([np.ones(window.sum()), d, d * a])
+    if T is None or misclassified == 0:
+        X = np.column_stack([exogenous, a]) * sqrt_w
+        beta, se = fit_ols(y[window] * sqrt_w[:, 0], X)
+        specification = "sharp RDD"
+    else:
+        X = np.column_stack([exogenous, T[window]]) * sqrt_w
+        Z = np.column_stack([exogenous, a]) * sqrt_w
+        beta, se = fit_2sls(y[window] * sqrt_w[:, 0], X, Z)
+        specification = "fuzzy RDD"
+    return {"effect": beta[-1], "std_error": se[-1],
+            "specification": f"{specification} (cutoff {cutoff:.4g}, bandwidth {bandwidth:.4g})"}
+
+
+def estimate_ipw(df, query):
+    """Average treatment effect by normalized inverse propensity weighting."""
+    y, T, W = df[query["outcome"]].to_numpy(float), df[query["treatment"]].to_numpy(float), to_matrix(df, query["controls"])
+    if not is_binary(T):
+        raise ValueError("IPW requires a binary treatment")
+    e = fit_propensity(T, W)
+    w1, w0 = T / e, (1 - T) / (1 - e)
+    mu1, mu0 = (w1 * y).sum() / w1.sum(), (w0 * y).sum() / w0.sum()
+    # Influence function, treating the propensity scores as known
+    influence = w1 * (y - mu1) / w1.mean() - w0 * (y - mu0) / w0.mean()
+    return {"effect": mu1 - mu0, "std_error": influence.std(ddof=1) / np.sqrt(len(y)), "specification": "IPW (ATE)"}
+
+
+def nearest(sorted_scores, scores):
+    """Positions of the nearest neighbours of scores in sorted_scores."""
+    right = np.clip(np.searchsorted(sorted_scores, scores), 1, len(sorted_scores) - 1)
+    left = right - 1
+    return np.where(np.abs(sorted_scores[left] - scores) <= np.abs(sorted_scores[right] - scores), left, right)
+
+
+def estimate_matching(df, query):
+    """
+    Average treatment effect on the treated by one-to-one nearest neighbour matching on the
+    propensity score, with replacement (the estimand the benchmark's matching answers use).
+    """
+
+    y, T, W = df[query["outcome"]].to_numpy(float), df[query["treatment"]].to_numpy(float), to_matrix(df, query["controls"])
+    if not is_binary(T):
+        raise ValueError("Matching requires a binary treatment")
+    e = fit_propensity(T, W)
+    treated, control = T == 1, T == 0
+    if treated.sum() < 2 or control.sum() < 2:
+        raise ValueError("Matching requires at least two treated and two control units")
+
+    order_c = np.argsort(e[control])
+    y_c, e_c = y[control][order_c], e[control][order_c]
+    # Each treated unit is compared with the closest control unit
+    differences = y[treated] - y_c[nearest(e_c, e[treated])]
+    return {"effect": differences.mean(), "std_error": differences.std(ddof=1) / np.sqrt(len(differences)),
+            "specification": "propensity score matching (ATT)"}
+
+
+def estimate_glm(df, query):
+    """Treatment coefficient of a logistic (binary outcome), Poisson (count outcome) or linear regression."""
+    y, T, W = df[query["outcome"]].to_numpy(float), df[query["treatment"]].to_numpy(float), to_matrix(df, query["controls"])
+    X = drop_collinear(add_intercept(np.column_stack([T, W])), keep=2)
+    if is_binary(y):
+        family = "binomial"
+    elif np.all(y >= 0) and np.all(y == np.round(y)):
+        family = "poisson"
+    else:
+        beta, se = fit_ols(y, X)
+        return {"effect": beta[1], "std_error": se[1], "specification": "GLM (gaussian)"}
+    beta, se = fit_glm(y, X, family)
+    return {"effect": beta[1], "std_error": se[1], "specification": f"GLM ({family})"}
+
+
+def estimate_frontdoor(df, query):
+    """
+    Linear frontdoor adjustment: the effect of the treatment on the mediator times the effect of the
+    mediator on the outcome given the treatment.
+    """
+
+    mediator = query["mediator"]
+    y, T, M = df[query["outcome"]].to_numpy(float), df[query["treatment"]].to_numpy(float), df[mediator].to_numpy(float)
+    W = to_matrix(df, query["controls"])
+    a, se_a = fit_ols(M, drop_collinear(add_intercept(np.column_stack([T, W])), keep=2))
+    b, se_b = fit_ols(y, drop_collinear(add_intercept(np.column_stack([M, T, W])), keep=3))
+    effect = a[1] * b[1]
+    # Delta method
+    std_error = np.sqrt(b[1] ** 2 * se_a[1] ** 2 + a[1] ** 2 * se_b[1] ** 2)
+    return {"effect": effect, "std_error": std_error, "specification": f"frontdoor via {mediator}"}
+
+
+ESTIMATORS = {
+    "ols": estimate_ols,
+    "iv": estimate_iv,
+    "did": estimate_did,
+    "rdd": estimate_rdd,
+    "ipw": estimate_ipw,
+    "matching": estimate_matching,
+    "glm": estimate_glm,
+    "frontdoor": estimate_frontdoor,
+}
+
+# Variables each estimator needs besides the outcome
+REQUIRED_VARIABLES = {
+    "ols": ("treatment",), "iv": ("treatment", "instrument"), "did": ("treatment", "temporal"),
+    "rdd": ("running",), "ipw": ("treatment",), "matching": ("treatment",), "glm": ("treatment",),
+    "frontdoor": ("treatment", "mediator"),
+}
+
+
+def encode_controls(df, controls):
+    """
+    Prepare the control variables of a query. Controls that are not columns of the dataset are
+    dropped, non-numeric ones are converted to numbers or encoded as categories, and those with
+    too many levels to encode are dropped.
+
+    Returns:
+        (dict, list, list): The prepared columns by name, the controls that are kept and notes on
+                            the controls that were changed or dropped
+    """
+
+    columns, kept, notes = {}, [], []
+    missing = [name for name in controls if name not in df.columns]
+    if missing:
+        notes.append(f"dropped controls not in the dataset: {', '.join(missing)}")
+    for name in controls:
+        if name in missing:
+            continue
+        column = df[name]
+        if not pd.api.types.is_numeric_dtype(column):
+            numbers = pd.to_numeric(column, errors="coerce")
+            present = column.notna().sum()
+            if present and numbers.notna().sum() >= NUMERIC_SHARE * present:
+                column = numbers
+                notes.append(f"converted {name} to numbers")
+            elif column.nunique() <= MAX_CONTROL_LEVELS:
+                column = column.astype(str).where(column.notna())
+                notes.append(f"encoded {name} as {column.nunique()} categories")
+            else:
+                notes.append(f"dropped {name} ({column.nunique()} categories)")
+                continue
+        columns[name] = column
+        kept.append(name)
+    return columns, kept, notes
+
+
+def resolve_variables(query, df, estimator):
+    """
+    Map the annotated variables of a query to columns of its dataset.
+
+    Returns:
+        (dict, pd.DataFrame): The column names of the roles of the estimator (with `notes` on the
+                              controls, see encode_controls), and the rows of the dataset without
+                              missing values in these columns
+    """
+
+    variables = {
+        "outcome": get_variable(query, "outcome_var"),
+        "treatment": get_variable(query, "treatment_var"),
+        "instrument": [name.strip() for name in (get_variable(query, "instrument_var") or "").split(",") if name.strip()],
+        "running": get_variable(query, "running_var"),
+        "temporal": get_variable(query, "temporal_var"),
+        "unit": get_variable(query, "state_var"),
+        "mediator": get_variable(query, "mediator_var"),
+    }
+    # Variables used as treatment, period or unit are not controls
+    roles = {variables[role] for role in ("outcome", "treatment", "running", "temporal", "unit")}
+    variables["controls"] = [name for name in get_controls(query)
+                             if name not in roles and name not in variables["instrument"]]
+
+    if estimator == "frontdoor" and variables["mediator"] is None:
+        # Guessing the mediator gives a number that need not follow the specification the effect was generated with
+        raise UnsupportedQuery("No mediator variable annotated")
+
+    if variables["outcome"] is None:
+        raise ValueError("No outcome variable annotated")
+    for role in REQUIRED_VARIABLES[estimator]:
+        if not variables[role]:
+            raise ValueError(f"No {role} variable annotated")
+
+    columns = [variables[role] for role in ("outcome", "treatment", "running", "temporal", "unit", "mediator")
+               if variables[role]] + variables["instrument"]
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not in the dataset: {', '.join(missing)}")
+    for role in ("outcome", "treatment", "running", "mediator"):
+        if variables[role] and not pd.api.types.is_numeric_dtype(df[variables[role]]):
+            raise ValueError(f"The {role} variable {variables[role]} is not numeric")
+
+    controls, variables["controls"], variables["notes"] = encode_controls(df, variables["controls"])
+    data = pd.DataFrame({**{column: df[column] for column in columns}, **controls})
+    data = data[data.notna().all(axis=1)].reset_index(drop=True)
+    if "treatment" in REQUIRED_VARIABLES[estimator] and data[variables["treatment"]].nunique() < 2:
+        raise ValueError(f"The treatment variable {variables['treatment']} does not vary in the dataset")
+    return variables, data
+
+
+def estimate_query(query, df=None):
+    """
+    Recompute the effect of a query with the reference estimator of its method.
+
+    Args:
+        query (dict): A query of the benchmark (entry of data/json/*.json)
+        df (pd.DataFrame, optional): Its dataset, loaded from dataset_path if not given
+
+    Returns:
+        (dict): The `status` ("estimated", "unsupported" or "error") and `estimator`, with the `effect`,
+                `std_error`, `specification`, `n` and `notes` on the controls used, or an `error`
+                message if the query cannot be estimated
+    """
+
+    estimator = normalize_method(query.get("method"))
+    if estimator is None:
+        return {"status": "unsupported", "estimator": None,
+                "error": f"Unsupported: No reference estimator for method '{query.get('method')}'"}
+    try:
+        if df is None:
+            df = load_dataset(query["dataset_path"], low_memory=False)
+        variables, data = resolve_variables(query, df, estimator)
+        estimate = ESTIMATORS[estimator](data, variables)
+    except UnsupportedQuery as e:
+        return {"status": "unsupported", "estimator": estimator, "error": f"Unsupported: {e}"}
+    except Exception as e:
+        return {"status": "error", "estimator": estimator, "error": f"Error: {type(e).__name__}: {e}"}
+    return {"status": "estimated", "estimator": estimator, "effect": float(estimate["effect"]),
+            "std_error": float(estimate["std_error"]), "specification": estimate["specification"],
+            "n": len(data), "notes": "; ".join(variables["notes"]) or None}
+
+
+def estimate_dataset(dataset_path, queries):
+    """Estimate all queries of one dataset, loading it once."""
+    try:
+        df = load_dataset(dataset_path, low_memory=False)
+    except Exception as e:
+        return [{"status": "error", "estimator": normalize_method(query.get("method")),
+                 "error": f"Error: Could not load dataset: {e}"} for query in queries]
+    return [estimate_query(query, df) for query in queries]
+
+
+def compare(query, estimate, rtol=0.1, ztol=2.0):
+    """
+    Compare a reference estimate with the stored answer of a query.
+
+    The estimate agrees if its relative deviation is at most rtol, or if it lies within ztol
+    stored standard errors of the stored effect.
+    """
+
+    stored_effect, stored_se = query.get("effect"), query.get("std_error")
+    row = {
+        "query_id": get_query_id(query), "dataset_path": query["dataset_path"], "query": query["query"],
+        "method": query.get("method"),
+        "stored_effect": stored_effect, "stored_std_error": stored_se, **estimate,
+    }
+    if "effect" not in estimate or stored_effect is None or np.isnan(stored_effect):
+        return row
+    deviation = estimate["effect"] - stored_effect
+    row["abs_deviation"] = abs(deviation)
+    row["rel_deviation"] = abs(deviation) / max(abs(stored_effect), 1e-12)
+    row["z_deviation"] = deviation / stored_se if stored_se and not np.isnan(stored_se) and stored_se > 0 else None
+    row["agrees"] = bool(row["rel_deviation"] <= rtol or (row["z_deviation"] is not None and abs(row["z_deviation"]) <= ztol))
+    return row
+
+
+def evaluate_queries(queries, num_workers=1, rtol=0.1, ztol=2.0):
+    """
+    Recompute the effects of all queries, one dataset per task, and compare them with the stored answers.
+
+    Returns:
+        (pd.DataFrame): One row per query, in the order of the queries
+    """
+
+    by_dataset = {}
+    for index, query in enumerate(queries):
+        by_dataset.setdefault(query["dataset_path"], []).append(index)
+
+    estimates = [None] * len(queries)
+    with ProcessPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        futures = {dataset_path: executor.submit(estimate_dataset, dataset_path, [queries[i] for i in indices])
+                   for dataset_path, indices in by_dataset.items()}
+        for dataset_path, future in futures.items():
+            for index, estimate in zip(by_dataset[dataset_path], future.result()):
+                estimates[index] = estimate
+    return pd.DataFrame([compare(query, estimate, rtol, ztol) for query, estimate in zip(queries, estimates)])
+
+
+def summarize(report):
+    """Aggregate a report by source and estimator, counting estimated, unsupported and failed queries separately."""
+    report = report.assign(source=report["dataset_path"].map(lambda path: os.path.basename(os.path.dirname(path))))
+    if "agrees" not in report:
+        report["agrees"] = np.nan
+    if "rel_deviation" not in report:
+        report["rel_deviation"] = np.nan
+    return report.groupby(["source", "estimator"], dropna=False).agg(
+        queries=("query", "size"),
+        estimated=("status", lambda values: int(values.eq("estimated").sum())),
+        unsupported=("status", lambda values: int(values.eq("unsupported").sum())),
+        errors=("status", lambda values: int(values.eq("error").sum())),
+        agree=("agrees", lambda values: int(values.eq(True).sum())),
+        median_rel_deviation=("rel_deviation", "median"),
+    ).reset_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute the annotated effects of the benchmark queries and report deviations")
+    parser.add_argument("--queries", type=str, nargs="+",
+                        default=["data/json/qrdata.json", "data/json/real_data.json", "data/json/synthetic_data.json"],
+                        help="JSON query files (default: all benchmark sources)")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Save the per-query report to this CSV file")
+    parser.add_argument("--num-workers", type=int, default=os.cpu_count(),
+                        help="Number of processes; each one estimates the queries of one dataset at a time")
+    parser.add_argument("--rtol", type=float, default=0.1,
+                        help="Relative deviation up to which an estimate agrees with the stored effect (default: 0.1)")
+    parser.add_argument("--ztol", type=float, default=2.0,
+                        help="An estimate also agrees if it is within this many stored standard errors (default: 2)")
+    args = parser.parse_args()
+
+    queries = []
+    for path in args.queries:
+        with open(path, "r") as f:
+            queries.extend(json.load(f))
+
+    start_time = time.time()
+    report = evaluate_queries(queries, num_workers=args.num_workers, rtol=args.rtol, ztol=args.ztol)
+    print(f"Estimated {len(queries)} queries in {time.time() - start_time:.2f} seconds\n")
+    print(summarize(report).to_string(index=False))
+
+    if "agrees" in report:
+        deviating = report[report["agrees"] == False]
+        if len(deviating):
+            print(f"\n{len(deviating)} queries deviate from the stored effect:")
+            print(deviating[["dataset_path", "method", "stored_effect", "effect", "rel_deviation"]].to_string(index=False))
+    for status, description in (("unsupported", "are not supported by the reference estimators"),
+                                ("error", "could not be estimated")):
+        failed = report[report["status"] == status]
+        if len(failed):
+            print(f"\n{len(failed)} queries {description}:")
+            for _, row in failed.iterrows():
+                print(f"  {row['dataset_path']} ({row['method']}): {row['error']}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        report.to_csv(args.output, index=False)
+        print(f"\nReport saved to {args.output}")
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 ".cache", "responses")
+
+
+class ResponseCacheMiss(KeyError):
+    """Raised in replay mode when a request is not in the cache."""
+
+
+def get_cache_dir():
+    """Get the directory of the response cache (CAUSCIBENCH_RESPONSE_CACHE overrides the default)."""
+    return os.environ.get("CAUSCIBENCH_RESPONSE_CACHE", DEFAULT_CACHE_DIR)
+
+
+def make_request_key(provider, model, messages, completion_kwargs=None):
+    """
+    Build the content address of a chat completion request.
+
+    Args:
+        provider (str): The API provider
+        model (str): The model name
+        messages (list): The messages sent to the API, including the system message
+        completion_kwargs (dict, optional): Extra arguments of the request (e.g. the seed)
+
+    Returns:
+        (str): A hex digest of the request
+    """
+
+    content = json.dumps([provider, model, messages, completion_kwargs or {}], sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """A content-addressed on-disk cache of chat completion replies.
+
+    Every reply is stored in its own file named after the hash of the request, so the cache
+    can be shared by worker processes. When the cache grows beyond `max_bytes`, the least
+    recently used replies are evicted. In replay mode the cache is read-only and a request
+    that is not cached raises ResponseCacheMiss instead of reaching the API.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, replay=False):
+        self.cache_dir = cache_dir or get_cache_dir()
+        self.max_bytes = max_bytes
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.size = self._scan_size() if max_bytes else 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _iter_files(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for root, _, names in os.walk(self.cache_dir):
+            for name in names:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def _scan_size(self):
+        size = 0
+        for path in self._iter_files():
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return size
+
+    def get(self, key):
+        """
+        Get a cached reply.
+
+        Returns:
+            (str): The reply, or None if the request is not cached (outside replay mode)
+        """
+
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            with self.lock:
+                self.misses += 1
+            if self.replay:
+                raise ResponseCacheMiss(f"Request {key} is not in the response cache {self.cache_dir}")
+            return None
+
+        with self.lock:
+            self.hits += 1
+        if not self.replay:
+            # The modification time records the last use, for the eviction order
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return entry["reply"]
+
+    def put(self, key, reply, model=None):
+        """Store a reply (ignored in replay mode)."""
+        if self.replay:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so concurrent workers never read a partial reply
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": model, "reply": reply, "created": time.time()}, f)
+        size = os.path.getsize(tmp_path)
+        # Overwriting a reply replaces its file, so only the difference adds to the size of the cache
+        try:
+            replaced_size = os.path.getsize(path)
+        except OSError:
+            replaced_size = 0
+        os.replace(tmp_path, path)
+
+        if self.max_bytes:
+            with self.lock:
+                self.size += size - replaced_size
+                evict = self.size > self.max_bytes
+            if evict:
+                self.evict()
+
+    def evict(self):
+        """Remove the least recently used replies until the cache is at 90% of its size limit."""
+        entries = []
+        for path in self._iter_files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        size = sum(entry[1] for entry in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, file_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= file_size
+                removed += 1
+            except OSError:
+                pass
+
+        with self.lock:
+            self.size = size
+        return removed
+
+    def stats(self):
+        """Get the hit/miss counts of this process."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,145 @@
+import os
+import json
+import hashlib
+
+
+def make_result_key(query_id, model, prompt_name):
+    """
+    Build the checkpoint key of a query result.
+
+    Args:
+        query_id (str): The id of the query (see baselines.query_ids)
+        model (str): The name of the model
+        prompt_name (str): The name of the prompting strategy (basic, cot, pot, react)
+
+    Returns:
+        (str): A hex digest identifying the (query, model, format) combination
+    """
+
+    content = json.dumps([query_id, model, prompt_name])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class ResultStore:
+    """An append-only JSONL checkpoint store of query results.
+
+    Every result is written as one line and flushed to disk as soon as it arrives, so a crash
+    only loses the queries that were in flight. Records are never kept in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Terminate a line that was cut off by a crash, so new records start on a fresh line
+        if self.exists() and os.path.getsize(path) > 0:
+            with open(path, "rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def backup(self):
+        """Move an existing checkpoint out of the way. Returns the backup path."""
+        backup_path = f"{self.path}.bak"
+        os.replace(self.path, backup_path)
+        return backup_path
+
+    def append(self, key, record):
+        """Append a result and flush it to disk."""
+        line = json.dumps({"key": key, "status": record.get("status"), "record": record})
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def iter_entries(self):
+        """Iterate over the stored entries, skipping a truncated last line after a crash."""
+        if not self.exists():
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Warning: Skipping corrupted line in checkpoint {self.path}")
+
+    def completed_keys(self):
+        """Get the keys of all queries that were processed successfully."""
+        return {entry["key"] for entry in self.iter_entries() if entry["status"] == "success"}
+
+    def _best_offsets(self):
+        """Find the line offset of the record to export for every key (last success, else last error)."""
+        offsets = {}
+        with open(self.path, "rb") as f:
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                key = entry["key"]
+                success = entry["status"] == "success"
+                if key not in offsets or success or not offsets[key][1]:
+                    offsets[key] = (offset, success)
+        return offsets
+
+    def export_json(self, output_path, order=None, include_unlisted=True):
+        """
+        Write the stored results as a JSON list, one record at a time.
+
+        Args:
+            output_path (str): The path of the JSON file to write
+            order (list, optional): Keys in the order the records should be written. Keys that are not
+                                    listed are written afterwards in checkpoint order.
+            include_unlisted (bool): Whether to write the records of keys that are not in order, e.g.
+                                     False to export one run of a sweep from a shared store
+
+        Returns:
+            (int): The number of exported records
+        """
+
+        num_records = 0
+        with open(output_path, "w") as out:
+            out.write("[")
+            for record in self.iter_records(order, include_unlisted):
+                text = json.dumps(record, indent=2).replace("\n", "\n  ")
+                out.write(("," if num_records > 0 else "") + "\n  " + text)
+                num_records += 1
+            if num_records:
+                out.write("\n")
+            out.write("]")
+        return num_records
+
+    def iter_records(self, order=None, include_unlisted=True):
+        """
+        Iterate over the record to export for every key (last success, else last error), one at a time.
+
+        Args:
+            order (list, optional): Keys in the order the records should be returned. Keys that are not
+                                    listed are returned afterwards in checkpoint order.
+            include_unlisted (bool): Whether to return the records of keys that are not in order
+        """
+
+        if not self.exists():
+            return
+        offsets = self._best_offsets()
+        keys = [key for key in (order or []) if key in offsets]
+        listed = set(keys)
+        if include_unlisted:
+            keys += sorted((key for key in offsets if key not in listed), key=lambda k: offsets[k][0])
+
+        with open(self.path, "rb") as f:
+            for key in keys:
+                f.seek(offsets[key][0])
+                yield json.loads(f.readline())["record"]
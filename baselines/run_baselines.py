@@ -1,10 +1,15 @@
 import json
 import os
 import tqdm
+import httpx
+import queue
+import asyncio
 import argparse
 import pandas as pd
 import multiprocessing as mp
 from functools import partial
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 import time
 from pathlib import Path
 
@@ -18,160 +23,702 @@ if PROJECT_ROOT not in sys.path:
 import baselines as base
 from baselines import CausalQueryFormat, CausalCoTFormat
 from baselines.query_formats import ProgramOfThoughtsFormat, ReActFormat
+from baselines.container_pool import ContainerPool, remove_pool_containers, POOL_LABEL
+from baselines.query_ids import add_query_ids
+from baselines.result_store import ResultStore, make_result_key
+from baselines.columnar import find_columnar_copy
+from baselines.coderunner import CodeRunner
+from baselines.chatbot import APIChatbot, RATE_LIMIT_ERRORS
+from baselines.rate_limiter import RateLimiter, parse_rate_limits, start_shared_rate_limiter
+from baselines.scheduling import group_by_dataset, load_turn_history, order_by_cost
+from baselines.batch_api import LocalBatchAdapter, OpenAIBatchAdapter, make_batch_line
+from baselines.response_cache import ResponseCache, get_cache_dir
+from baselines.metrics import QueryMetrics, aggregate_metrics, metrics_table, print_metrics_report
+from baselines.async_coderunner import AsyncCodeRunner
+from baselines.async_baseline import AsyncBaseline
+from baselines.async_chatbot import (AsyncAzureAPIChatbot, AsyncOpenAIAPIChatbot, AsyncTestChatbot,
+                                     AsyncTogetherAPIChatbot, AsyncVertexAPIChatbot)
 
+# Folder with the qrdata, real_data and synthetic_data datasets
+DATA_ROOT = Path(__file__).resolve().parent.parent / "data"
 
-def process_single_query(query_data, args, worker_id):
-    """Process a single query in a worker process."""
+# Container pool of the current worker process, created on first use
+_container_pool = None
+
+# Response cache of the current worker process, created on first use
+_response_cache = None
+
+
+def get_container_pool(args):
+    """Get the container pool of the current worker process, warming it up on first use."""
+    global _container_pool
+    if _container_pool is None:
+        _container_pool = ContainerPool(size=args.pool_size, session_timeout=args.session_timeout,
+                                        pool_id=args.pool_id, runner_kwargs=get_runner_kwargs(args))
+        print(f"Process {os.getpid()}: Warming up {args.pool_size} pooled container(s)...")
+        _container_pool.warm_up()
+    return _container_pool
+
+
+def configure_chatbot(chatbot, args):
+    """Apply the history compaction, rate limit and response cache options to an API chatbot."""
+    global _response_cache
+    if not isinstance(chatbot, APIChatbot):
+        return chatbot
+    if args.compact_history_kb:
+        chatbot.compact_history_chars = int(args.compact_history_kb * 1024)
+    chatbot.rate_limiter = args.rate_limiter
+    chatbot.max_rate_limit_retries = args.rate_limit_retries
+    if not (args.response_cache or args.replay):
+        return chatbot
+    if _response_cache is None:
+        max_bytes = int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb else None
+        _response_cache = ResponseCache(args.response_cache_dir, max_bytes=max_bytes, replay=args.replay)
+    chatbot.response_cache = _response_cache
+    return chatbot
+
+
+def get_runner_kwargs(args):
+    """Get the CodeRunner options shared by all containers of a run."""
+    return {"data_mount": args.data_mount, "exec_timeout": args.exec_timeout}
+
+
+def get_query_format(args):
+    """Get the prompting strategy name (as used in output file names) and QueryFormat class."""
+    prompt_name, qf = "basic", CausalQueryFormat
+    if args.potm:
+        prompt_name, qf = "pot", ProgramOfThoughtsFormat
+    if args.react:
+        prompt_name, qf = "react", ReActFormat
+    if args.chain:
+        prompt_name, qf = "cot", CausalCoTFormat
+    return prompt_name, qf
+
+
+def create_chatbot(args):
+    """Create the chatbot selected with --api / --rpc-address."""
+    if args.rpc_address:
+        return base.RPCChatbot(args.rpc_address)
+
+    # Initialize the chatbot with worker-specific settings if needed
+    if args.api == "test":
+        return base.TestChatbot()
+    elif args.api == "vertex":
+        return base.VertexAPIChatbot(model=args.model, persistent_mode=args.persistent)
+    elif args.api == "azure":
+        return base.AzureAPIChatbot(model=args.model, persistent_mode=args.persistent)
+    elif args.api == "openai":
+        return base.OpenAIAPIChatbot(model=args.model, persistent_mode=args.persistent, base_url=args.base_url)
+    elif args.api == "together":
+        return base.TogetherAPIChatbot(model=args.model, persistent_mode=args.persistent)
+    elif args.api == "local":
+        raise NotImplementedError("Local chatbot is not implemented yet.")
+    else:
+        raise ValueError(f"Invalid API: {args.api}")
+
+
+def create_async_chatbot(args, semaphore):
+    """Create the asyncio variant of the chatbot selected with --api."""
+    if args.rpc_address:
+        raise ValueError("The RPC chatbot is not supported in async mode")
+
+    if args.api == "test":
+        return AsyncTestChatbot(semaphore=semaphore)
+    elif args.api == "vertex":
+        return AsyncVertexAPIChatbot(model=args.model, persistent_mode=args.persistent, semaphore=semaphore)
+    elif args.api == "azure":
+        return AsyncAzureAPIChatbot(model=args.model, persistent_mode=args.persistent, semaphore=semaphore)
+    elif args.api == "openai":
+        return AsyncOpenAIAPIChatbot(model=args.model, persistent_mode=args.persistent, base_url=args.base_url,
+                                     semaphore=semaphore)
+    elif args.api == "together":
+        return AsyncTogetherAPIChatbot(model=args.model, persistent_mode=args.persistent, semaphore=semaphore)
+    else:
+        raise ValueError(f"API not supported in async mode: {args.api}")
+
+
+def prepare_sandbox(model, query_data, args, worker_id, metrics, pool_info=None):
+    """
+    Start the persistent environment of a query (or take over the pooled one) and stage its dataset.
+
+    Args:
+        pool_info (dict, optional): The checkout information if the container of the model comes from the pool
+
+    Returns:
+        (bool): Whether the persistent environment is available
+    """
+    code_runner = model.code_runner
+    if pool_info is not None:
+        print(f"Worker {worker_id}: Using pooled Python environment {code_runner.http_name} "
+              f"(pool hit: {pool_info['hit']}).")
+        started = True
+    else:
+        print(f"Worker {worker_id}: Starting persistent Python environment...")
+        with metrics.stage("container_startup"):
+            started = model.start_persistent_session()
+    if not started:
+        print(f"Worker {worker_id}: Failed to start persistent environment. Falling back to one-off mode.")
+        return False
+    print(f"Worker {worker_id}: Persistent environment started successfully.")
+
+    # If using persistent mode, update the chatbot's system message
+    if hasattr(model.chatbot, 'persistent_mode'):
+        model.chatbot.persistent_mode = True
+        print(f"Worker {worker_id}: Updated chatbot to use persistent mode.")
+
+    dataset_path = query_data["dataset_path"]
+
+    # Make the dataset file available in the container
+    with metrics.stage("staging"):
+        if dataset_path in code_runner.preloaded_datasets:
+            print(f"Worker {worker_id}: Dataset already preloaded in container by a previous query.")
+        elif os.path.exists(dataset_path):
+            if code_runner.is_mounted(dataset_path):
+                print(f"Worker {worker_id}: Dataset available in container through the read-only data mount.")
+            else:
+                print(f"Worker {worker_id}: Uploading dataset file {dataset_path} to container...")
+                # Use the same path structure in the container as the original path
+                container_path = dataset_path
+                upload_result = model.upload_file(dataset_path, container_path)
+                print(f"Worker {worker_id}: {upload_result}")
+            
+                # No need to update the dataset path as we're using the same path structure
+                print(f"Worker {worker_id}: Dataset uploaded to container at path: {container_path}")
+
+            # Let pd.read_csv in the container load the columnar copy of the dataset instead
+            columnar_copy = find_columnar_copy(dataset_path) if args.columnar else None
+            if columnar_copy is not None:
+                if not code_runner.is_mounted(columnar_copy["path"]):
+                    model.upload_file(columnar_copy["path"], columnar_copy["path"])
+                register_result = code_runner.register_columnar_copy(
+                    dataset_path, columnar_copy["path"], columnar_copy["encoding"])
+                print(f"Worker {worker_id}: {register_result}")
+
+            # Parse the dataset once, so every read_csv of it gets a copy of the parsed frame
+            if args.group_by_dataset:
+                with metrics.stage("preload"):
+                    encoding = columnar_copy["encoding"] if columnar_copy is not None else "utf-8"
+                    print(f"Worker {worker_id}: {code_runner.preload_dataset(dataset_path, encoding)}")
+    return True
+
+
+def process_single_query(query_data, args, worker_id, first_reply=None):
+    """Process a single query in a worker process (first_reply: the reply to the first prompt from a batch job)."""
+    code_runner = None
+    pool_info = None
+    pipeline = None
+    sandbox = None
+    metrics = QueryMetrics()
     try:
         # Initialize chatbot for this worker
-        if args.rpc_address:
-            chatbot = base.RPCChatbot(args.rpc_address)
-        else:
-            # Initialize the chatbot with worker-specific settings if needed
-            if args.api == "test":
-                chatbot = base.TestChatbot()
-            elif args.api == "vertex":
-                chatbot = base.VertexAPIChatbot(model=args.model, persistent_mode=args.persistent)
-            elif args.api == "azure":
-                chatbot = base.AzureAPIChatbot(model=args.model, persistent_mode=args.persistent)
-            elif args.api == "openai":
-                chatbot = base.OpenAIAPIChatbot(model=args.model, persistent_mode=args.persistent)
-            elif args.api == "together":
-                chatbot = base.TogetherAPIChatbot(model=args.model, persistent_mode=args.persistent)
-            elif args.api == "local":
-                raise NotImplementedError("Local chatbot is not implemented yet.")
-            else:
-                raise ValueError(f"Invalid API: {args.api}")
+        chatbot = configure_chatbot(create_chatbot(args), args)
+
+        # Take a warm container from the pool if enabled
+        if args.persistent and args.pool_size > 0:
+            with metrics.stage("container_startup"):
+                code_runner, pool_info = get_container_pool(args).checkout(query_data["dataset_path"])
 
         # Initialize the baseline with worker-specific ID
         model = base.Baseline(chatbot, persistent=args.persistent, 
-                                             session_timeout=args.session_timeout, worker_id=worker_id)
+                                             session_timeout=args.session_timeout, worker_id=worker_id,
+                                             code_runner=code_runner, runner_kwargs=get_runner_kwargs(args))
 
         # Initialize persistent_mode first
         persistent_mode = args.persistent
         
         # Start persistent session if enabled
-        if args.persistent:
-            print(f"Worker {worker_id}: Starting persistent Python environment...")
-            if model.start_persistent_session():
-                print(f"Worker {worker_id}: Persistent environment started successfully.")
-                
-                # If using persistent mode, update the chatbot's system message
-                if hasattr(chatbot, 'persistent_mode'):
-                    chatbot.persistent_mode = True
-                    print(f"Worker {worker_id}: Updated chatbot to use persistent mode.")
-                
-                persistent_mode = True
-            else:
-                print(f"Worker {worker_id}: Failed to start persistent environment. Falling back to one-off mode.")
-                persistent_mode = False
+        if args.persistent and args.pipeline:
+            # Prepare the sandbox in the background while the first prompt is built and answered; the
+            # system message already assumes persistent mode since it is part of that first request
+            if hasattr(chatbot, 'persistent_mode'):
+                chatbot.persistent_mode = True
+            pipeline = ThreadPoolExecutor(max_workers=1)
+            sandbox = pipeline.submit(prepare_sandbox, model, query_data, args, worker_id, metrics,
+                                      pool_info if code_runner is not None else None)
+        elif args.persistent:
+            persistent_mode = prepare_sandbox(model, query_data, args, worker_id, metrics,
+                                              pool_info if code_runner is not None else None)
 
         query = query_data["query"]
         dataset_path = query_data["dataset_path"]
         dataset_description = query_data["dataset_description"]
-        
-        # If in persistent mode, upload the dataset file to the container
-        if persistent_mode and os.path.exists(dataset_path):
-            print(f"Worker {worker_id}: Uploading dataset file {dataset_path} to container...")
-            # Use the same path structure in the container as the original path
-            container_path = dataset_path
-            upload_result = model.upload_file(dataset_path, container_path)
-            print(f"Worker {worker_id}: {upload_result}")
-            
-            # No need to update the dataset path as we're using the same path structure
-            print(f"Worker {worker_id}: Dataset uploaded to container at path: {container_path}")
 
         # Determine query format
-        qf = CausalQueryFormat
-        if args.potm:
-            qf = ProgramOfThoughtsFormat
-        if args.react:
-            qf = ReActFormat
-        if args.chain:
-            qf = CausalCoTFormat
+        _, qf = get_query_format(args)
 
         print(f"Worker {worker_id}: Processing query: {query[:100]}...")
         
         # Process the query
-        result = model.answer(query, dataset_path, dataset_description, qf=qf, post_steps=False)
+        result = model.answer(query, dataset_path, dataset_description, qf=qf, post_steps=False,
+                              metrics=metrics, sandbox=sandbox, first_reply=first_reply)
+        result.pop("metrics", None)
+        if sandbox is not None:
+            persistent_mode = sandbox.result()
+            pipeline.shutdown()
 
-        # Clean up persistent session if it was used
-        if persistent_mode:
-            print(f"Worker {worker_id}: Stopping persistent Python environment...")
-            model.stop_persistent_session()
-            print(f"Worker {worker_id}: Persistent environment stopped.")
+        # Return the container to the pool, or clean up the persistent session if it was used
+        with metrics.stage("teardown"):
+            if code_runner is not None:
+                pool_info["reset_seconds"] = get_container_pool(args).checkin(code_runner)
+                code_runner = None
+            elif persistent_mode:
+                print(f"Worker {worker_id}: Stopping persistent Python environment...")
+                model.stop_persistent_session()
+                print(f"Worker {worker_id}: Persistent environment stopped.")
 
-        return {
+        output = {
             **query_data,
             "result": result,
             "worker_id": worker_id,
-            "status": "success"
+            "status": "success",
+            "metrics": get_metrics_record(metrics, args)
         }
+        if pool_info is not None:
+            output["pool"] = pool_info
+        return output
 
     except Exception as e:
         print(f"Worker {worker_id}: Error occurred: {e}")
+        # Queries that ran out of rate limit retries are requeued instead of failing
+        status = "rate_limited" if isinstance(e, RATE_LIMIT_ERRORS) else "error"
         import traceback
         traceback.print_exc()
         
         try:
-            if 'scientist' in locals() and args.persistent:
+            # Let a sandbox that is still being prepared finish before cleaning it up
+            if pipeline is not None:
+                pipeline.shutdown(wait=True)
+            if code_runner is not None:
+                get_container_pool(args).checkin(code_runner)
+            elif 'model' in locals() and args.persistent:
                 model.stop_persistent_session()
         except:
             pass
             
-        return {
+        output = {
             **query_data,
             "result": None,
             "worker_id": worker_id,
-            "status": "error",
-            "error": str(e)
+            "status": status,
+            "error": str(e),
+            "metrics": get_metrics_record(metrics, args)
         }
+        if pool_info is not None:
+            output["pool"] = pool_info
+        return output
 
 
-def collect_results_with_progress(pool_results, total_queries):
-    """Collect results from the pool with a progress bar."""
+def get_metrics_record(metrics, args):
+    """Get the metrics record of a query, labelled with the prompting strategy and model of the run."""
+    prompt_name, _ = get_query_format(args)
+    return {"prompt": prompt_name, "model": args.model, **metrics.to_dict()}
+
+
+def summarize_pool_usage(results):
+    """Print the container pool hit/miss and reset latency statistics of a run."""
+    pool_infos = [r["pool"] for r in results if r.get("pool")]
+    if not pool_infos:
+        return
+    hits = sum(1 for info in pool_infos if info["hit"])
+    reset_times = [info["reset_seconds"] for info in pool_infos if "reset_seconds" in info]
+    checkout_times = [info["checkout_seconds"] for info in pool_infos]
+    print(f"Container pool: {hits} hits, {len(pool_infos) - hits} misses "
+          f"(hit rate: {hits / len(pool_infos):.1%})")
+    print(f"Container pool: average checkout time {sum(checkout_times) / len(checkout_times):.2f} seconds")
+    if reset_times:
+        print(f"Container pool: average reset latency {sum(reset_times) / len(reset_times):.3f} seconds "
+              f"(max: {max(reset_times):.3f} seconds)")
+
+
+async def prepare_sandbox_async(runner, from_pool, query_data, args, index, metrics):
+    """Start the persistent environment of a query (unless it comes from the pool) and stage its dataset."""
+    code_runner = runner.code_runner
+    persistent_mode = True
+    if not from_pool:
+        with metrics.stage("container_startup"):
+            persistent_mode = await runner.start_persistent_container()
+        if not persistent_mode:
+            print(f"Query {index}: Failed to start persistent environment. Falling back to one-off mode.")
+            code_runner.persistent = False
+
+    dataset_path = query_data["dataset_path"]
+
+    # If in persistent mode, make the dataset file available in the container
+    with metrics.stage("staging"):
+        if persistent_mode and os.path.exists(dataset_path) and dataset_path not in code_runner.preloaded_datasets:
+            if not code_runner.is_mounted(dataset_path):
+                await runner.upload_file(dataset_path, dataset_path)
+            columnar_copy = find_columnar_copy(dataset_path) if args.columnar else None
+            if columnar_copy is not None:
+                if not code_runner.is_mounted(columnar_copy["path"]):
+                    await runner.upload_file(columnar_copy["path"], columnar_copy["path"])
+                await runner.register_columnar_copy(dataset_path, columnar_copy["path"], columnar_copy["encoding"])
+            if args.group_by_dataset:
+                with metrics.stage("preload"):
+                    encoding = columnar_copy["encoding"] if columnar_copy is not None else "utf-8"
+                    await runner.preload_dataset(dataset_path, encoding)
+    return persistent_mode
+
+
+async def process_single_query_async(query_data, args, index, http_client, semaphore, pool=None, first_reply=None):
+    """Process a single query as one of many conversations in flight on the event loop."""
+    code_runner = None
+    from_pool = False
+    pool_info = None
+    sandbox = None
+    metrics = QueryMetrics()
+    try:
+        chatbot = configure_chatbot(create_async_chatbot(args, semaphore), args)
+
+        # Take a warm container from the pool if enabled, otherwise use a dedicated one
+        if args.persistent and pool is not None:
+            with metrics.stage("container_startup"):
+                code_runner, pool_info = await asyncio.to_thread(pool.checkout, query_data["dataset_path"])
+            from_pool = code_runner is not None
+        if code_runner is None:
+            code_runner = await asyncio.to_thread(
+                CodeRunner, persistent=args.persistent, session_timeout=args.session_timeout,
+                worker_id=f"async-{os.getpid()}-{index}", http_port=0, labels={POOL_LABEL: args.pool_id},
+                **get_runner_kwargs(args))
+        runner = AsyncCodeRunner(code_runner, http_client)
+        model = AsyncBaseline(chatbot, runner)
+
+        persistent_mode = args.persistent
+        if args.persistent and args.pipeline:
+            # Prepare the sandbox concurrently with building and answering the first prompt
+            sandbox = asyncio.create_task(prepare_sandbox_async(runner, from_pool, query_data, args, index, metrics))
+        elif args.persistent:
+            persistent_mode = await prepare_sandbox_async(runner, from_pool, query_data, args, index, metrics)
+
+        query = query_data["query"]
+        dataset_path = query_data["dataset_path"]
+        dataset_description = query_data["dataset_description"]
+
+        _, qf = get_query_format(args)
+        result = await model.answer(query, dataset_path, dataset_description, qf=qf, post_steps=False,
+                                    metrics=metrics, sandbox=sandbox, first_reply=first_reply)
+        result.pop("metrics", None)
+        if sandbox is not None:
+            persistent_mode = await sandbox
+
+        # Return the container to the pool, or clean up the persistent session if it was used
+        with metrics.stage("teardown"):
+            if from_pool:
+                pool_info["reset_seconds"] = await asyncio.to_thread(pool.checkin, code_runner)
+                from_pool = False
+            elif persistent_mode:
+                await runner.stop_persistent_container()
+
+        output = {
+            **query_data,
+            "result": result,
+            "worker_id": 0,
+            "status": "success",
+            "metrics": get_metrics_record(metrics, args)
+        }
+
+    except Exception as e:
+        print(f"Query {index}: Error occurred: {e}")
+        status = "rate_limited" if isinstance(e, RATE_LIMIT_ERRORS) else "error"
+        import traceback
+        traceback.print_exc()
+
+        try:
+            # Let a sandbox that is still being prepared finish before cleaning it up
+            if sandbox is not None:
+                await asyncio.wait([sandbox])
+            if from_pool:
+                await asyncio.to_thread(pool.checkin, code_runner)
+            elif code_runner is not None and args.persistent:
+                await asyncio.to_thread(code_runner.stop_persistent_container)
+        except:
+            pass
+
+        output = {
+            **query_data,
+            "result": None,
+            "worker_id": 0,
+            "status": status,
+            "error": str(e),
+            "metrics": get_metrics_record(metrics, args)
+        }
+
+    if pool_info is not None:
+        output["pool"] = pool_info
+    return output
+
+
+def parse_provider_limits(provider_limits):
+    """Parse --provider-limit values of the form provider=N into a dictionary."""
+    limits = {}
+    for item in provider_limits or []:
+        provider, _, limit = item.partition("=")
+        if not limit:
+            raise ValueError(f"Invalid provider limit '{item}', expected provider=N")
+        limits[provider.strip()] = int(limit)
+    return limits
+
+
+async def run_queries_async(pending, args, store):
+    """Run all pending queries concurrently from a single process and checkpoint them as they finish."""
+    provider_limits = parse_provider_limits(args.provider_limit)
+    semaphores = {}
+
+    def get_semaphore(provider):
+        # One limit per provider, shared by all conversations that use it
+        if provider not in semaphores:
+            semaphores[provider] = asyncio.Semaphore(provider_limits.get(provider, args.max_concurrency))
+        return semaphores[provider]
+
+    pool = None
+    if args.persistent and args.pool_size > 0:
+        pool = ContainerPool(size=args.pool_size, session_timeout=args.session_timeout, pool_id=args.pool_id,
+                             runner_kwargs=get_runner_kwargs(args))
+        print(f"Warming up {args.pool_size} pooled container(s)...")
+        await asyncio.to_thread(pool.warm_up)
+
+    # Bounds the number of conversations in flight (and therefore of containers)
+    conversations = asyncio.Semaphore(args.max_concurrency)
+    # Docker calls and one-off containers block a worker thread each, so every conversation needs its own
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=args.max_concurrency + 4))
+    limits = httpx.Limits(max_connections=args.max_concurrency, max_keepalive_connections=args.max_concurrency)
+
+    results = []
+    async with httpx.AsyncClient(limits=limits) as http_client:
+
+        async def run(index, key, query):
+            async with conversations:
+                result = await process_single_query_async(
+                    query, args, index, http_client, get_semaphore(args.api), pool, args.first_replies.get(key))
+            return key, result
+
+        tasks = [asyncio.create_task(run(i, key, query)) for i, (key, query) in enumerate(pending)]
+        pbar = tqdm.tqdm(total=len(tasks), desc="Processing queries")
+        for next_done in asyncio.as_completed(tasks):
+            key, result = await next_done
+            store.append(key, result)
+            results.append(summarize_result(result, key))
+            pbar.update(1)
+            pbar.set_description("Completed" if result["status"] == "success" else "Error")
+        pbar.close()
+
+    if pool is not None:
+        await asyncio.to_thread(pool.shutdown)
+    return results
+
+
+def create_batch_chatbot(args):
+    """Create the chatbot that builds (or, for the local batch adapter, answers) the first prompts of a batch."""
+    chatbot = configure_chatbot(create_chatbot(args), args)
+    if hasattr(chatbot, 'persistent_mode'):
+        chatbot.persistent_mode = args.persistent
+    return chatbot
+
+
+def build_first_turn_requests(pending, args):
+    """Build the first prompt of every pending query as a batch request, with the result key as custom_id."""
+    _, qf = get_query_format(args)
+    chatbot = create_batch_chatbot(args)
+
+    lines = {}
+    for key, query in tqdm.tqdm(pending, desc="Building first prompts"):
+        queries = qf(query["query"], query["dataset_path"], query["dataset_description"]).get_query_format()
+        if not queries.get("pre") or key in lines:
+            continue
+        chatbot.delete_history()
+        if isinstance(chatbot, APIChatbot):
+            messages = chatbot.build_messages(queries["pre"][0])
+            completion_kwargs = chatbot.get_completion_kwargs()
+        else:
+            messages = [{"role": "user", "content": queries["pre"][0]}]
+            completion_kwargs = {}
+        lines[key] = make_batch_line(key, args.model, messages, completion_kwargs)
+    return list(lines.values())
+
+
+def get_batch_adapter(args):
+    """Create the batch adapter selected with --batch-first-turn."""
+    if args.batch_first_turn == "local":
+        batch_dir = args.batch_dir or f"{os.path.splitext(args.output)[0]}.batch"
+        return LocalBatchAdapter(batch_dir, partial(create_batch_chatbot, args))
+    elif args.batch_first_turn == "openai":
+        if args.api not in ("openai", "azure"):
+            raise ValueError(f"The OpenAI batch API is not available for --api {args.api}")
+        return OpenAIBatchAdapter(create_chatbot(args).client)
+    else:
+        raise ValueError(f"Invalid batch adapter: {args.batch_first_turn}")
+
+
+def run_first_turn_batch(pending, args):
+    """
+    Get the replies to the first prompts of all pending queries from one batch job.
+
+    Returns:
+        (dict): The reply (`content` and `usage`) to the first prompt, keyed by result key. Queries
+                whose request failed are left out and asked interactively instead.
+    """
+
+    lines = build_first_turn_requests(pending, args)
+    print(f"Submitting the first turn of {len(lines)} queries as a batch ({args.batch_first_turn})...")
+    replies = get_batch_adapter(args).run(lines, poll_interval=args.batch_poll_interval,
+                                          timeout=args.batch_timeout)
+    print(f"Batch returned {len(replies)} of {len(lines)} first replies; the others are asked interactively")
+    return replies
+
+
+def summarize_result(result, key):
+    """Keep only the fields of a result that are needed for the end-of-run report."""
+    summary = {field: result.get(field) for field in ("query_id", "query", "status", "error", "worker_id")}
+    summary["key"] = key
+    if result.get("pool"):
+        summary["pool"] = result["pool"]
+    return summary
+
+
+def collect_results_with_progress(completed, total_queries, store):
+    """Collect (key, result) pairs as they complete with a progress bar, checkpointing each one as it arrives."""
     results = []
     
     # Create a progress bar
     pbar = tqdm.tqdm(total=total_queries, desc="Processing queries")
     
     # Collect results as they complete
-    for result in pool_results:
+    while True:
         try:
-            # This will block until the result is ready
-            completed_result = result.get()
-            results.append(completed_result)
-            pbar.update(1)
-            
-            # Print status
-            if completed_result["status"] == "success":
-                pbar.set_description(f"Completed (Worker {completed_result['worker_id']})")
-            else:
-                pbar.set_description(f"Error (Worker {completed_result['worker_id']})")
-                
+            # This will block until the next result is ready
+            key, completed_result = next(completed)
+        except StopIteration:
+            break
         except Exception as e:
             print(f"Error collecting result: {e}")
             pbar.update(1)
+            continue
+
+        store.append(key, completed_result)
+        results.append(summarize_result(completed_result, key))
+        pbar.update(1)
+        
+        # Print status
+        if completed_result["status"] == "success":
+            pbar.set_description(f"Completed (Worker {completed_result['worker_id']})")
+        else:
+            pbar.set_description(f"Error (Worker {completed_result['worker_id']})")
     
     pbar.close()
     return results
 
 
-def main(args):
-    queries_path = args.queries
-    root = Path(__file__).resolve().parent
-    data_root = root.parent / "data"
+# Settings, slot and result queue of a worker process, set by init_worker
+_worker_args = None
+_worker_id = None
+_result_queue = None
+
 
+def init_worker(args, next_slot, result_queue=None):
+    """Give a new worker process the run settings (a list with the settings of every cell in a sweep),
+    a slot, which names its containers and ports, and the queue that streams results of batches back."""
+    global _worker_args, _worker_id, _result_queue
+    _worker_args = args
+    _result_queue = result_queue
+    with next_slot.get_lock():
+        _worker_id = next_slot.value
+        next_slot.value += 1
 
+
+def get_job_args(job, args):
+    """Get the settings of a (key, query) job, or of the cell of a (key, query, cell) job of a sweep."""
+    return args[job[2]] if len(job) > 2 else args
+
+
+def run_job(job, args=None, worker_id=None):
+    """Process a job in the slot of the current worker process (or with the given settings and worker ID)."""
+    if args is None:
+        args, worker_id = _worker_args, _worker_id
+    key, query = job[:2]
+    job_args = get_job_args(job, args)
+    return key, process_single_query(query, job_args, worker_id, job_args.first_replies.get(key))
+
+
+def stream_batch(batch):
+    """Process a batch of (key, query) pairs that share a dataset one after another in the current worker
+    process, sending every (key, result) pair to the result queue as soon as it is done."""
+    for job in batch:
+        _result_queue.put(run_job(job))
+
+
+def iter_streamed_results(result_queue, batches_done, total):
+    """Yield the (key, result) pairs sent by stream_batch until all `total` have arrived."""
+    for _ in range(total):
+        while True:
+            try:
+                yield result_queue.get(timeout=1)
+                break
+            except queue.Empty:
+                # A batch that failed would never send its remaining results
+                if batches_done.ready() and not batches_done.successful():
+                    batches_done.get()
+
+
+def run_pending(pending, args, store, cells=None):
+    """
+    Process (key, query) pairs in the selected execution mode, checkpointing every result.
+
+    In a sweep, `pending` holds (key, query, cell) jobs, `cells` the settings of every cell and
+    `args` the settings that apply to the whole sweep (workers, scheduling).
+    """
+    if args.group_by_dataset:
+        # Queries on the same dataset run back to back, so they can reuse the container that preloaded it
+        pending = list(chain.from_iterable(group_by_dataset(pending)))
+
+    if args.async_mode:
+        if cells is not None:
+            raise ValueError("Async mode is not supported in sweeps")
+        # All conversations are driven from one event loop in this process
+        print(f"Running in async mode with up to {args.max_concurrency} concurrent queries...")
+        return asyncio.run(run_queries_async(pending, args, store))
+    elif args.num_workers == 1:
+        # Sequential processing (for debugging or comparison)
+        print("Running in sequential mode...")
+        results = []
+        for job in tqdm.tqdm(pending, desc="Processing queries"):
+            key, result = run_job(job, cells or args, worker_id=0)
+            store.append(key, result)
+            results.append(summarize_result(result, key))
+        return results
+    else:
+        # Parallel processing
+        print(f"Running in parallel mode with {args.num_workers} workers...")
+        
+        # Create a pool of worker processes. Idle workers pull the next job from the queue, and the
+        # worker ID (container name and port) comes from the worker's slot, not from the query
+        next_slot = mp.Value("i", 0)
+        result_queue = mp.Queue()
+        with mp.Pool(processes=args.num_workers, initializer=init_worker,
+                     initargs=(cells or args, next_slot, result_queue)) as pool:
+            if args.group_by_dataset:
+                # A worker takes all queries of a dataset (split so the work is still spread over the workers),
+                # and its results stream back through the queue one query at a time
+                batches = group_by_dataset(pending, max_batch_size=-(-len(pending) // args.num_workers))
+                batches_done = pool.map_async(stream_batch, batches, chunksize=1)
+                completed = iter_streamed_results(result_queue, batches_done, len(pending))
+            else:
+                completed = pool.imap_unordered(run_job, pending, chunksize=1)
+            
+            # Collect results with progress tracking
+            return collect_results_with_progress(completed, len(pending), store)
+
+
+def load_queries(queries_path, data_type):
+    """Load the queries of a JSON or CSV file, with dataset paths pointing into the data folder of data_type."""
     # Determine the base path for datasets
-    if args.data_type == 'qrdata':
-        base_path = str(data_root / 'qrdata')
-    elif args.data_type == 'real':
-        base_path = str(data_root / 'real_data')
-    elif args.data_type == 'synthetic':
-        base_path = str(data_root / 'synthetic_data')
+    if data_type == 'qrdata':
+        base_path = str(DATA_ROOT / 'qrdata')
+    elif data_type == 'real':
+        base_path = str(DATA_ROOT / 'real_data')
+    elif data_type == 'synthetic':
+        base_path = str(DATA_ROOT / 'synthetic_data')
     else:
-        raise ValueError(f"Invalid data type: {args.data_type}")
+        raise ValueError(f"Invalid data type: {data_type}")
 
     # Load queries based on file type
     if queries_path.endswith('.csv'):
@@ -194,68 +741,146 @@ def main(args):
     for q in queries:
         filename = os.path.basename(q['dataset_path'])
         q['dataset_path'] = os.path.join(base_path, filename)
+    # Query files written before ids were added (and CSV files) get the same ids as create_json.py
+    return add_query_ids(queries)
 
-    print(f"Loaded {len(queries)} queries")
-    print(f"Using {args.num_workers} workers for parallel processing")
 
-    # Create output directory if it doesn't exist
-    output_dir = os.path.dirname(args.output)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+def start_rate_limiter(args):
+    """
+    Create the rate limiter of --rate-limit, shared by all workers of the run.
 
-    # Process queries in parallel
-    start_time = time.time()
-    
-    if args.num_workers == 1:
-        # Sequential processing (for debugging or comparison)
-        print("Running in sequential mode...")
-        results = []
-        for i, query in enumerate(tqdm.tqdm(queries, desc="Processing queries")):
-            result = process_single_query(query, args, worker_id=0)
-            results.append(result)
-    else:
-        # Parallel processing
-        print(f"Running in parallel mode with {args.num_workers} workers...")
-        
-        # Create a pool of worker processes
-        with mp.Pool(processes=args.num_workers) as pool:
-            # Submit all jobs to the pool
-            pool_results = []
-            for i, query in enumerate(queries):
-                # Assign worker ID based on query index
-                worker_id = i % args.num_workers
-                result = pool.apply_async(process_single_query, (query, args, worker_id))
-                pool_results.append(result)
-            
-            # Collect results with progress tracking
-            results = collect_results_with_progress(pool_results, len(queries))
-    
-    end_time = time.time()
-    total_time = end_time - start_time
-    
-    # Report statistics
+    Returns:
+        (RateLimiterManager, RateLimiter): The manager to shut down at the end (None if the limiter is
+                                           local to this process) and the limiter (None if not limited)
+    """
+
+    if not args.rate_limit:
+        return None, None
+    limits = parse_rate_limits(args.rate_limit)
+    if args.num_workers > 1 and not args.async_mode:
+        return start_shared_rate_limiter(limits)
+    return None, RateLimiter(limits)
+
+
+def report_results(results, num_pending, total_time):
+    """Print the success/failure statistics of a run."""
     successful_results = [r for r in results if r["status"] == "success"]
-    failed_results = [r for r in results if r["status"] == "error"]
+    failed_results = [r for r in results if r["status"] != "success"]
     
     print(f"\nProcessing complete!")
     print(f"Total time: {total_time:.2f} seconds")
-    print(f"Average time per query: {total_time/len(queries):.2f} seconds")
+    if num_pending:
+        print(f"Average time per query: {total_time/num_pending:.2f} seconds")
     print(f"Successful queries: {len(successful_results)}")
     print(f"Failed queries: {len(failed_results)}")
     
+    summarize_pool_usage(results)
+    
     if failed_results:
         print("\nFailed queries:")
         for result in failed_results:
             print(f"  - Query: {result['query'][:50]}... (Error: {result.get('error', 'Unknown')})")
 
-    # Save the output
-    with open(args.output, "w") as f:
-        json.dump(results, f, indent=2)
-        
-    print(f"Results saved to {args.output}")
 
+def export_results(store, output_path, keys, include_unlisted=True):
+    """Save the results of the given keys (in order) to output_path, with their aggregated metrics next to it."""
+    # Stream the records from the checkpoint instead of keeping them in memory
+    num_saved = store.export_json(output_path, order=keys, include_unlisted=include_unlisted)
+    print(f"Results ({num_saved} queries) saved to {output_path}")
 
-if __name__ == "__main__":
+    # Aggregate the cost and latency metrics of all queries of the output, including resumed ones
+    metrics_summary = aggregate_metrics(metrics_table(store.iter_records(order=keys, include_unlisted=include_unlisted)))
+    metrics_path = f"{os.path.splitext(output_path)[0]}.metrics.json"
+    with open(metrics_path, "w") as f:
+        json.dump(metrics_summary, f, indent=2)
+    print_metrics_report(metrics_summary)
+    print(f"Metrics saved to {metrics_path}")
+
+
+def requeue_rate_limited(results, pending, args, store, cells=None):
+    """Run the queries that were still rate limited after all retries again, for up to --max-requeues rounds."""
+    for requeue_round in range(args.max_requeues):
+        rate_limited = {r["key"] for r in results if r["status"] == "rate_limited"}
+        if not rate_limited:
+            break
+        print(f"Requeueing {len(rate_limited)} rate limited queries "
+              f"(round {requeue_round + 1}/{args.max_requeues})...")
+        results = [r for r in results if r["key"] not in rate_limited]
+        results += run_pending([job for job in pending if job[0] in rate_limited], args, store, cells)
+    return results
+
+
+def shutdown_pools(args):
+    """Stop the warm containers of all worker pools once all queries are processed."""
+    if args.persistent and (args.pool_size > 0 or args.async_mode):
+        if _container_pool is not None:
+            _container_pool.shutdown()
+        remove_pool_containers(args.pool_id)
+
+
+def main(args):
+    queries = load_queries(args.queries, args.data_type)
+
+    print(f"Loaded {len(queries)} queries")
+    print(f"Using {args.num_workers} workers for parallel processing")
+
+    # Create output directory if it doesn't exist
+    output_dir = os.path.dirname(args.output)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Every result is checkpointed as soon as it arrives, so an interrupted run can be resumed
+    prompt_name, _ = get_query_format(args)
+    checkpoint_path = args.checkpoint or f"{os.path.splitext(args.output)[0]}.checkpoint.jsonl"
+    store = ResultStore(checkpoint_path)
+    all_keys = [make_result_key(q["query_id"], args.model, prompt_name) for q in queries]
+    if args.resume:
+        completed = store.completed_keys()
+        pending = [(key, q) for key, q in zip(all_keys, queries) if key not in completed]
+        print(f"Resuming from {checkpoint_path}: skipping {len(queries) - len(pending)} completed queries")
+    else:
+        if store.exists():
+            print(f"Warning: Existing checkpoint moved to {store.backup()}. Use --resume to continue it instead.")
+        pending = list(zip(all_keys, queries))
+
+    # Containers of all worker pools carry this id so they can be removed at the end of the run
+    args.pool_id = f"run-{os.getpid()}"
+
+    # The data folder is mounted read-only at the same path, so dataset paths in the prompts stay valid
+    args.data_mount = str(DATA_ROOT) if args.mount_data else None
+
+    # Start the queries that are expected to take longest first, so no worker is left with a long tail
+    if args.schedule == "cost":
+        history_paths = [checkpoint_path, f"{checkpoint_path}.bak"] + args.cost_history
+        pending = order_by_cost(pending, load_turn_history(history_paths, prompt_name))
+
+    # Requests per provider and model are limited across all workers
+    rate_limiter_manager, args.rate_limiter = start_rate_limiter(args)
+
+    # Process queries in parallel
+    start_time = time.time()
+
+    # The first prompts do not depend on each other, so they can be answered by one batch job
+    args.first_replies = run_first_turn_batch(pending, args) if args.batch_first_turn and pending else {}
+    
+    results = run_pending(pending, args, store)
+
+    # Queries that were still rate limited after all retries are requeued
+    results = requeue_rate_limited(results, pending, args, store)
+
+    if rate_limiter_manager is not None:
+        rate_limiter_manager.shutdown()
+
+    shutdown_pools(args)
+    
+    report_results(results, len(pending), time.time() - start_time)
+
+    # Save the output in the original query order
+    export_results(store, args.output, all_keys)
+
+
+def build_parser():
+    """Build the command line parser of run_baselines (its defaults are also the defaults of sweep cells)."""
     parser = argparse.ArgumentParser(
         prog="run_baselines_parallel.py", description="Run the baselines with parallel processing",
         epilog="Example: python run_baselines_parallel.py --queries queries/queries.json --output runs/output.json --model google/gemini-1.5-flash-002 --num-workers 4")
@@ -271,6 +896,9 @@ if __name__ == "__main__":
                         choices=['qrdata', 'real', 'synthetic'], help="Type of data to process (qrdata, real, or synthetic)")
     parser.add_argument("--api", type=str, default="azure",
         help="Type of API to use. Options: vertex, azure, test, local, openai, together. Choosing 'local' will use a local chatbot.")
+    parser.add_argument("--base-url", type=str, default=None,
+        help="Base URL of an OpenAI-compatible server for --api openai (e.g. http://localhost:8000/v1 for "
+             "baselines.mock_llm_server)")
     parser.add_argument("--rpc-address", type=str, default=None,
         help="Address of the RPC server to connect to (will override the --api flag)")
     parser.add_argument("--veridical", action=argparse.BooleanOptionalAction, 
@@ -287,15 +915,87 @@ if __name__ == "__main__":
                         help="Use persistent Python environment for code execution")
     parser.add_argument("--session-timeout", type=int, default=3600, 
                         help="Timeout for persistent sessions in seconds (default: 3600)")
+    parser.add_argument("--schedule", type=str, default="cost", choices=["cost", "file"],
+                        help="Order in which queries are started: 'cost' starts the queries with the largest datasets "
+                             "and most turns in previous runs first, 'file' keeps the order of the queries file")
+    parser.add_argument("--batch-first-turn", type=str, default=None, choices=["openai", "local"],
+                        help="Send the first prompt of all queries as one batch job before the conversations start: "
+                             "'openai' uses the OpenAI Batch API (--api openai or azure), 'local' is a file-based "
+                             "stand-in that answers the requests with the selected chatbot, for testing")
+    parser.add_argument("--batch-poll-interval", type=float, default=30,
+                        help="Seconds between status checks of the batch job")
+    parser.add_argument("--batch-timeout", type=float, default=None,
+                        help="Stop waiting for the batch job after this many seconds and ask the remaining first "
+                             "prompts interactively (default: wait until the batch is done)")
+    parser.add_argument("--batch-dir", type=str, default=None,
+                        help="Folder of the input and output files of the local batch adapter "
+                             "(default: <output>.batch)")
+    parser.add_argument("--pipeline", action=argparse.BooleanOptionalAction,
+                        help="In persistent mode, start the container and stage the dataset while the first prompt "
+                             "is built and sent, and wait for them only before running the first code block")
+    parser.add_argument("--group-by-dataset", action=argparse.BooleanOptionalAction,
+                        help="In persistent mode, run queries on the same dataset back to back in the same worker "
+                             "and preload the parsed dataset in the container, so that pd.read_csv returns a copy "
+                             "of it instead of parsing the file again (combine with --pool-size to keep it across queries)")
+    parser.add_argument("--cost-history", action="append", default=[],
+                        help="Outputs or checkpoints of previous runs used to predict the turns per dataset "
+                             "(the checkpoint of --output is always used)")
+    parser.add_argument("--rate-limit", action="append", default=[],
+                        help="Limit requests (and optionally tokens) per minute to a provider or model across all "
+                             "workers, as provider[/model]=RPM[:TPM], e.g. openai=500:200000 (repeatable)")
+    parser.add_argument("--rate-limit-retries", type=int, default=5,
+                        help="Retries of a request after rate limit errors, honoring Retry-After (default: 5)")
+    parser.add_argument("--max-requeues", type=int, default=3,
+                        help="Rounds in which queries that ran out of rate limit retries are requeued (default: 3)")
+    parser.add_argument("--compact-history-kb", type=float, default=None,
+                        help="Truncate earlier code output observations longer than this many KB in the requests "
+                             "to the model, so the cost of a turn stays bounded (default: no compaction)")
+    parser.add_argument("--response-cache", action=argparse.BooleanOptionalAction,
+                        help="Cache LLM replies on disk and reuse them for identical requests")
+    parser.add_argument("--response-cache-dir", type=str, default=get_cache_dir(),
+                        help="Directory of the response cache (default: .cache/responses)")
+    parser.add_argument("--cache-max-mb", type=float, default=1024,
+                        help="Size limit of the response cache in MB; least recently used replies are evicted "
+                             "(0 for no limit, default: 1024)")
+    parser.add_argument("--replay", action=argparse.BooleanOptionalAction,
+                        help="Only use cached LLM replies; queries whose requests are not cached fail instead "
+                             "of calling the API")
+    parser.add_argument("--checkpoint", type=str, default=None,
+                        help="Path to the JSONL checkpoint file (default: <output>.checkpoint.jsonl)")
+    parser.add_argument("--resume", action=argparse.BooleanOptionalAction,
+                        help="Resume from the checkpoint file, skipping queries that were already completed")
+    parser.add_argument("--exec-timeout", type=float, default=30,
+                        help="Time limit in seconds of one code execution in persistent mode; code running longer "
+                             "is cancelled in the container and the model is told it timed out (default: 30)")
+    parser.add_argument("--mount-data", action=argparse.BooleanOptionalAction,
+                        help="In persistent mode, bind-mount the data folder read-only into the containers "
+                             "instead of uploading each dataset over HTTP")
+    parser.add_argument("--columnar", action=argparse.BooleanOptionalAction, default=True,
+                        help="In persistent mode, also stage the columnar (Parquet) copy of the dataset so that "
+                             "pd.read_csv in the container loads it (requires python -m baselines.columnar)")
+    parser.add_argument("--pool-size", type=int, default=0,
+                        help="Number of warm containers kept per worker process in persistent mode. "
+                             "Containers are reset and reused between queries (default: 0, one container per query)")
+    parser.add_argument("--async-mode", action=argparse.BooleanOptionalAction,
+                        help="Run all queries concurrently from a single process with asyncio instead of worker processes")
+    parser.add_argument("--max-concurrency", type=int, default=64,
+                        help="Maximum number of queries in flight in async mode (default: 64)")
+    parser.add_argument("--provider-limit", type=str, action="append", default=None,
+                        help="Maximum number of concurrent requests to a provider in async mode, "
+                             "e.g. --provider-limit openai=32 (default: --max-concurrency)")
     parser.add_argument("--num-workers", type=int, default=1,
                         help=f"Number of worker processes to use (default: {mp.cpu_count()})")
+    return parser
+
 
+if __name__ == "__main__":
+    parser = build_parser()
     args = parser.parse_args()
 
     # Validate number of workers
     if args.num_workers < 1:
         args.num_workers = 1
-    elif args.num_workers > mp.cpu_count():
+    elif args.num_workers > mp.cpu_count() and not args.async_mode:
         print(f"Warning: Requested {args.num_workers} workers, but only {mp.cpu_count()} CPUs available")
 
     main(args)
@@ -0,0 +1,95 @@
+import os
+import json
+import statistics
+
+from .result_store import ResultStore
+
+# Number of turns assumed for datasets without history
+DEFAULT_TURNS = 4
+
+
+def iter_history_records(path):
+    """Iterate over the result records of a previous run (a JSON output or a JSONL checkpoint)."""
+    if not os.path.exists(path):
+        return
+    if path.endswith(".jsonl") or path.endswith(".bak"):
+        for entry in ResultStore(path).iter_entries():
+            yield entry["record"]
+    else:
+        with open(path, "r") as f:
+            yield from json.load(f)
+
+
+def load_turn_history(paths, prompt_name=None):
+    """
+    Collect the number of turns that previous runs needed per dataset.
+
+    Args:
+        paths (list): JSON outputs or JSONL checkpoints of previous runs (missing files are skipped)
+        prompt_name (str, optional): Only use runs of this prompting strategy (when it was recorded)
+
+    Returns:
+        (dict): The median number of turns, keyed by dataset file name
+    """
+
+    turns = {}
+    for path in paths:
+        try:
+            for record in iter_history_records(path):
+                metrics = record.get("metrics") or {}
+                if prompt_name and metrics.get("prompt", prompt_name) != prompt_name:
+                    continue
+                num_turns = metrics.get("num_turns")
+                if num_turns is None and record.get("result"):
+                    # Results without metrics: one turn per code execution, plus the first and final turns
+                    num_turns = len(record["result"].get("codes", [])) + 2
+                if num_turns is not None:
+                    turns.setdefault(os.path.basename(record.get("dataset_path", "")), []).append(num_turns)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read cost history from {path}: {e}")
+    return {dataset: statistics.median(values) for dataset, values in turns.items()}
+
+
+def predict_cost(query, turn_history, default_turns=DEFAULT_TURNS):
+    """
+    Predict the relative cost of a query from the size of its dataset and the turns it needed before.
+
+    Every turn may load the dataset again, so the expected number of turns is weighted by the
+    dataset size (in MB). Datasets without history are assumed to need `default_turns`.
+    """
+
+    dataset_path = query["dataset_path"]
+    try:
+        size_mb = os.path.getsize(dataset_path) / 1e6
+    except OSError:
+        size_mb = 0.0
+    expected_turns = turn_history.get(os.path.basename(dataset_path), default_turns)
+    return expected_turns * (1 + size_mb)
+
+
+def order_by_cost(pending, turn_history):
+    """Sort (key, query) pairs so that the most expensive queries are started first."""
+    default_turns = statistics.median(turn_history.values()) if turn_history else DEFAULT_TURNS
+    return sorted(pending, key=lambda item: predict_cost(item[1], turn_history, default_turns), reverse=True)
+
+
+def group_by_dataset(pending, max_batch_size=None):
+    """
+    Group (key, query) pairs that share a dataset into batches, so each batch can run on one container.
+
+    Args:
+        pending (list): The (key, query) pairs, in the order in which they should be started
+        max_batch_size (int, optional): Split larger groups, so one dataset does not keep a single worker busy
+
+    Returns:
+        (list): Batches of (key, query) pairs, in the order of their first query
+    """
+
+    groups = {}
+    for item in pending:
+        groups.setdefault(item[1]["dataset_path"], []).append(item)
+    batches = []
+    for items in groups.values():
+        size = max_batch_size or len(items)
+        batches.extend(items[i:i + size] for i in range(0, len(items), size))
+    return batches
@@ -0,0 +1,188 @@
+"""
+Run a matrix of data sources, prompting strategies and models as one sweep.
+
+All cells share one checkpoint store, one pool of worker processes (and with it the warm
+containers, the dataset profile cache and the response cache of every worker), so queries
+of all cells are scheduled together instead of one run_baselines invocation per cell.
+Every cell is saved as {output_folder}/{source}/{source}_{prompt}_{model}.json, the naming
+expected by compile_results.py.
+
+Example spec (JSON):
+
+    {
+        "output_folder": "output",
+        "sources": {"qrdata": "data/json/qrdata.json", "real": "data/json/real_data.json"},
+        "prompts": ["basic", "cot", "pot", "react"],
+        "models": [{"api": "openai", "model": "gpt-4o"}, {"api": "openai", "model": "gpt-4o-mini"}],
+        "options": {"persistent": true, "num_workers": 8, "pool_size": 1, "mount_data": true}
+    }
+
+Options are run_baselines arguments (e.g. "pool_size" or "pool-size") and apply to all cells.
+
+Example: python -m baselines.sweep --spec sweeps/all.json --resume
+"""
+
+import os
+import copy
+import json
+import time
+import argparse
+
+from baselines.run_baselines import (DATA_ROOT, build_parser, export_results, load_queries, report_results,
+                                     requeue_rate_limited, run_first_turn_batch, run_pending, shutdown_pools,
+                                     start_rate_limiter)
+from baselines.result_store import ResultStore, make_result_key
+from baselines.scheduling import DEFAULT_TURNS, load_turn_history, predict_cost
+
+# run_baselines flag of every prompting strategy (basic is the default format)
+PROMPT_FLAGS = {"basic": None, "cot": "chain", "pot": "potm", "react": "react"}
+
+# Settings that are given by the cells of the matrix and cannot be set as options
+CELL_FIELDS = ("queries", "output", "data_type", "api", "model", "potm", "react", "chain", "checkpoint", "resume")
+
+
+def load_spec(path):
+    """Load and check a sweep spec."""
+    with open(path, "r") as f:
+        spec = json.load(f)
+    for field in ("sources", "prompts", "models"):
+        if not spec.get(field):
+            raise ValueError(f"The sweep spec must list {field}")
+    for source in spec["sources"]:
+        if source not in ("qrdata", "real", "synthetic"):
+            raise ValueError(f"Invalid source '{source}', expected qrdata, real or synthetic")
+    for prompt in spec["prompts"]:
+        if prompt not in PROMPT_FLAGS:
+            raise ValueError(f"Invalid prompt '{prompt}', expected one of {', '.join(PROMPT_FLAGS)}")
+    # Result keys and output files are named after the model only, so a model name cannot be used twice
+    # (e.g. with two providers)
+    seen = {}
+    for model_spec in spec["models"]:
+        name = model_spec["model"].replace("/", "-")
+        if name in seen:
+            raise ValueError(f"The models {seen[name]} and {model_spec['api']}/{model_spec['model']} would share "
+                             f"their results; use a different model name for each entry")
+        seen[name] = f"{model_spec['api']}/{model_spec['model']}"
+    return spec
+
+
+def make_run_args(parser, options):
+    """Get the run_baselines defaults with the options of the spec applied."""
+    args = parser.parse_args([])
+    for name, value in (options or {}).items():
+        name = name.replace("-", "_")
+        if not hasattr(args, name):
+            raise ValueError(f"Unknown option '{name}'")
+        if name in CELL_FIELDS:
+            raise ValueError(f"'{name}' is set by the sweep matrix and cannot be an option")
+        setattr(args, name, value)
+    args.num_workers = max(1, args.num_workers)
+    return args
+
+
+def expand_cells(spec, run_args):
+    """Create the run settings of every (source, prompt, model) cell of the matrix."""
+    output_folder = spec.get("output_folder", "output")
+    cells = []
+    for source, queries_path in spec["sources"].items():
+        for prompt in spec["prompts"]:
+            for model_spec in spec["models"]:
+                cell = copy.copy(run_args)
+                cell.queries = queries_path
+                cell.data_type = source
+                cell.api = model_spec["api"]
+                cell.model = model_spec["model"]
+                for flag in ("potm", "react", "chain"):
+                    setattr(cell, flag, PROMPT_FLAGS[prompt] == flag)
+                cell.prompt = prompt
+                # Model names of some providers contain slashes, which cannot be part of a file name
+                file_name = f"{source}_{prompt}_{cell.model.replace('/', '-')}.json"
+                cell.output = os.path.join(output_folder, source, file_name)
+                cells.append(cell)
+    return cells
+
+
+def main(args):
+    spec = load_spec(args.spec)
+    run_args = make_run_args(build_parser(), spec.get("options"))
+    if run_args.async_mode:
+        raise ValueError("Async mode is not supported in sweeps")
+    cells = expand_cells(spec, run_args)
+    print(f"Sweep of {len(cells)} cells "
+          f"({len(spec['sources'])} sources x {len(spec['prompts'])} prompts x {len(spec['models'])} models)")
+
+    # One checkpoint store for all cells; keys include the model and prompting strategy
+    output_folder = spec.get("output_folder", "output")
+    checkpoint_path = spec.get("checkpoint") or os.path.join(output_folder, "sweep.checkpoint.jsonl")
+    store = ResultStore(checkpoint_path)
+    if args.resume:
+        completed = store.completed_keys()
+    else:
+        if store.exists():
+            print(f"Warning: Existing checkpoint moved to {store.backup()}. Use --resume to continue it instead.")
+        completed = set()
+
+    # Queries of a source are loaded once and shared by all of its cells
+    queries_by_source = {}
+    cell_keys = []
+    pending = []
+    for i, cell in enumerate(cells):
+        if cell.data_type not in queries_by_source:
+            queries_by_source[cell.data_type] = load_queries(cell.queries, cell.data_type)
+        queries = queries_by_source[cell.data_type]
+        keys = [make_result_key(q["query_id"], cell.model, cell.prompt) for q in queries]
+        cell_keys.append(keys)
+        pending += [(key, q, i) for key, q in zip(keys, queries) if key not in completed]
+        os.makedirs(os.path.dirname(cell.output), exist_ok=True)
+    print(f"{len(pending)} queries pending in {len(cells)} cells (skipping {len(completed)} completed)")
+
+    # Settings shared by all cells
+    run_args.pool_id = f"sweep-{os.getpid()}"
+    run_args.data_mount = str(DATA_ROOT) if run_args.mount_data else None
+    rate_limiter_manager, run_args.rate_limiter = start_rate_limiter(run_args)
+    for cell in cells:
+        cell.pool_id = run_args.pool_id
+        cell.data_mount = run_args.data_mount
+        cell.rate_limiter = run_args.rate_limiter
+        cell.first_replies = {}
+
+    # The most expensive queries of all cells start first, predicted from the turns of earlier runs
+    if run_args.schedule == "cost":
+        history_paths = [checkpoint_path, f"{checkpoint_path}.bak"] + run_args.cost_history
+        turn_history = {prompt: load_turn_history(history_paths, prompt) for prompt in spec["prompts"]}
+        pending.sort(key=lambda job: predict_cost(job[1], turn_history[cells[job[2]].prompt], DEFAULT_TURNS),
+                     reverse=True)
+
+    start_time = time.time()
+
+    # First prompts of every cell that uses a batch adapter
+    if run_args.batch_first_turn:
+        for i, cell in enumerate(cells):
+            cell_pending = [(key, query) for key, query, c in pending if c == i]
+            if cell_pending:
+                cell.first_replies = run_first_turn_batch(cell_pending, cell)
+
+    results = run_pending(pending, run_args, store, cells)
+    results = requeue_rate_limited(results, pending, run_args, store, cells)
+
+    if rate_limiter_manager is not None:
+        rate_limiter_manager.shutdown()
+    shutdown_pools(run_args)
+
+    report_results(results, len(pending), time.time() - start_time)
+
+    # Save every cell in the query order of its source
+    for cell, keys in zip(cells, cell_keys):
+        export_results(store, cell.output, keys, include_unlisted=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="sweep.py", description="Run a matrix of data sources, prompting strategies and models as one sweep",
+        epilog="Example: python -m baselines.sweep --spec sweeps/all.json --resume")
+    parser.add_argument("--spec", type=str, required=True,
+                        help="Path to the JSON sweep spec (sources, prompts, models and shared options)")
+    parser.add_argument("--resume", action=argparse.BooleanOptionalAction,
+                        help="Resume from the sweep checkpoint, skipping queries that were already completed")
+
+    main(parser.parse_args())
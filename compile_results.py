@@ -12,9 +12,24 @@ import json
 import pandas as pd
 import numpy as np
 import argparse 
+import hashlib
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from baselines.query_ids import get_query_id
+
+## bump when the parsed or scored content of a file changes, so stale cache entries are ignored
+SCORER_VERSION = 4
+
+## size of the blocks in which results files are read and hashed
+READ_CHUNK_SIZE = 1 << 20
+
+## fields of a result that are needed for the analysis; chat histories and code outputs are dropped while reading
+RESULT_FIELDS = ("query_id", "query", "name", "method", "effect", "std_error", "dataset_path", "treatment_var",
+                 "outcome_var")
+
 def parse_arguments():
 
     parser = argparse.ArgumentParser(description="Arguments for analyzing the errors")
@@ -24,6 +39,12 @@ def parse_arguments():
                       help="Path the the folder to save the results of the analysis")
     parser.add_argument("-sd", "--source_data", type=str, 
                        help="Source data")
+    parser.add_argument("-cd", "--cache_dir", type=str, default=None,
+                        help="Folder of the cache of parsed and scored files (default: <output_folder>/.cache)")
+    parser.add_argument("-nw", "--num_workers", type=int, default=os.cpu_count(),
+                        help="Number of results files processed concurrently (default: number of CPUs)")
+    parser.add_argument("-z", "--ci_z", type=float, default=1.96,
+                        help="Width of the reference confidence interval in standard errors (default: 1.96)")
 
     return parser.parse_args()
 
@@ -68,10 +89,58 @@ def standardize_method_name(method):
         return 'other'
     
 
+def parse_result_file_name(file_name):
+    """
+    Split the name of a results file, {source}_{prompt}_{model}.json, into its parts.
+
+    Returns:
+        (tuple): The data source, prompting strategy and model name
+    """
+
+    parts = Path(file_name).stem.split("_", 2)
+    if len(parts) < 3:
+        raise ValueError(f"Results file {file_name} is not named {{source}}_{{prompt}}_{{model}}.json")
+    return tuple(parts)
+
+
+def standardize_method_names(methods):
+    """
+    Standardize a column of method names. Each distinct name is mapped once with
+    standardize_method_name and the mapping is applied to the whole column as a lookup.
+
+    Args:
+        methods (list or pd.Series): The method names to standardize
+
+    Returns:
+        (np.ndarray, dict): The standardized method names and the mapping of the distinct names
+    """
+
+    # standardize_method_name maps values that are not strings to NaN; lists and dicts cannot be factorized
+    methods = pd.Series(methods, dtype=object).map(lambda method: method if isinstance(method, str) else np.nan)
+    codes, uniques = pd.factorize(methods, use_na_sentinel=True)
+    standardized = np.array([standardize_method_name(method) for method in uniques] + [np.nan], dtype=object)
+    return standardized[codes], dict(zip(uniques, standardized))
+
+
+def to_numeric(values):
+    """Convert a column of predicted values to float, with NaN for values that are not numbers."""
+    scalars = values.map(lambda value: value if isinstance(value, (int, float, str)) else np.nan)
+    return pd.to_numeric(scalars, errors="coerce").astype(float)
+
+
+def is_float(value):
+    """Whether a predicted value can be converted to float."""
+    try:
+        float(value)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
 def analyze_results(results_json, query_key="query", name_key= "name",
                     method_key="method", effect_key="effect", 
                     path_key="dataset_path", pred_results_key="result", 
-                    pred_results_summary_key="final_result"):
+                    pred_results_summary_key="final_result", std_error_key="std_error"):
     """
     Analyze the results of the experiments. This is specific to the format of the baseline results
     generated using run_baselines.py. New types of outputs may require modification of this function. 
@@ -87,68 +156,50 @@ def analyze_results(results_json, query_key="query", name_key= "name",
         pred_results_key (str): The key denoting the predicted results
         pred_results_summary_key (str): The key denoting the summary of the predicted results. This 
                                         is nested within the pred_results_key. 
+        std_error_key (str): The key denoting the standard error of the causal effect
+
+    Returns:
+        (pd.DataFrame, dict): One row per query with the true and predicted method and effect, and the 
+                              predicted effects that could not be converted to float
     """
 
-    df_dict = {"query": [], "name": [], "method": [], "effect": [], "path": [], 
-               "pred_method": [], "pred_effect": [], "pred_method_ini": []}
+    rows = []
     errors_info = {"query number": [], "query": [], "pred_effect": [], "error": []}
-    true_method_mapping = {}
-    pred_method_mapping = {}
-    count = 0
     for result in results_json:
-        query = result[query_key]
-        name = result[name_key]
-        method = result[method_key]
-        effect = result[effect_key]
-        path = result[path_key]
+        pred_results = result.get(pred_results_key) or {}
         try:
-            pred_results = result.get(pred_results_key, []).get(pred_results_summary_key, [])
+            pred_results = pred_results.get(pred_results_summary_key) or {}
         except AttributeError as e:
-            print(f"Error in accessing the predicted results for query: {query}. Error: {e}", 
-                  result.get(pred_results_key, []))
-            #print(result)
-            #continue
-        pred_method = pred_results.get("method", np.nan)
-        pred_effect = pred_results.get("causal_effect", np.nan)
-        if method not in true_method_mapping:
-            true_method_mapping[method] = []
-        true_method_mapping[method].append(standardize_method_name(method))
-        df_dict["query"].append(query)
-        df_dict["name"].append(name)
-        df_dict["method"].append(standardize_method_name(method))
-        #if df_dict["method"][-1] == 'other':
-        #    print(f"Unrecognized True method name: {method} for query: {query}")
-        df_dict["path"].append(path)
-        df_dict["effect"].append(effect)
-        df_dict["pred_method"].append(standardize_method_name(pred_method))
-        df_dict["pred_method_ini"].append(pred_method)
-        if pred_method not in pred_method_mapping:
-            pred_method_mapping[pred_method] = []
-        pred_method_mapping[pred_method].append(standardize_method_name(pred_method))
-        #if df_dict["pred_method"][-1] == 'other':
-         #   print(f"Unrecognized Predicted method name: {pred_method} for query: {query}")
-        try:
-            df_dict["pred_effect"].append(float(pred_effect))
-        except (ValueError, TypeError):
-            #print("Query name:", query)
-            #print(f"Could not convert predicted effect '{pred_effect}' to float. Setting as NaN.")
-            df_dict["pred_effect"].append(np.nan)
-            errors_info["query number"].append(count)
-            errors_info["query"].append(query)
-            errors_info["pred_effect"].append(pred_effect)
-            errors_info["error"].append("Could not convert to float")
-        count += 1
-
-    df = pd.DataFrame(df_dict)
-    #print(df["pred_method_ini"].unique())
-    #print(df["pred_method"].unique())
+            print(f"Error in accessing the predicted results for query: {result[query_key]}. Error: {e}", pred_results)
+            pred_results = {}
+        if not isinstance(pred_results, dict):
+            pred_results = {}
+        rows.append((get_query_id(result), result[query_key], result[name_key], result[method_key],
+                     result[effect_key], result.get(std_error_key), result[path_key],
+                     pred_results.get("method", np.nan), pred_results.get("causal_effect", np.nan),
+                     pred_results.get("standard_deviation", np.nan)))
+
+    df = pd.DataFrame(rows, columns=["query_id", "query", "name", "method_ini", "effect", "std_error", "path",
+                                     "pred_method_ini", "pred_effect_ini", "pred_std_error_ini"])
+    df["method"], true_method_mapping = standardize_method_names(df["method_ini"])
+    df["pred_method"], pred_method_mapping = standardize_method_names(df["pred_method_ini"])
+    df["effect"] = pd.to_numeric(df["effect"], errors="coerce")
+    df["std_error"] = pd.to_numeric(df["std_error"], errors="coerce")
+    df["pred_effect"] = to_numeric(df["pred_effect_ini"])
+    df["pred_std_error"] = to_numeric(df["pred_std_error_ini"])
+
+    ## predicted effects that are not numbers, including null ones (a missing effect is not an error)
+    failed = ~df["pred_effect_ini"].map(is_float)
+    errors_info["query number"] = list(df.index[failed])
+    errors_info["query"] = list(df.loc[failed, "query"])
+    errors_info["pred_effect"] = list(df.loc[failed, "pred_effect_ini"])
+    errors_info["error"] = ["Could not convert to float"] * int(failed.sum())
+
+    df = df[["query_id", "query", "name", "method", "effect", "std_error", "path", "pred_method", "pred_effect",
+             "pred_std_error", "pred_method_ini"]]
     print("True method mapping:")
-    for key in true_method_mapping:
-        true_method_mapping[key] = list(set(true_method_mapping[key]))
     print(true_method_mapping)
     print("Predicted method mapping:")
-    for key in pred_method_mapping:
-        pred_method_mapping[key] = list(set(pred_method_mapping[key]))
     print(pred_method_mapping)
     print()
 
@@ -156,9 +207,163 @@ def analyze_results(results_json, query_key="query", name_key= "name",
     
 
 
+def score_results(df, ci_z=1.96):
+    """
+    Score the predictions of one results file, column-wise.
+
+    Args:
+        df (pd.DataFrame): The output of analyze_results
+        ci_z (float): Width of the reference confidence interval in standard errors
+
+    Returns:
+        (pd.DataFrame): The per-query scores: method_correct, abs_error, rel_error and ci_covered 
+                        (whether the predicted effect lies within effect +- ci_z * std_error; NaN 
+                        without a reference standard error)
+    """
+
+    scores = pd.DataFrame(index=df.index)
+    scores["method_correct"] = (df["pred_method"] == df["method"]).astype(float)
+    scores.loc[df["method"].isna(), "method_correct"] = np.nan
+    scores["abs_error"] = (df["pred_effect"] - df["effect"]).abs()
+    scores["rel_error"] = scores["abs_error"] / df["effect"].abs().replace(0, np.nan)
+    has_ci = df["std_error"].notna() & df["pred_effect"].notna()
+    scores["ci_covered"] = np.where(has_ci, scores["abs_error"] <= ci_z * df["std_error"], np.nan)
+    return scores
+
+
+def summarize_scores(df):
+    """
+    Aggregate the scores of one results file.
+
+    Returns:
+        (dict): Method accuracy, mean absolute error, median relative error, CI coverage and the 
+                number of queries with a numeric prediction
+    """
+
+    return {
+        "queries": len(df),
+        "predicted": int(df["pred_effect"].notna().sum()),
+        "method_accuracy": df["method_correct"].mean(),
+        "mae": df["abs_error"].mean(),
+        "median_rel_error": df["rel_error"].median(),
+        "ci_coverage": df["ci_covered"].mean(),
+    }
+
+
+def get_file_hash(path, ci_z=1.96):
+    """Hash of the content of a results file and of the scoring settings, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+            digest.update(block)
+    digest.update(f"|{SCORER_VERSION}|{ci_z}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def iter_json_array(path, chunk_size=READ_CHUNK_SIZE):
+    """
+    Iterate over the elements of a JSON array file one at a time, so only the element being 
+    decoded is held in memory, not the whole file.
+
+    Args:
+        path (str): The path to the JSON file, containing a top-level array
+        chunk_size (int): The number of characters read at a time
+
+    Yields:
+        The decoded elements of the array
+    """
+
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        while not buffer:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            buffer = block.lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        position = 1
+        at_end = False
+        while True:
+            ## skip the separator before the next element
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                if position >= len(buffer):
+                    raise json.JSONDecodeError("Incomplete element", buffer, position)
+                element, end = decoder.raw_decode(buffer, position)
+                ## an element is complete once the separator after it was read (a number cut off at
+                ## the end of a block decodes as a shorter number)
+                following = buffer[end:].lstrip()
+                if not following[:1] or following[0] not in ",]":
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, end)
+            except json.JSONDecodeError:
+                if at_end:
+                    raise
+                ## read at least as much as is buffered, so large elements are decoded in linear time
+                block = f.read(max(chunk_size, len(buffer) - position))
+                at_end = not block
+                buffer = buffer[position:] + block
+                position = 0
+                continue
+            yield element
+            position = end
+
+
+def select_fields(result, pred_results_key="result", pred_results_summary_key="final_result"):
+    """Keep only the fields of a result that analyze_results reads."""
+    selected = {key: result[key] for key in RESULT_FIELDS if key in result}
+    pred_results = result.get(pred_results_key)
+    if isinstance(pred_results, dict):
+        selected[pred_results_key] = {pred_results_summary_key: pred_results.get(pred_results_summary_key)}
+    else:
+        selected[pred_results_key] = pred_results
+    return selected
+
+
+def load_scored_file(path, cache_dir, ci_z=1.96):
+    """
+    Parse and score one results file, or load it from the cache if the file did not change.
+
+    Args:
+        path (str): The path to the JSON results file
+        cache_dir (str): The folder of the cache, keyed by the hash of the file content
+        ci_z (float): Width of the reference confidence interval in standard errors
+
+    Returns:
+        (pd.DataFrame, dict, bool): The analyzed and scored results, the conversion errors and 
+                                    whether the file was (re)scored
+    """
+
+    key = get_file_hash(path, ci_z)
+    cache_file = os.path.join(cache_dir, f"{key}.pkl")
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as f:
+                df_result, errors_info = pickle.load(f)
+            return df_result, errors_info, False
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable cache entry of {path}: {e}")
+
+    df_result, errors_info = analyze_results(select_fields(result) for result in iter_json_array(path))
+    df_result = pd.concat([df_result, score_results(df_result, ci_z)], axis=1)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        pickle.dump((df_result, errors_info), f)
+    os.replace(tmp_file, cache_file)
+    return df_result, errors_info, True
+
+
 def combine_dfs(df_all, source, prompt_name):
     """
-    Combines the dataframe from different models into a single dataframe. 
+    Combines the dataframe from different models into a single dataframe. Rows are matched on the 
+    query id, so the models do not need to share the order or the set of queries; queries missing 
+    from a model get NaN predictions for that model.
 
     Args:
         df_all (dict): A dictionary containing the dataframes from different models
@@ -167,57 +372,60 @@ def combine_dfs(df_all, source, prompt_name):
     """
 
     df_sub = df_all[source][prompt_name]
-   
-    df_combined = {"query": [], "name": [], "method": [], "effect": [], "path": []}
+    info_columns = ["query_id", "query", "name", "method", "effect", "path"]
+
+    ## all queries of all models, in the order in which they first appear
+    df_final = pd.concat([df_sub[model][info_columns] for model in df_sub]).drop_duplicates("query_id")
     for model in df_sub:
-        pred_method_key = f"pred_method_{model}"
-        pred_effect_key = f"pred_effect_{model}"
-        pred_effect_ini_key = f"pred_method_ini_{model}"
-        
-        if len(df_combined["query"]) == 0:
-            df_combined["query"] = list(df_sub[model]["query"])
-            df_combined["name"] = list(df_sub[model]["name"])
-            df_combined["method"] = list(df_sub[model]["method"])
-            df_combined["effect"] = list(df_sub[model]["effect"])
-            df_combined["path"] = list(df_sub[model]["path"])
-        df_combined[pred_method_key] = df_sub[model]["pred_method"]
-        df_combined[pred_effect_key] = df_sub[model]["pred_effect"]
-        df_combined[pred_effect_ini_key] = df_sub[model]["pred_method_ini"]
-    #for key in df_combined:
-    #    print(f"{key}: {len(df_combined[key])}" )
-    df_final = pd.DataFrame(df_combined)
-
-    return df_final
+        df_model = df_sub[model]
+        if df_model["query_id"].duplicated().any():
+            print(f"Warning: Duplicate queries in the results of {model}, keeping the last result")
+            df_model = df_model.drop_duplicates("query_id", keep="last")
+        df_model = df_model[["query_id", "pred_method", "pred_effect", "pred_method_ini"]].rename(columns={
+            "pred_method": f"pred_method_{model}",
+            "pred_effect": f"pred_effect_{model}",
+            "pred_method_ini": f"pred_method_ini_{model}",
+        })
+        df_final = df_final.merge(df_model, on="query_id", how="left")
+
+    return df_final.reset_index(drop=True)
 
 
 def main(args):
 
     results_all = {}
     error_all = {}
+    summaries = []
     total = 0
+    rescored = 0
+    cache_dir = args.cache_dir or os.path.join(args.output_folder, ".cache")
 
     ## the input folder is the folder containing the json output from the experiments. If conditions are not specific, 
     ## the program will try to process all the json files in the folder.
 
-    for files in os.listdir(args.input_folder):
-        if files.endswith(".json"):
+    ## files are parsed and scored concurrently, and collected in name order
+    result_files = sorted(files for files in os.listdir(args.input_folder)
+                          if files.endswith(".json") and not files.endswith(".metrics.json"))
+    with ProcessPoolExecutor(max_workers=max(1, args.num_workers or 1)) as executor:
+        futures = {files: executor.submit(load_scored_file, os.path.join(args.input_folder, files), cache_dir,
+                                          args.ci_z)
+                   for files in result_files}
+        for files in result_files:
             print(f"Processing file: {files}")
-            with open(os.path.join(args.input_folder, files), 'r') as f:
-                result = json.load(f)
- 
-            strip = files.rstrip(".json").split("_")
-            data_source = strip[0]
-            prompt_name = strip[1]
-            model_name = strip[2]
+            df_result, errors_info, changed = futures[files].result()
+            rescored += changed
+
+            data_source, prompt_name, model_name = parse_result_file_name(files)
             if data_source not in results_all:
                 results_all[data_source] = {}
             if prompt_name not in results_all[data_source]:
                 results_all[data_source][prompt_name] = {}
             if model_name not in results_all[data_source][prompt_name]:
                 results_all[data_source][prompt_name][model_name] = {}
-            df_result, errors_info = analyze_results(result)
             error_all[files] = errors_info
             results_all[data_source][prompt_name][model_name] = df_result
+            summaries.append({"source": data_source, "prompt": prompt_name, "model": model_name,
+                              **summarize_scores(df_result)})
             total = df_result.shape[0]
 
     print("--------------------------------------------------------------------")
@@ -225,18 +433,25 @@ def main(args):
     for key in error_all:
         print(key, len(error_all[key]["query number"]), "/", total)
     print("--------------------------------------------------------------------")
+    print(f"Scored {rescored} new or changed files, {len(error_all) - rescored} loaded from the cache")
     print()
 
-    return results_all
+    return results_all, pd.DataFrame(summaries)
 
 if __name__ == "__main__":
     args = parse_arguments()
-    results_processed = main(args)
+    results_processed, summary = main(args)
     output_path = Path(args.output_folder)
     output_path.mkdir(parents=True, exist_ok=True)
     print(results_processed[args.source_data].keys())
 
+    summary = summary[summary["source"] == args.source_data].sort_values(["prompt", "model"])
+    print(summary.to_string(index=False))
+    summary.to_csv(output_path / f"{args.source_data}_scores.csv", index=False)
+
     for pt in ["basic", "cot", "pot", "react"]:
+        if pt not in results_processed[args.source_data]:
+            continue
         results_qr = combine_dfs(results_processed, source=args.source_data, prompt_name=pt)
         full_path = output_path / f"{args.source_data}_{pt}.csv"
         results_qr.to_csv(full_path, index=True)
@@ -7,6 +7,8 @@ import argparse
 import os 
 from pathlib import Path
 
+from baselines.query_ids import make_query_id
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description="Convert CSV to JSON")
     parser.add_argument("-i", "--input_csv", type=str, required=True, 
@@ -50,6 +52,8 @@ def parse_arguments():
                         help="Name of the column containing the state variable")
     parser.add_argument("-itc", "--interaction_column", type=str, default="interaction_var",
                         help="Name of the column containing the interaction variable")
+    parser.add_argument("-mdc", "--mediator_column", type=str, default="mediator",
+                        help="Name of the column containing the mediator variable (only annotated for synthetic data)")
 
     parser.add_argument("-pc", "--publication_column", type=str, default="publication_year",
                         help="Name of the column containing the publication year")
@@ -65,7 +69,7 @@ def csv_to_json(df, name_column, query_column, description_column, filename_colu
                 method_column, effect_column, std_column, significance_column, 
                 treatment_column, outcome_column, controls_column, 
                 running_column, instrument_column, temporal_column, state_column, interaction_column,
-                publication_column, domain_column, file_path=None):
+                publication_column, domain_column, file_path=None, mediator_column="mediator"):
     """
     Convert a DataFrame to json format
     Args:
@@ -92,9 +96,12 @@ def csv_to_json(df, name_column, query_column, description_column, filename_colu
         publication_column (str): The name of the column containing the publication year
         domain_column (str): The name of the column containing the domain information
         file_path (str, optional): The path to the file to save the json. Defaults to None.
+        mediator_column (str, optional): The name of the column containing the mediator variable. Files
+                                         without this column get a null mediator.
 
     Returns:
-        (dict): the json object 
+        (dict): the json object. Every query gets a `query_id`, a hash of the query, the dataset 
+                file name and the treatment and outcome variables (see baselines/query_ids.py). 
     """
     json_list = []
     method_count = {}
@@ -124,6 +131,7 @@ def csv_to_json(df, name_column, query_column, description_column, filename_colu
             temporal_var = row[temporal_column]
             state_var = row[state_column]
             interaction_var = row[interaction_column]
+            mediator_var = row[mediator_column] if mediator_column in row else None
 
             publication = row[publication_column]
             domain = row[domain_column]
@@ -133,13 +141,14 @@ def csv_to_json(df, name_column, query_column, description_column, filename_colu
         if not os.path.exists(filename):
             print(f"Warning: File {filename} does not exist.")
             continue
-        json_list.append({"name": name, "query": query, "dataset_description": description, 
+        query_id = make_query_id(query, filename, treatment_var, outcome_var)
+        json_list.append({"query_id": query_id, "name": name, "query": query, "dataset_description": description, 
                          "method": method, "dataset_path": filename,
                          "effect":effect, "std_error":std, "is_significant":significance,
                             "treatment_var":treatment_var, "outcome_var":outcome_var,
                             "control_variables":controls_var, "running_var":running_var,
                             "instrument_var":instrument_var, "temporal_var":temporal_var,
-                            "state_var":state_var, "interaction_var":interaction_var,
+                            "state_var":state_var, "interaction_var":interaction_var, "mediator_var":mediator_var,
                             "publication_year":publication, "domain":domain
                          })
 
@@ -170,7 +179,7 @@ if __name__ == "__main__":
                             args.outcome_column, args.controls_column, args.running_column,
                             args.instrument_column, args.temporal_column, args.state_column,
                             args.interaction_column, args.publication_column, args.domain_column,
-                            file_path=path)  
+                            file_path=path, mediator_column=args.mediator_column)  
     
     json_data = json.dumps(dict_data, indent=4)
     output_path = Path(args.output_folder)
@@ -0,0 +1,58 @@
+import json
+import math
+
+import pytest
+
+from compile_results import iter_json_array
+
+RECORDS = [
+    {"query": "What is the effect of \"training\" on [earnings], {in} $?", "effect": -1234.5678e-3},
+    12345678,
+    -0.5,
+    "a string with , and ] inside",
+    [1, [2, [3]], {"nested": [4, 5]}],
+    None,
+    True,
+    {"unicode": "café − 中文", "nan": float("nan"), "list": []},
+    {},
+    [],
+]
+
+
+def write_json(path, content):
+    path.write_text(content, encoding="utf-8")
+    return str(path)
+
+
+def check_records(records):
+    assert len(records) == len(RECORDS)
+    for record, expected in zip(records, RECORDS):
+        if isinstance(expected, dict) and "nan" in expected:
+            assert math.isnan(record.pop("nan"))
+            expected = {key: value for key, value in expected.items() if key != "nan"}
+        assert record == expected
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+def test_every_chunk_boundary(tmp_path, indent):
+    path = write_json(tmp_path / "results.json", json.dumps(RECORDS, indent=indent, ensure_ascii=False))
+    # Every chunk size up to the length of the longest element cuts elements, strings and numbers
+    for chunk_size in range(1, 120):
+        check_records(list(iter_json_array(path, chunk_size=chunk_size)))
+    check_records(list(iter_json_array(path)))
+
+
+def test_surrounding_whitespace_and_empty_arrays(tmp_path):
+    path = write_json(tmp_path / "results.json", "\n\n   [ 1 ,\n 2 ]\n")
+    assert [list(iter_json_array(path, chunk_size=size)) for size in (1, 2, 3)] == [[1, 2]] * 3
+    for content in ("[]", "  [ \n ]  "):
+        assert list(iter_json_array(write_json(tmp_path / "empty.json", content), chunk_size=1)) == []
+
+
+def test_invalid_files(tmp_path):
+    with pytest.raises(ValueError):
+        list(iter_json_array(write_json(tmp_path / "object.json", '{"a": 1}')))
+    with pytest.raises(ValueError):
+        list(iter_json_array(write_json(tmp_path / "empty.json", "")))
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(write_json(tmp_path / "truncated.json", '[{"a": 1}, {"b": '), chunk_size=4))
@@ -0,0 +1,49 @@
+import os
+import glob
+import json
+
+import pytest
+
+from baselines.query_ids import QUERY_ID_LENGTH, add_query_ids, get_query_id, make_query_id
+
+QUERY_FILES = sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "json", "*.json")))
+
+
+def test_query_id_is_stable():
+    # Pinned: changing how ids are computed orphans every checkpoint and cached score
+    assert make_query_id("What is the effect?", "data/qrdata/a.csv", "T", "y") == "67a7711bcf38f1db"
+    assert len(make_query_id("What is the effect?", "a.csv")) == QUERY_ID_LENGTH
+
+
+def test_query_id_ignores_the_data_folder_and_formatting():
+    query_id = make_query_id("What is the effect?", "data/qrdata/a.csv", "T", "y")
+    assert make_query_id("What is the effect?", "/mnt/benchmark/qrdata/a.csv", " T ", "y") == query_id
+    assert make_query_id("What is the effect?", "a.csv", None, None) == make_query_id("What is the effect?", "a.csv",
+                                                                                       float("nan"), float("nan"))
+
+
+def test_query_id_depends_on_the_query_dataset_and_variables():
+    ids = {make_query_id("What is the effect?", "a.csv", "T", "y"),
+           make_query_id("What is the effect ?", "a.csv", "T", "y"),
+           make_query_id("What is the effect?", "b.csv", "T", "y"),
+           make_query_id("What is the effect?", "a.csv", "D", "y"),
+           make_query_id("What is the effect?", "a.csv", "T", "z")}
+    assert len(ids) == 5
+
+
+def test_existing_ids_are_kept():
+    query = {"query_id": "0123456789abcdef", "query": "What is the effect?", "dataset_path": "a.csv"}
+    assert get_query_id(query) == "0123456789abcdef"
+    queries = add_query_ids([dict(query, query_id=None), {"query": "Other", "dataset_path": "a.csv"}])
+    assert queries[0]["query_id"] == make_query_id("What is the effect?", "a.csv")
+    assert queries[1]["query_id"] == make_query_id("Other", "a.csv")
+
+
+@pytest.mark.parametrize("path", QUERY_FILES, ids=os.path.basename)
+def test_query_files_match_their_content(path):
+    with open(path, "r") as f:
+        queries = json.load(f)
+    assert all(query["query_id"] == make_query_id(query["query"], query["dataset_path"], query.get("treatment_var"),
+                                                  query.get("outcome_var"))
+               for query in queries)
+    assert len({query["query_id"] for query in queries}) == len(queries)
@@ -0,0 +1,84 @@
+import pytest
+
+from baselines import rate_limiter
+from baselines.rate_limiter import RateLimiter, estimate_tokens, parse_rate_limits, rate_limit_delay
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimitError(Exception):
+    def __init__(self, headers):
+        self.response = type("Response", (), {"headers": headers})()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "time", clock)
+    return clock
+
+
+def test_parse_rate_limits():
+    limits = parse_rate_limits(["openai=60:1000", "together/meta-llama/Llama-3-70b=30"])
+    assert limits == {"openai": (60.0, 1000.0), "together/meta-llama/Llama-3-70b": (30.0, None)}
+    with pytest.raises(ValueError):
+        parse_rate_limits(["openai"])
+
+
+def test_estimate_tokens():
+    assert estimate_tokens([{"content": "x" * 40}, {"content": None}]) == 11
+
+
+def test_requests_queue_up_once_the_bucket_is_empty(clock):
+    limiter = RateLimiter({"openai": (60.0, None)})
+    assert [limiter.reserve("openai", "gpt-4o") for _ in range(60)] == [0.0] * 60
+    # The bucket refills at one request per second, and every reservation queues behind the previous one
+    assert limiter.reserve("openai", "gpt-4o") == pytest.approx(1.0)
+    assert limiter.reserve("openai", "gpt-4o") == pytest.approx(2.0)
+    clock.now += 2.0
+    assert limiter.reserve("openai", "gpt-4o") == pytest.approx(1.0)
+
+
+def test_model_limits_take_precedence_over_provider_limits(clock):
+    limiter = RateLimiter({"openai": (60.0, None), "openai/gpt-4o": (1.0, None)})
+    assert limiter.reserve("openai", "gpt-4o") == 0.0
+    assert limiter.reserve("openai", "gpt-4o") == pytest.approx(60.0)
+    assert limiter.reserve("openai", "gpt-4o-mini") == 0.0
+    assert limiter.reserve("together", "gpt-4o") == 0.0
+
+
+def test_settle_corrects_the_token_estimate(clock):
+    limiter = RateLimiter({"openai": (600.0, 600.0)})
+    assert limiter.reserve("openai", "gpt-4o", tokens=500) == 0.0
+    assert limiter.reserve("openai", "gpt-4o", tokens=500) == pytest.approx(40.0)
+    # The requests used fewer tokens than estimated, so the bucket is no longer negative
+    limiter.settle("openai", "gpt-4o", estimated_tokens=500, actual_tokens=100)
+    limiter.settle("openai", "gpt-4o", estimated_tokens=500, actual_tokens=100)
+    assert limiter.reserve("openai", "gpt-4o", tokens=100) == 0.0
+    # Settling a provider without a token limit is a no-op
+    limiter.settle("together", "llama", estimated_tokens=500, actual_tokens=100)
+
+
+def test_penalize_pauses_the_provider_and_model(clock):
+    limiter = RateLimiter({})
+    limiter.penalize("openai", "gpt-4o", 30.0)
+    limiter.penalize("openai", "gpt-4o", 10.0)
+    assert limiter.reserve("openai", "gpt-4o") == pytest.approx(30.0)
+    assert limiter.reserve("openai", "gpt-4o-mini") == 0.0
+    clock.now += 30.0
+    assert limiter.reserve("openai", "gpt-4o") == 0.0
+
+
+def test_rate_limit_delay_uses_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: high)
+    assert rate_limit_delay(RateLimitError({"retry-after": "5"}), attempt=0) == 6.0
+    assert rate_limit_delay(RateLimitError({"retry-after-ms": "250"}), attempt=0) == 1.25
+    # Without the header: full-jitter exponential backoff, capped
+    assert rate_limit_delay(RateLimitError({}), attempt=3) == 8.0
+    assert rate_limit_delay(RateLimitError({}), attempt=10) == 60.0
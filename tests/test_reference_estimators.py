@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from baselines.reference_estimators import estimate_query, summarize
+
+N = 5000
+
+
+def make_query(method, treatment="T", outcome="y", **annotations):
+    return {"query": f"{method} query", "dataset_path": f"data/test/{method}.csv", "method": method,
+            "treatment_var": treatment, "outcome_var": outcome, **annotations}
+
+
+def check(query, df, effect, tolerance):
+    estimate = estimate_query(query, df)
+    assert estimate["status"] == "estimated", estimate.get("error")
+    assert estimate["effect"] == pytest.approx(effect, abs=tolerance)
+    assert estimate["std_error"] > 0
+    return estimate
+
+
+def test_ols_adjusts_for_controls():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=N)
+    T = (x + rng.normal(size=N) > 0).astype(float)
+    df = pd.DataFrame({"x": x, "T": T, "y": 2.0 * T + 1.5 * x + rng.normal(size=N)})
+    check(make_query("ols", control_variables="x"), df, 2.0, 0.1)
+
+
+def test_iv_removes_unobserved_confounding():
+    rng = np.random.default_rng(1)
+    u, z = rng.normal(size=N), rng.normal(size=N)
+    T = z + u + rng.normal(size=N)
+    df = pd.DataFrame({"z": z, "T": T, "y": 3.0 * T + 2.0 * u + rng.normal(size=N)})
+    check(make_query("iv", instrument_var="z"), df, 3.0, 0.1)
+
+
+def test_canonical_did():
+    rng = np.random.default_rng(2)
+    group, post = rng.integers(0, 2, N).astype(float), rng.integers(0, 2, N).astype(float)
+    y = 1.0 + 0.5 * group + 0.8 * post + 2.5 * group * post + rng.normal(size=N)
+    df = pd.DataFrame({"T": group, "post": post, "y": y})
+    estimate = check(make_query("did_canonical", temporal_var="post"), df, 2.5, 0.15)
+    assert estimate["specification"] == "canonical DiD"
+
+
+def test_two_way_fixed_effects_did():
+    rng = np.random.default_rng(3)
+    units, periods = 300, 8
+    unit, period = np.repeat(np.arange(units), periods), np.tile(np.arange(periods), units)
+    start = rng.integers(3, 12, units)
+    D = (period >= start[unit]).astype(float)
+    y = rng.normal(size=units)[unit] + 0.3 * period + 1.5 * D + rng.normal(size=units * periods)
+    df = pd.DataFrame({"unit": unit, "period": period, "T": D, "y": y})
+    estimate = check(make_query("did_twfe", temporal_var="period", state_var="unit"), df, 1.5, 0.1)
+    assert estimate["specification"] == "two-way fixed effects DiD"
+
+
+def test_sharp_rdd_infers_the_cutoff():
+    rng = np.random.default_rng(4)
+    R = rng.uniform(-1, 1, N)
+    T = (R >= 0.2).astype(float)
+    df = pd.DataFrame({"R": R, "T": T, "y": 1.0 + R + 2.0 * T + 0.3 * rng.normal(size=N)})
+    estimate = check(make_query("rdd", running_var="R"), df, 2.0, 0.15)
+    assert estimate["specification"].startswith("sharp RDD (cutoff 0.2")
+
+
+def test_fuzzy_rdd():
+    rng = np.random.default_rng(5)
+    R = rng.uniform(-1, 1, 4 * N)
+    T = ((R >= 0) ^ (rng.uniform(size=4 * N) < 0.05)).astype(float)
+    df = pd.DataFrame({"R": R, "T": T, "y": R + 2.0 * T + 0.3 * rng.normal(size=4 * N)})
+    estimate = check(make_query("rdd", running_var="R"), df, 2.0, 0.25)
+    assert estimate["specification"].startswith("fuzzy RDD")
+
+
+def make_confounded(seed):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=N)
+    T = (rng.uniform(size=N) < 1 / (1 + np.exp(-x))).astype(float)
+    return pd.DataFrame({"x": x, "T": T, "y": 2.0 * T + x + rng.normal(size=N)})
+
+
+def test_ipw():
+    check(make_query("ipw", control_variables="x"), make_confounded(6), 2.0, 0.15)
+
+
+def test_matching():
+    estimate = check(make_query("matching", control_variables="x"), make_confounded(7), 2.0, 0.15)
+    assert estimate["specification"] == "propensity score matching (ATT)"
+
+
+def test_logistic_glm():
+    rng = np.random.default_rng(8)
+    x, T = rng.normal(size=N), rng.integers(0, 2, N).astype(float)
+    y = (rng.uniform(size=N) < 1 / (1 + np.exp(-(-0.5 + 0.8 * T + 0.5 * x)))).astype(float)
+    estimate = check(make_query("glm", control_variables="x"), pd.DataFrame({"x": x, "T": T, "y": y}), 0.8, 0.15)
+    assert estimate["specification"] == "GLM (binomial)"
+
+
+def test_frontdoor_uses_the_annotated_mediator():
+    rng = np.random.default_rng(9)
+    u = rng.normal(size=N)
+    T = (u + rng.normal(size=N) > 0).astype(float)
+    M = 1.5 * T + rng.normal(size=N)
+    df = pd.DataFrame({"T": T, "M": M, "other": rng.normal(size=N), "y": 2.0 * M + 3.0 * u + rng.normal(size=N)})
+    check(make_query("frontdoor", mediator_var="M"), df, 3.0, 0.2)
+
+
+def test_frontdoor_without_mediator_is_unsupported():
+    df = pd.DataFrame({"T": [0.0, 1.0] * 50, "M": np.arange(100.0), "y": np.arange(100.0)})
+    estimate = estimate_query(make_query("frontdoor", mediator_var=float("nan")), df)
+    assert estimate["status"] == "unsupported"
+    assert "effect" not in estimate
+
+
+def test_unknown_method_is_unsupported():
+    assert estimate_query(make_query("synthetic control"), pd.DataFrame())["status"] == "unsupported"
+
+
+def test_constant_treatment_is_an_error():
+    df = pd.DataFrame({"T": np.ones(100), "y": np.arange(100.0)})
+    estimate = estimate_query(make_query("ols"), df)
+    assert estimate["status"] == "error"
+    assert "does not vary" in estimate["error"]
+
+
+def test_controls_are_encoded_or_dropped():
+    rng = np.random.default_rng(10)
+    df = make_confounded(11)
+    df["region"] = rng.choice(["north", "south", "east"], N)
+    df["income"] = rng.normal(size=N).round(2).astype(str)
+    df.loc[:10, "income"] = "unknown"
+    df["name"] = [f"person {i}" for i in range(N)]
+    query = make_query("matching", control_variables="x, region, income, name, not_a_column")
+    estimate = check(query, df, 2.0, 0.15)
+    assert "dropped controls not in the dataset: not_a_column" in estimate["notes"]
+    assert "encoded region as 3 categories" in estimate["notes"]
+    assert "converted income to numbers" in estimate["notes"]
+    assert f"dropped name ({N} categories)" in estimate["notes"]
+    # Rows whose control could not be converted are left out
+    assert estimate["n"] == N - 11
+
+
+def test_summarize_counts_each_status():
+    df = make_confounded(12)
+    queries = [make_query("ols", control_variables="x"), make_query("frontdoor"), make_query("ols", treatment="missing")]
+    report = pd.DataFrame([{"query": q["query"], "dataset_path": q["dataset_path"], **estimate_query(q, df)}
+                           for q in queries])
+    summary = summarize(report).set_index("estimator")
+    assert summary.loc["ols", ["queries", "estimated", "unsupported", "errors"]].tolist() == [2, 1, 0, 1]
+    assert summary.loc["frontdoor", ["queries", "estimated", "unsupported", "errors"]].tolist() == [1, 0, 1, 0]
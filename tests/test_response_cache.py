@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from baselines.response_cache import ResponseCache, ResponseCacheMiss, make_request_key
+
+MESSAGES = [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": "Hi"}]
+
+
+def set_last_use(cache, key, timestamp):
+    os.utime(cache._path(key), (timestamp, timestamp))
+
+
+def test_request_key_depends_on_the_whole_request():
+    key = make_request_key("openai", "gpt-4o", MESSAGES, {"seed": 1})
+    assert key == make_request_key("openai", "gpt-4o", MESSAGES, {"seed": 1})
+    assert key != make_request_key("openai", "gpt-4o", MESSAGES, {"seed": 2})
+    assert key != make_request_key("together", "gpt-4o", MESSAGES, {"seed": 1})
+    assert key != make_request_key("openai", "gpt-4o", MESSAGES[1:], {"seed": 1})
+
+
+def test_put_and_get(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    assert cache.get("ab12") is None
+    cache.put("ab12", "reply", model="gpt-4o")
+    assert cache.get("ab12") == "reply"
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_replay_raises_on_misses_and_does_not_write(tmp_path):
+    ResponseCache(str(tmp_path)).put("ab12", "reply")
+    replay = ResponseCache(str(tmp_path), replay=True)
+    assert replay.get("ab12") == "reply"
+    with pytest.raises(ResponseCacheMiss):
+        replay.get("cd34")
+    replay.put("cd34", "reply")
+    assert ResponseCache(str(tmp_path)).get("cd34") is None
+
+
+def test_overwriting_a_reply_does_not_grow_the_size(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10**6)
+    cache.put("ab12", "reply")
+    for _ in range(5):
+        cache.put("ab12", "reply")
+        # The size on disk varies by a byte or so with the timestamp of the entry
+        assert cache.size == cache._scan_size()
+
+
+def test_eviction_removes_the_least_recently_used_replies(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10**6)
+    keys = [f"{i:02d}key" for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.put(key, "x" * 100)
+        set_last_use(cache, key, 1000 + i)
+    # Reading a reply makes it the most recently used one
+    assert cache.get(keys[0]) == "x" * 100
+
+    entry_size = cache.size // 4
+    cache.max_bytes = 4 * entry_size
+    cache.put("04key", "x" * 100)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is None
+    assert [cache.get(key) for key in (keys[0], keys[3], "04key")] == ["x" * 100] * 3
+    assert cache.size == cache._scan_size() <= cache.max_bytes * 0.9
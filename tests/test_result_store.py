@@ -0,0 +1,66 @@
+import json
+
+from baselines.result_store import ResultStore, make_result_key
+
+
+def test_result_key_identifies_query_model_and_prompt():
+    key = make_result_key("q1", "gpt-4o", "react")
+    assert key == make_result_key("q1", "gpt-4o", "react")
+    assert len({key, make_result_key("q2", "gpt-4o", "react"), make_result_key("q1", "gpt-4o-mini", "react"),
+                make_result_key("q1", "gpt-4o", "cot")}) == 4
+
+
+def test_resume_skips_completed_queries(tmp_path):
+    path = tmp_path / "run.jsonl"
+    store = ResultStore(str(path))
+    store.append("a", {"query": "a", "status": "success"})
+    store.append("b", {"query": "b", "status": "error"})
+
+    # A new store on the same file (a resumed run) sees what the previous run wrote
+    resumed = ResultStore(str(path))
+    assert resumed.completed_keys() == {"a"}
+    assert len(path.read_text().splitlines()) == 2
+
+
+def test_truncated_last_line_is_skipped_and_terminated(tmp_path):
+    path = tmp_path / "run.jsonl"
+    store = ResultStore(str(path))
+    store.append("a", {"query": "a", "status": "success"})
+    with open(path, "a") as f:
+        f.write('{"key": "b", "status": "succ')
+
+    resumed = ResultStore(str(path))
+    resumed.append("c", {"query": "c", "status": "success"})
+    assert resumed.completed_keys() == {"a", "c"}
+    assert [entry["key"] for entry in resumed.iter_entries()] == ["a", "c"]
+
+
+def test_export_prefers_the_last_success(tmp_path):
+    store = ResultStore(str(tmp_path / "run.jsonl"))
+    store.append("a", {"query": "a", "status": "error", "attempt": 1})
+    store.append("a", {"query": "a", "status": "success", "attempt": 2})
+    store.append("a", {"query": "a", "status": "error", "attempt": 3})
+    store.append("b", {"query": "b", "status": "error", "attempt": 1})
+    store.append("b", {"query": "b", "status": "error", "attempt": 2})
+
+    records = {record["query"]: record["attempt"] for record in store.iter_records()}
+    assert records == {"a": 2, "b": 2}
+
+
+def test_export_follows_the_given_order(tmp_path):
+    store = ResultStore(str(tmp_path / "run.jsonl"))
+    for key in ["c", "a", "b"]:
+        store.append(key, {"query": key, "status": "success"})
+    output = tmp_path / "run.json"
+
+    assert store.export_json(str(output), order=["b", "a"]) == 3
+    assert [record["query"] for record in json.loads(output.read_text())] == ["b", "a", "c"]
+    assert store.export_json(str(output), order=["b", "a"], include_unlisted=False) == 2
+    assert [record["query"] for record in json.loads(output.read_text())] == ["b", "a"]
+
+
+def test_export_of_an_empty_store_is_an_empty_list(tmp_path):
+    store = ResultStore(str(tmp_path / "run.jsonl"))
+    output = tmp_path / "run.json"
+    assert store.export_json(str(output)) == 0
+    assert json.loads(output.read_text()) == []